@@ -0,0 +1,190 @@
+"""
+Batch battle simulation for Mini Clans
+Runs every layout against every deploy script across a process pool, streaming results to JSONL
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from config import FPS, OUTCOME_CACHE_FILE, SIMULATION_ENGINE
+from headless import HeadlessRunner, DEFAULT_MAX_TICKS
+from outcomes import OutcomeCache, canonical_layout, deploy_hash, layout_hash, outcome_key
+
+DEFAULT_CHUNK_SIZE = 16
+
+# Set once per worker by _init_worker, so tasks only carry index pairs
+_layouts = None
+_deploys = None
+_options = None
+
+
+def _init_worker(layouts, deploys, options):
+    global _layouts, _deploys, _options
+    _layouts = layouts
+    _deploys = deploys
+    _options = options
+
+
+def _run_chunk(pairs):
+    results = []
+    for layout_id, deploy_id in pairs:
+        runner = HeadlessRunner(_layouts[layout_id], dt=_options["dt"], engine=_options["engine"],
+                                troop_pool=_options["troop_pool"])
+        result = runner.run_attack(
+            _deploys[deploy_id],
+            max_ticks=_options["max_ticks"],
+            elixir=_options["elixir"]
+        )
+        result["layout"] = layout_id
+        result["deploys"] = deploy_id
+        results.append(result)
+    return results
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(layouts, deploys, output, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+              dt=1.0 / FPS, engine=SIMULATION_ENGINE, max_ticks=DEFAULT_MAX_TICKS, elixir=None,
+              troop_pool=False, cache=None):
+    """Simulate every (layout, deploy script) pair and append results to output.
+
+    layouts are Base.to_dict layouts and deploys are HeadlessRunner deploy
+    scripts. Both are shipped to each worker once; tasks are chunks of index
+    pairs, and at most two chunks per worker are in flight so memory stays
+    flat however many scenarios there are. Results are written as they finish,
+    tagged with their layout and deploy indices. With an OutcomeCache, pairs
+    it already holds are written straight away and only the rest simulated,
+    with every layout in canonical_layout order so results match the cache's.
+    """
+    workers = workers or os.cpu_count() or 1
+    if cache is not None:
+        layouts = [canonical_layout(layout) for layout in layouts]
+    options = {"dt": dt, "engine": engine, "max_ticks": max_ticks, "elixir": elixir,
+               "troop_pool": troop_pool}
+    pairs = itertools.product(range(len(layouts)), range(len(deploys)))
+    max_in_flight = workers * 2
+
+    count = 0
+    start = time.perf_counter()
+    with open(output, 'w') as out, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(layouts, deploys, options)
+    ) as pool:
+        keys = {}
+        if cache is not None:
+            layout_keys = [layout_hash(layout) for layout in layouts]
+            deploy_keys = [deploy_hash(script) for script in deploys]
+
+            def uncached(pairs):
+                nonlocal count
+                for layout_id, deploy_id in pairs:
+                    key = outcome_key(layout_keys[layout_id], deploy_keys[deploy_id],
+                                      dt, engine, max_ticks, elixir)
+                    result = cache.get(key)
+                    if result is None:
+                        keys[(layout_id, deploy_id)] = key
+                        yield layout_id, deploy_id
+                        continue
+                    result["layout"] = layout_id
+                    result["deploys"] = deploy_id
+                    out.write(json.dumps(result) + '\n')
+                    count += 1
+
+            pairs = uncached(pairs)
+        chunks = _chunks(pairs, chunk_size)
+        
+        pending = set()
+        for chunk in itertools.islice(chunks, max_in_flight):
+            pending.add(pool.submit(_run_chunk, chunk))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    out.write(json.dumps(result) + '\n')
+                    count += 1
+                    if cache is not None:
+                        key = keys.pop((result["layout"], result["deploys"]))
+                        cache.put(key, {k: v for k, v in result.items() if k not in ("layout", "deploys")})
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.add(pool.submit(_run_chunk, chunk))
+            out.flush()
+
+    wall_time = time.perf_counter() - start
+    summary = {
+        "scenarios": count,
+        "workers": workers,
+        "wall_time": wall_time,
+        "scenarios_per_second": count / wall_time if wall_time > 0 else float('inf')
+    }
+    if cache is not None:
+        cache.flush()
+        summary["cache"] = cache.stats()
+    return summary
+
+
+def _load_many(filenames, is_single):
+    """Read JSON files holding either one item or a list of them"""
+    items = []
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        if is_single(data):
+            items.append(data)
+        else:
+            items.extend(data)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many Mini Clans attacks in parallel")
+    parser.add_argument("--layouts", nargs="+", required=True,
+                        help="JSON files with a Base.to_dict layout or a list of them")
+    parser.add_argument("--deploys", nargs="+", required=True,
+                        help="JSON files with a deploy script or a list of them")
+    parser.add_argument("--out", default="batch_results.jsonl")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--dt", type=float, default=1.0 / FPS)
+    parser.add_argument("--engine", choices=("object", "vector"), default=SIMULATION_ENGINE)
+    parser.add_argument("--max-ticks", type=int, default=DEFAULT_MAX_TICKS)
+    parser.add_argument("--elixir", type=float, default=None)
+    parser.add_argument("--troop-pool", action="store_true")
+    parser.add_argument("--cache", nargs="?", const=OUTCOME_CACHE_FILE, default=None,
+                        help="outcome cache file; scenarios found in it are not simulated again")
+    args = parser.parse_args()
+
+    layouts = _load_many(args.layouts, lambda d: isinstance(d, dict))
+    deploys = _load_many(args.deploys, lambda d: not d or isinstance(d[0], dict))
+    cache = OutcomeCache(args.cache) if args.cache else None
+
+    summary = run_batch(
+        layouts, deploys, args.out,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        dt=args.dt,
+        engine=args.engine,
+        max_ticks=args.max_ticks,
+        elixir=args.elixir,
+        troop_pool=args.troop_pool,
+        cache=cache
+    )
+    if cache is not None:
+        cache.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,560 @@
+"""
+Benchmarks for Mini Clans
+Headless timing of simulation, rendering and networking hot paths, run with: python benchmarks.py --help
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from config import BUILDINGS, DEFAULT_PORT, GRID_HEIGHT, GRID_WIDTH, SCREEN_HEIGHT, SCREEN_WIDTH, TROOPS
+from game_state import GameState, Base, Building, Troop, TroopPool
+from headless import SimClock
+from protocol import StateSync, StreamDecoder, encode_binary, encode_json_line
+
+BASELINE_FILE = "benchmark_baseline.json"
+# Well clear of a game running on DEFAULT_PORT on the same machine
+BENCHMARK_PORT = DEFAULT_PORT + 100
+# How each result field is judged against the baseline: 1 if higher is better,
+# -1 if lower is. Every other field identifies which run a row belongs to.
+METRICS = {
+    "ticks_per_second": 1,
+    "ms_per_tick": -1,
+    "us_per_defense": -1,
+    "us_per_call": -1,
+    "ms_per_call": -1,
+    "buildings_per_second": 1,
+    "bytes": -1,
+    "encode_us": -1,
+    "decode_us": -1,
+    "messages_per_second": 1,
+    "bytes_per_second": 1,
+    "rtt_ms_mean": -1,
+    "rtt_ms_p95": -1,
+    "ms_per_frame": -1,
+    "bytes_per_entity": -1
+}
+
+
+class NaiveTroopScan:
+    """Reference defense targeting that scans every troop, for comparison"""
+
+    def __init__(self):
+        self.troops = []
+
+    def rebuild(self, troops):
+        self.troops = troops
+
+    def nearest_within(self, position, radius):
+        best = None
+        best_d2 = radius * radius
+        for troop in self.troops:
+            if troop.hp <= 0:
+                continue
+            dx = troop.position[0] - position[0]
+            dy = troop.position[1] - position[1]
+            d2 = dx * dx + dy * dy
+            if d2 < best_d2 or (d2 == best_d2 and best is None):
+                best_d2 = d2
+                best = troop
+        return best
+
+
+def make_defense_battle(defense_count, troop_count, map_size=100, seed=0):
+    rng = random.Random(seed)
+    gs = GameState()
+    base = gs.player_base
+    for _ in range(defense_count):
+        pos = (rng.randrange(map_size), rng.randrange(map_size))
+        base.add_building(Building("CANNON", pos))
+    for _ in range(troop_count):
+        troop = Troop("BARBARIAN", (rng.uniform(0, map_size), rng.uniform(0, map_size)))
+        troop.hp = float('inf')
+        gs.opponent_troops.append(troop)
+    return gs
+
+
+def fill_base(base, count, rng):
+    """Add count random non Town Hall buildings wherever they fit"""
+    types = [t for t in BUILDINGS if t != "TOWNHALL"]
+    placed = 0
+    while placed < count:
+        building_type = rng.choice(types)
+        pos = (rng.randrange(base.width - 1), rng.randrange(base.height - 1))
+        if base.can_place_building(pos, BUILDINGS[building_type]["size"]):
+            base.add_building(Building(building_type, pos))
+            placed += 1
+
+
+def make_battle(building_count, troop_count, engine="object", map_size=160, seed=0):
+    """A fresh battle on a SimClock: troops spread over the map attacking a random base"""
+    rng = random.Random(seed)
+    gs = GameState(engine, SimClock(), map_size, map_size)
+    fill_base(gs.opponent_base, building_count, rng)
+    troop_types = list(TROOPS)
+    for _ in range(troop_count):
+        gs.add_player_troop((rng.uniform(0, map_size), rng.uniform(0, map_size)), rng.choice(troop_types))
+    return gs
+
+
+def bench_ticks(troop_counts=(10, 100, 1000, 10000), building_counts=(10, 100, 1000),
+                engines=("object", "vector"), dt=1 / 30):
+    """GameState.update ticks per second across troop and building counts"""
+    results = []
+    for engine in engines:
+        for buildings in building_counts:
+            for troops in troop_counts:
+                gs = make_battle(buildings, troops, engine)
+                ticks = max(5, min(120, 20000 // troops))
+                # The first tick builds indexes and flow fields
+                gs.clock.advance(dt)
+                gs.update(dt)
+
+                start = time.perf_counter()
+                for _ in range(ticks):
+                    gs.clock.advance(dt)
+                    gs.update(dt)
+                elapsed = time.perf_counter() - start
+
+                results.append({
+                    "benchmark": "ticks",
+                    "engine": engine,
+                    "buildings": buildings,
+                    "troops": troops,
+                    "ticks_per_second": ticks / elapsed,
+                    "ms_per_tick": elapsed / ticks * 1000
+                })
+    return results
+
+
+def bench_queries(building_counts=(10, 100, 1000), calls=2000, map_size=160, seed=0):
+    """Troop.find_nearest_building, the indexed nearest lookup and Base.can_place_building"""
+    results = []
+    for buildings in building_counts:
+        rng = random.Random(seed)
+        base = Base(SimClock(), map_size, map_size)
+        fill_base(base, buildings, rng)
+        troops = [Troop("BARBARIAN", (rng.uniform(0, map_size), rng.uniform(0, map_size))) for _ in range(calls)]
+        spots = [((rng.randrange(map_size - 1), rng.randrange(map_size - 1)), rng.choice((2, 3)))
+                 for _ in range(calls)]
+
+        cases = (
+            ("find_nearest_building", lambda: [t.find_nearest_building(base.buildings) for t in troops]),
+            ("index_nearest", lambda: [base.index.nearest(t.position) for t in troops]),
+            ("can_place_building", lambda: [base.can_place_building(pos, size) for pos, size in spots])
+        )
+        for query, run in cases:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            results.append({
+                "benchmark": "queries",
+                "query": query,
+                "buildings": buildings,
+                "us_per_call": elapsed / calls * 1e6
+            })
+    return results
+
+
+def bench_serialization(building_counts=(10, 100, 1000), map_size=160, seed=0):
+    """Base.to_dict/from_dict and GameState.save_game/load_game throughput"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.sav")
+        for buildings in building_counts:
+            rng = random.Random(seed)
+            gs = GameState(clock=SimClock(), width=map_size, height=map_size)
+            fill_base(gs.player_base, buildings, rng)
+            fill_base(gs.opponent_base, buildings, rng)
+            data = gs.player_base.to_dict()
+            repeat = max(3, 2000 // buildings)
+
+            cases = (
+                ("to_dict", 1, lambda: gs.player_base.to_dict()),
+                ("from_dict", 1, lambda: Base.from_dict(data, gs.clock)),
+                ("save_game", 2, lambda: gs.save_game(filename)),
+                ("load_game", 2, lambda: gs.load_game(filename))
+            )
+            for operation, bases, run in cases:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    run()
+                per_call = (time.perf_counter() - start) / repeat
+                results.append({
+                    "benchmark": "serialization",
+                    "operation": operation,
+                    "buildings": buildings,
+                    "ms_per_call": per_call * 1000,
+                    "buildings_per_second": bases * (buildings + 1) / per_call
+                })
+    return results
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Loopback peer did not respond")
+        time.sleep(0)
+
+
+def bench_network(messages=5000, batch=20, pings=200, port=BENCHMARK_PORT):
+    """NetworkManager message rate and round-trip time over a loopback connection"""
+    from network import NetworkManager
+    from protocol import PROTOCOL_VERSION
+
+    msg = {"action": "deploy_troop", "position": [3, 11], "troop_type": "ARCHER"}
+    # NetworkManager reports connections on stdout; keep this output machine-readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        host = NetworkManager()
+        client = NetworkManager()
+        try:
+            host.start_host(port)
+            if not client.join_game("127.0.0.1", port):
+                raise ConnectionError(f"Could not connect to the loopback host on port {port}")
+            wait_for(host.check_connection)
+            wait_for(lambda: client.protocol == PROTOCOL_VERSION)
+
+            # One way, flushing every batch messages as the game does once a frame
+            received = 0
+            sent_bytes = client.stats["bytes_out"]
+            start = time.perf_counter()
+            for i in range(messages):
+                client.send_data(msg)
+                if i % batch == batch - 1:
+                    client.flush()
+                    received += len(host.receive_all())
+            client.flush()
+            while received < messages:
+                received += len(host.receive_all())
+                time.sleep(0)
+            elapsed = time.perf_counter() - start
+            sent_bytes = client.stats["bytes_out"] - sent_bytes
+
+            rtts = []
+            for _ in range(pings):
+                start = time.perf_counter()
+                client.send_data(msg)
+                client.flush()
+                wait_for(lambda: host.message_queue)
+                host.receive_all()
+                host.send_data(msg)
+                host.flush()
+                wait_for(lambda: client.message_queue)
+                client.receive_all()
+                rtts.append(time.perf_counter() - start)
+        finally:
+            client.close()
+            host.close()
+
+    rtts.sort()
+    return [
+        {
+            "benchmark": "network",
+            "test": "throughput",
+            "messages": messages,
+            "batch": batch,
+            "messages_per_second": messages / elapsed,
+            "bytes_per_second": sent_bytes / elapsed
+        },
+        {
+            "benchmark": "network",
+            "test": "round_trip",
+            "pings": pings,
+            "rtt_ms_mean": sum(rtts) / len(rtts) * 1000,
+            "rtt_ms_p95": rtts[int(len(rtts) * 0.95)] * 1000
+        }
+    ]
+
+
+def bench_defenses(defense_counts=(10, 100, 1000), troop_count=1000, ticks=120, dt=1 / 60):
+    """Time GameState.update_defenses with bucketed and naive troop lookup"""
+    results = []
+    for defenses in defense_counts:
+        for name, lookup in (("buckets", None), ("naive", NaiveTroopScan())):
+            gs = make_defense_battle(defenses, troop_count)
+            if lookup is not None:
+                gs.troop_buckets = lookup
+
+            start = time.perf_counter()
+            for _ in range(ticks):
+                gs.update_defenses(dt, gs.player_base, gs.opponent_troops)
+            elapsed = time.perf_counter() - start
+
+            per_tick = elapsed / ticks
+            results.append({
+                "benchmark": "defenses",
+                "lookup": name,
+                "defenses": defenses,
+                "troops": troop_count,
+                "ms_per_tick": per_tick * 1000,
+                "us_per_defense": per_tick / defenses * 1e6
+            })
+    return results
+
+
+def sample_messages(building_count=50, seed=0):
+    rng = random.Random(seed)
+    base = Base()
+    for i in range(building_count):
+        base.add_building(Building("CANNON", (rng.randrange(100), rng.randrange(100))))
+    sync = StateSync()
+    snapshot = sync.make_update(base)
+    for b in base.buildings[::5]:
+        b.take_damage(37.5)
+    delta = sync.make_update(base)
+
+    return {
+        "place_building": {"action": "place_building", "building": base.buildings[1].to_dict()},
+        "deploy_troop": {"action": "deploy_troop", "position": [3, 11], "troop_type": "ARCHER"},
+        "ready_to_attack": {"action": "ready_to_attack"},
+        "snapshot": snapshot,
+        "state_delta": delta
+    }
+
+
+def bench_protocol(repeat=2000):
+    """Bytes and encode/decode time per message for JSON lines and binary frames"""
+    results = []
+    for name, msg in sample_messages().items():
+        for encoding, encode in (("json_lines", encode_json_line), ("binary", encode_binary)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                data = encode(msg)
+            encode_time = (time.perf_counter() - start) / repeat
+
+            decoder = StreamDecoder()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                decoder.feed(data)
+            decode_time = (time.perf_counter() - start) / repeat
+
+            results.append({
+                "benchmark": "protocol",
+                "message": name,
+                "encoding": encoding,
+                "bytes": len(data),
+                "encode_us": encode_time * 1e6,
+                "decode_us": decode_time * 1e6
+            })
+    return results
+
+
+def make_render_state(building_count, troop_count, seed=0, side="opponent_base"):
+    rng = random.Random(seed)
+    gs = GameState()
+    base = getattr(gs, side)
+    for _ in range(building_count):
+        base.add_building(Building("GOLDMINE", (rng.randrange(GRID_WIDTH - 1), rng.randrange(GRID_HEIGHT - 1))))
+    for _ in range(troop_count):
+        troop = Troop(rng.choice(list(TROOPS)), (rng.uniform(0, GRID_WIDTH), rng.uniform(0, GRID_HEIGHT)))
+        gs.player_troops.append(troop)
+    return gs
+
+
+def bench_render(building_counts=(10, 100, 500), troop_counts=(0, 100, 1000), frames=60, dt=1 / 60):
+    """UI.draw_attack_mode and draw_build_mode frame time with full repaints versus dirty rects,
+    on SDL's dummy video driver"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from ui import UI
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    screens = (("attack", "opponent_base", troop_counts), ("build", "player_base", (0,)))
+    results = []
+    for name, side, troop_cases in screens:
+        for buildings in building_counts:
+            for troops in troop_cases:
+                for mode in ("full", "dirty"):
+                    gs = make_render_state(buildings, troops, side=side)
+                    ui = UI(screen)
+                    ui.renderer.always_full = mode == "full"
+                    draw = getattr(ui, f"draw_{name}_mode")
+                    draw(gs)
+
+                    elapsed = 0.0
+                    for _ in range(frames):
+                        gs.update(dt)
+                        start = time.perf_counter()
+                        dirty = draw(gs)
+                        if mode == "full":
+                            pygame.display.flip()
+                        else:
+                            pygame.display.update(dirty)
+                        elapsed += time.perf_counter() - start
+
+                    results.append({
+                        "benchmark": "render",
+                        "screen": name,
+                        "mode": mode,
+                        "buildings": buildings,
+                        "troops": troops,
+                        "ms_per_frame": elapsed / frames * 1000
+                    })
+    pygame.quit()
+    return results
+
+
+class LegacyTroop:
+    """The original troop layout, an instance __dict__ plus a private stats copy, for comparison"""
+
+    def __init__(self, troop_type, position):
+        self.type = troop_type
+        self.position = list(position)
+        self.stats = TROOPS[troop_type].copy()
+        self.hp = self.stats["hp"]
+        self.target = None
+
+
+class LegacyBuilding:
+    """The original building layout, an instance __dict__ plus a private stats copy, for comparison"""
+
+    def __init__(self, building_type, position, level=1):
+        self.type = building_type
+        self.position = position
+        self.level = level
+        self.hp = BUILDINGS[building_type]["hp"]
+        self.max_hp = self.hp
+        self.stats = BUILDINGS[building_type].copy()
+        self.cooldown = 0.0
+        self.owner = None
+
+
+def bytes_per_entity(make, count):
+    """Memory allocated per entity while building count of them, measured with tracemalloc"""
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    entities = [make(i) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - start - sys.getsizeof(entities)
+    tracemalloc.stop()
+    return used / count
+
+
+def bench_memory(count=10000, seed=0):
+    """Bytes per troop and building for the original, slotted and pooled representations"""
+    rng = random.Random(seed)
+    positions = [(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(count)]
+    tiles = [(rng.randrange(100), rng.randrange(100)) for _ in range(count)]
+    pool = TroopPool()
+    cases = (
+        ("troop", "legacy", lambda i: LegacyTroop("ARCHER", positions[i])),
+        ("troop", "slotted", lambda i: Troop("ARCHER", positions[i])),
+        ("troop", "pooled", lambda i: pool.spawn("ARCHER", positions[i])),
+        ("building", "legacy", lambda i: LegacyBuilding("CANNON", tiles[i])),
+        ("building", "slotted", lambda i: Building("CANNON", tiles[i]))
+    )
+    results = []
+    for entity, layout, make in cases:
+        results.append({
+            "benchmark": "memory",
+            "entity": entity,
+            "layout": layout,
+            "count": count,
+            "bytes_per_entity": bytes_per_entity(make, count)
+        })
+    return results
+
+
+BENCHMARKS = {
+    "ticks": bench_ticks,
+    "queries": bench_queries,
+    "serialization": bench_serialization,
+    "network": bench_network,
+    "defenses": bench_defenses,
+    "memory": bench_memory,
+    "protocol": bench_protocol,
+    "render": bench_render
+}
+
+
+def print_results(results):
+    for row in results:
+        print("  ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+
+
+def row_key(row):
+    """The fields naming what a row measured, so the same run can be found in a baseline"""
+    return tuple(sorted((k, v) for k, v in row.items() if k not in METRICS))
+
+
+def compare(results, baseline, tolerance):
+    """Rows of (key, metric, baseline, current, change) for every metric both runs have.
+
+    change is the relative improvement, negative when the current run is
+    worse; below -tolerance it counts as a regression.
+    """
+    previous = {row_key(row): row for row in baseline}
+    rows = []
+    for row in results:
+        old = previous.get(row_key(row))
+        if old is None:
+            continue
+        for metric, direction in METRICS.items():
+            if metric in row and old.get(metric):
+                change = direction * (row[metric] - old[metric]) / old[metric]
+                rows.append((row_key(row), metric, old[metric], row[metric], change))
+    return rows
+
+
+def print_comparison(rows, tolerance):
+    regressions = 0
+    for key, metric, old, new, change in rows:
+        flag = ""
+        if change < -tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        name = " ".join(f"{k}={v}" for k, v in key)
+        print(f"{name}  {metric}: {old:.3f} -> {new:.3f} ({change:+.1%}){flag}")
+    print(f"{len(rows)} metrics compared, {regressions} regressed by more than {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Mini Clans benchmarks with fixed seeds")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help=f"any of {', '.join(BENCHMARKS)}, all by default")
+    parser.add_argument("--json", default=None, help="write results to this file as JSON")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": []
+    }
+    for name in args.benchmarks or BENCHMARKS:
+        results = BENCHMARKS[name]()
+        print_results(results)
+        report["results"].extend(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        rows = compare(report["results"], baseline["results"], args.tolerance)
+        if print_comparison(rows, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
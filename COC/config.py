@@ -1,117 +1,186 @@
-"""
-Configuration file for Mini Clans
-Contains all game constants and settings
-"""
-
-
-SCREEN_WIDTH = 1200
-SCREEN_HEIGHT = 800
-FPS = 60
-
-
-GRID_SIZE = 20
-GRID_WIDTH = 15
-GRID_HEIGHT = 15
-GRID_OFFSET_X = 50
-GRID_OFFSET_Y = 50
-
-
-BACKGROUND_COLOR = (34, 139, 34)  
-GRID_COLOR = (100, 100, 100)
-GRID_HIGHLIGHT = (255, 255, 0)
-UI_BG_COLOR = (50, 50, 50)
-UI_TEXT_COLOR = (255, 255, 255)
-BUTTON_COLOR = (70, 130, 180)
-BUTTON_HOVER = (100, 160, 210)
-
-
-TOWN_HALL_COLOR = (184, 134, 11)
-GOLD_MINE_COLOR = (255, 215, 0)
-ELIXIR_COLLECTOR_COLOR = (255, 105, 180)
-DEFENSE_COLOR = (139, 0, 0)
-STORAGE_COLOR = (160, 82, 45)
-
-
-BARBARIAN_COLOR = (255, 140, 0)
-ARCHER_COLOR = (138, 43, 226)
-
-
-DEFAULT_HOST = "127.0.0.1"
-DEFAULT_PORT = 5555
-
-
-STARTING_GOLD = 1000
-STARTING_ELIXIR = 1000
-
-
-BUILDINGS = {
-    "TOWNHALL": {
-        "cost_gold": 0,
-        "cost_elixir": 0,
-        "hp": 2000,
-        "size": 3,
-        "color": TOWN_HALL_COLOR,
-        "max_level": 5
-    },
-    "GOLDMINE": {
-        "cost_gold": 100,
-        "cost_elixir": 0,
-        "hp": 500,
-        "size": 2,
-        "production_rate": 10,  
-        "color": GOLD_MINE_COLOR,
-        "max_level": 10
-    },
-    "ELIXIR": {
-        "cost_gold": 0,
-        "cost_elixir": 100,
-        "hp": 500,
-        "size": 2,
-        "production_rate": 10,
-        "color": ELIXIR_COLLECTOR_COLOR,
-        "max_level": 10
-    },
-    "CANNON": {
-        "cost_gold": 200,
-        "cost_elixir": 0,
-        "hp": 600,
-        "size": 2,
-        "damage": 20,
-        "range": 5,
-        "attack_speed": 1.0,
-        "color": DEFENSE_COLOR,
-        "max_level": 10
-    },
-    "STORAGE": {
-        "cost_gold": 150,
-        "cost_elixir": 150,
-        "hp": 800,
-        "size": 2,
-        "capacity": 5000,
-        "color": STORAGE_COLOR,
-        "max_level": 5
-    }
-}
-
-
-TROOPS = {
-    "BARBARIAN": {
-        "cost_elixir": 50,
-        "training_time": 5,
-        "hp": 100,
-        "damage": 15,
-        "speed": 2.0,
-        "range": 1,
-        "color": BARBARIAN_COLOR
-    },
-    "ARCHER": {
-        "cost_elixir": 75,
-        "training_time": 10,
-        "hp": 50,
-        "damage": 10,
-        "speed": 1.5,
-        "range": 4,
-        "color": ARCHER_COLOR
-    }
-
-}
+"""
+Configuration file for Mini Clans
+Contains all game constants and settings
+"""
+
+
+SCREEN_WIDTH = 1200
+SCREEN_HEIGHT = 800
+FPS = 60
+
+
+GRID_SIZE = 20
+GRID_WIDTH = 15
+GRID_HEIGHT = 15
+GRID_OFFSET_X = 50
+GRID_OFFSET_Y = 50
+CHUNK_SIZE = 32  # tiles per side of a world chunk; big maps only store and scan the chunks in use
+
+
+# Camera over the map area left of the side panel
+MAP_VIEW_RECT = (0, 0, 840, SCREEN_HEIGHT)
+MIN_ZOOM = 4  # pixels per tile
+MAX_ZOOM = 40
+CAMERA_PAN_SPEED = 600  # pixels per second
+
+
+BACKGROUND_COLOR = (34, 139, 34)  
+GRID_COLOR = (100, 100, 100)
+GRID_HIGHLIGHT = (255, 255, 0)
+UI_BG_COLOR = (50, 50, 50)
+UI_TEXT_COLOR = (255, 255, 255)
+BUTTON_COLOR = (70, 130, 180)
+BUTTON_HOVER = (100, 160, 210)
+
+
+TOWN_HALL_COLOR = (184, 134, 11)
+GOLD_MINE_COLOR = (255, 215, 0)
+ELIXIR_COLLECTOR_COLOR = (255, 105, 180)
+DEFENSE_COLOR = (139, 0, 0)
+STORAGE_COLOR = (160, 82, 45)
+
+
+BARBARIAN_COLOR = (255, 140, 0)
+ARCHER_COLOR = (138, 43, 226)
+
+
+# "object" steps each Troop in Python, "vector" uses the NumPy engine in vector_engine.py
+SIMULATION_ENGINE = "object"
+# "flow" walks troops around buildings using pathing.py, "direct" walks them straight at their target
+TROOP_PATHING = "flow"
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5555
+STATE_SYNC_INTERVAL = 1.0  # seconds between base state updates during an attack
+# "sync" applies the opponent's inputs on arrival and corrects with base snapshots,
+# "lockstep" runs both peers on the same fixed ticks from tick-stamped inputs (lockstep.py)
+MULTIPLAYER_MODE = "sync"
+LOCKSTEP_TICK_RATE = 30
+LOCKSTEP_INPUT_DELAY = 3  # ticks between an input and the tick it runs on
+LOCKSTEP_HASH_INTERVAL = 3  # ticks between state hash exchanges
+LOCKSTEP_MAX_CATCHUP = 5  # most ticks run in one frame after falling behind
+
+
+SERVER_TICK_RATE = 30
+SERVER_STATS_INTERVAL = 5.0
+
+
+AUTOSAVE_FILE = "autosave.sav"
+AUTOSAVE_INTERVAL = 30.0  # seconds
+AUTOSAVE_COMPACT_EVERY = 20  # incremental saves between full rewrites
+
+
+REPLAY_FILE = "last_match.replay"
+REPLAY_KEYFRAME_INTERVAL = 300  # ticks between snapshots kept for seeking
+
+
+# F3 toggles the profiler overlay, F4 writes the kept frames to PROFILER_DUMP_FILE
+PROFILER_HISTORY = 300  # frames
+PROFILER_OVERLAY_REFRESH = 30  # frames between overlay updates
+PROFILER_DUMP_FILE = "profile.csv"
+
+
+# planner.py scores each candidate troop wave by simulating it on a fork of the game
+PLANNER_BUDGET = 0.5  # seconds of search per plan
+PLANNER_HORIZON = 20.0  # simulated seconds per candidate
+PLANNER_DT = 0.1  # coarser than a frame so each candidate is cheap
+
+
+# optimizer.py evolves layouts for a gold/elixir budget, scoring each against reference attacks
+OPTIMIZER_POPULATION = 24
+OPTIMIZER_GENERATIONS = 20
+OPTIMIZER_DT = 0.1
+OPTIMIZER_BATTLE_TIME = 90.0  # simulated seconds before an attack is called off
+
+
+# outcomes.py caches attack results by layout and deploy hash
+OUTCOME_CACHE_FILE = "outcomes.sqlite"
+OUTCOME_CACHE_SIZE = 4096  # results kept in memory
+
+
+STARTING_GOLD = 1000
+STARTING_ELIXIR = 1000
+
+
+# Each level multiplies these level 1 stats again, so level n has stat * growth ** (n - 1)
+LEVEL_GROWTH = {
+    "hp": 1.2,
+    "damage": 1.1,
+    "production_rate": 1.15,
+    "capacity": 1.25
+}
+
+
+BUILDINGS = {
+    "TOWNHALL": {
+        "cost_gold": 0,
+        "cost_elixir": 0,
+        "hp": 2000,
+        "size": 3,
+        "capacity": 5000,
+        "color": TOWN_HALL_COLOR,
+        "max_level": 5
+    },
+    "GOLDMINE": {
+        "cost_gold": 100,
+        "cost_elixir": 0,
+        "hp": 500,
+        "size": 2,
+        "production_rate": 10,  
+        "color": GOLD_MINE_COLOR,
+        "max_level": 10
+    },
+    "ELIXIR": {
+        "cost_gold": 0,
+        "cost_elixir": 100,
+        "hp": 500,
+        "size": 2,
+        "production_rate": 10,
+        "color": ELIXIR_COLLECTOR_COLOR,
+        "max_level": 10
+    },
+    "CANNON": {
+        "cost_gold": 200,
+        "cost_elixir": 0,
+        "hp": 600,
+        "size": 2,
+        "damage": 20,
+        "range": 5,
+        "attack_speed": 1.0,
+        "color": DEFENSE_COLOR,
+        "max_level": 10
+    },
+    "STORAGE": {
+        "cost_gold": 150,
+        "cost_elixir": 150,
+        "hp": 800,
+        "size": 2,
+        "capacity": 5000,
+        "color": STORAGE_COLOR,
+        "max_level": 5
+    }
+}
+
+
+TROOPS = {
+    "BARBARIAN": {
+        "cost_elixir": 50,
+        "training_time": 5,
+        "hp": 100,
+        "damage": 15,
+        "speed": 2.0,
+        "range": 1,
+        "color": BARBARIAN_COLOR
+    },
+    "ARCHER": {
+        "cost_elixir": 75,
+        "training_time": 10,
+        "hp": 50,
+        "damage": 10,
+        "speed": 1.5,
+        "range": 4,
+        "color": ARCHER_COLOR
+    }
+
+}
@@ -1,244 +1,784 @@
-"""
-Game State Management
-Handles all game logic, buildings, troops, and resources
-"""
-
-import json
-import time
-from config import *
-
-class Building:
-    def __init__(self, building_type, position, level=1):
-        self.type = building_type
-        self.position = position  
-        self.level = level
-        self.hp = BUILDINGS[building_type]["hp"]
-        self.max_hp = self.hp
-        self.stats = BUILDINGS[building_type].copy()
-        
-    def to_dict(self):
-        return {
-            "type": self.type,
-            "position": self.position,
-            "level": self.level,
-            "hp": self.hp
-        }
-        
-    @staticmethod
-    def from_dict(data):
-        b = Building(data["type"], tuple(data["position"]), data["level"])
-        b.hp = data["hp"]
-        return b
-        
-    def upgrade(self):
-        if self.level < self.stats["max_level"]:
-            self.level += 1
-            self.max_hp = int(self.hp * 1.2)
-            self.hp = self.max_hp
-            return True
-        return False
-        
-    def take_damage(self, damage):
-        self.hp -= damage
-        return self.hp <= 0
-
-class Troop:
-    def __init__(self, troop_type, position):
-        self.type = troop_type
-        self.position = list(position) 
-        self.stats = TROOPS[troop_type].copy()
-        self.hp = self.stats["hp"]
-        self.target = None
-        
-    def update(self, dt, buildings):
-        if not self.target or self.target.hp <= 0:
-          
-            self.target = self.find_nearest_building(buildings)
-            
-        if self.target:
-            
-            dx = self.target.position[0] - self.position[0]
-            dy = self.target.position[1] - self.position[1]
-            dist = (dx**2 + dy**2)**0.5
-            
-            if dist <= self.stats["range"]:
-                
-                self.attack(self.target, dt)
-            else:
-                
-                if dist > 0:
-                    self.position[0] += (dx / dist) * self.stats["speed"] * dt
-                    self.position[1] += (dy / dist) * self.stats["speed"] * dt
-                    
-    def find_nearest_building(self, buildings):
-        nearest = None
-        min_dist = float('inf')
-        for building in buildings:
-            if building.hp > 0:
-                dx = building.position[0] - self.position[0]
-                dy = building.position[1] - self.position[1]
-                dist = (dx**2 + dy**2)**0.5
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest = building
-        return nearest
-        
-    def attack(self, target, dt):
-        
-        target.take_damage(self.stats["damage"] * dt)
-        
-    def take_damage(self, damage):
-        self.hp -= damage
-        return self.hp <= 0
-
-class Base:
-    def __init__(self):
-        self.buildings = []
-        self.gold = STARTING_GOLD
-        self.elixir = STARTING_ELIXIR
-        self.last_resource_update = time.time()
-        
-        
-        self.add_building(Building("TOWNHALL", (7, 7)))
-        
-    def add_building(self, building):
-        self.buildings.append(building)
-        
-    def add_building_from_dict(self, data):
-        self.buildings.append(Building.from_dict(data))
-        
-    def update_resources(self):
-        current_time = time.time()
-        dt = current_time - self.last_resource_update
-        self.last_resource_update = current_time
-        
-        
-        for building in self.buildings:
-            if building.type == "GOLDMINE" and building.hp > 0:
-                self.gold += building.stats["production_rate"] * dt
-            elif building.type == "ELIXIR" and building.hp > 0:
-                self.elixir += building.stats["production_rate"] * dt
-                
-    def can_afford_building(self, building_type):
-        cost_gold = BUILDINGS[building_type]["cost_gold"]
-        cost_elixir = BUILDINGS[building_type]["cost_elixir"]
-        return self.gold >= cost_gold and self.elixir >= cost_elixir
-        
-    def purchase_building(self, building_type):
-        if self.can_afford_building(building_type):
-            self.gold -= BUILDINGS[building_type]["cost_gold"]
-            self.elixir -= BUILDINGS[building_type]["cost_elixir"]
-            return True
-        return False
-        
-    def can_place_building(self, position, size):
-        
-        if position[0] < 0 or position[0] + size > GRID_WIDTH:
-            return False
-        if position[1] < 0 or position[1] + size > GRID_HEIGHT:
-            return False
-            
-        
-        for building in self.buildings:
-            b_size = building.stats["size"]
-            if self.rectangles_overlap(
-                position, size,
-                building.position, b_size
-            ):
-                return False
-        return True
-        
-    @staticmethod
-    def rectangles_overlap(pos1, size1, pos2, size2):
-        return not (pos1[0] + size1 <= pos2[0] or
-                    pos2[0] + size2 <= pos1[0] or
-                    pos1[1] + size1 <= pos2[1] or
-                    pos2[1] + size2 <= pos1[1])
-                    
-    def to_dict(self):
-        return {
-            "buildings": [b.to_dict() for b in self.buildings],
-            "gold": self.gold,
-            "elixir": self.elixir
-        }
-        
-    @staticmethod
-    def from_dict(data):
-        base = Base()
-        base.buildings = [Building.from_dict(b) for b in data["buildings"]]
-        base.gold = data["gold"]
-        base.elixir = data["elixir"]
-        return base
-
-class GameState:
-    def __init__(self):
-        self.player_base = Base()
-        self.opponent_base = Base()
-        self.player_troops = []
-        self.opponent_troops = []
-        
-        self.placing_building = None
-        self.selected_troop = "BARBARIAN"
-        
-    def start_placing_building(self, building_type):
-        if self.player_base.can_afford_building(building_type):
-            self.placing_building = building_type
-            
-    def place_building(self, position):
-        if self.placing_building:
-            size = BUILDINGS[self.placing_building]["size"]
-            if self.player_base.can_place_building(position, size):
-                if self.player_base.purchase_building(self.placing_building):
-                    building = Building(self.placing_building, position)
-                    self.player_base.add_building(building)
-                    self.placing_building = None
-                    return True
-        return False
-        
-    def deploy_troop(self, position):
-        if self.player_base.elixir >= TROOPS[self.selected_troop]["cost_elixir"]:
-            self.player_base.elixir -= TROOPS[self.selected_troop]["cost_elixir"]
-            troop = Troop(self.selected_troop, position)
-            self.player_troops.append(troop)
-            return True
-        return False
-        
-    def add_opponent_troop(self, position, troop_type):
-        troop = Troop(troop_type, position)
-        self.opponent_troops.append(troop)
-        
-    def update(self, dt):
-        
-        self.player_base.update_resources()
-        self.opponent_base.update_resources()
-        
-        
-        for troop in self.player_troops[:]:
-            troop.update(dt, self.opponent_base.buildings)
-            if troop.hp <= 0:
-                self.player_troops.remove(troop)
-                
-        
-        for troop in self.opponent_troops[:]:
-            troop.update(dt, self.player_base.buildings)
-            if troop.hp <= 0:
-                self.opponent_troops.remove(troop)
-                
-    def save_game(self, filename="savegame.json"):
-        data = {
-            "player_base": self.player_base.to_dict(),
-            "opponent_base": self.opponent_base.to_dict()
-        }
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-            
-    def load_game(self, filename="savegame.json"):
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            self.player_base = Base.from_dict(data["player_base"])
-            self.opponent_base = Base.from_dict(data["opponent_base"])
-            return True
-        except FileNotFoundError:
-
-            return False
+"""
+Game State Management
+Handles all game logic, buildings, troops, and resources
+"""
+
+import math
+import time
+from array import array
+from types import MappingProxyType
+from config import *
+from pathing import FlowFields
+from savefile import capture, load_state, write_checkpoint
+from spatial import BuildingGrid, ChunkMap, OccupancyGrid, TroopBuckets
+
+MAX_BUILDING_SIZE = max(stats["size"] for stats in BUILDINGS.values())
+
+# How far from its anchor tile a defense can hit, and so how many chunks
+# around a troop hold defenses that might target it
+DEFENSE_REACH = max((stats["range"] + stats["size"] for stats in BUILDINGS.values()
+                     if "damage" in stats), default=0)
+DEFENSE_CHUNK_REACH = int(DEFENSE_REACH // CHUNK_SIZE) + 1
+
+def level_table(stats):
+    """Read-only stats for every level up to max_level, scaling the LEVEL_GROWTH stats"""
+    table = {}
+    for level in range(1, stats["max_level"] + 1):
+        row = dict(stats)
+        for key, growth in LEVEL_GROWTH.items():
+            if key in stats:
+                value = stats[key] * growth ** (level - 1)
+                row[key] = round(value) if isinstance(stats[key], int) else round(value, 2)
+        table[level] = MappingProxyType(row)
+    return table
+
+# Read-only stats shared by every instance of a type (and level) instead of a dict copy each.
+# Built once at import, so every process derives the same tables without shipping them around.
+BUILDING_LEVELS = {name: level_table(stats) for name, stats in BUILDINGS.items()}
+TROOP_STATS = {name: MappingProxyType(dict(stats)) for name, stats in TROOPS.items()}
+
+# Which stored resource each producer type adds to
+PRODUCES = {"GOLDMINE": "gold", "ELIXIR": "elixir"}
+
+class Building:
+    __slots__ = ("type", "position", "level", "hp", "max_hp", "stats", "cooldown", "owner")
+    
+    def __init__(self, building_type, position, level=1):
+        self.type = building_type
+        self.position = position  
+        self.level = level
+        self.stats = BUILDING_LEVELS[building_type][level]
+        self.hp = self.stats["hp"]
+        self.max_hp = self.hp
+        self.cooldown = 0.0
+        self.owner = None
+        
+    def is_defense(self):
+        return "damage" in self.stats
+        
+    def center(self):
+        half = self.stats["size"] / 2
+        return (self.position[0] + half, self.position[1] + half)
+        
+    def to_dict(self):
+        """Type, position and level; hp only when damaged since everything else comes from the level"""
+        data = {
+            "type": self.type,
+            "position": self.position,
+            "level": self.level
+        }
+        if self.hp != self.max_hp:
+            data["hp"] = self.hp
+        return data
+        
+    @staticmethod
+    def from_dict(data):
+        b = Building(data["type"], tuple(data["position"]), data.get("level", 1))
+        b.hp = data.get("hp", b.max_hp)
+        return b
+        
+    def copy(self):
+        """Same type, position, level, hp and cooldown, owned by nothing; the stats table is shared"""
+        b = Building.__new__(Building)
+        b.type = self.type
+        b.position = self.position
+        b.level = self.level
+        b.stats = self.stats
+        b.hp = self.hp
+        b.max_hp = self.max_hp
+        b.cooldown = self.cooldown
+        b.owner = None
+        return b
+        
+    def upgrade(self):
+        """Move to the next level's stats at full hp, whatever the damage was"""
+        if self.level < self.stats["max_level"]:
+            zobrist = self.owner.zobrist if self.owner is not None else None
+            if zobrist is not None:
+                zobrist.remove(self)
+            self.level += 1
+            self.stats = BUILDING_LEVELS[self.type][self.level]
+            self.max_hp = self.stats["hp"]
+            if zobrist is not None:
+                zobrist.add(self)
+            self.set_hp(self.max_hp)
+            if self.owner is not None:
+                self.owner.update_economy(self)
+            return True
+        return False
+        
+    def set_hp(self, hp):
+        """Change hp, telling the owning base when the building is destroyed or restored"""
+        old = self.hp
+        self.hp = hp
+        owner = self.owner
+        if owner is not None:
+            if owner.zobrist is not None:
+                owner.zobrist.change(self, old)
+            if (old > 0) != (hp > 0):
+                owner.building_alive_changed(self)
+        
+    def take_damage(self, damage):
+        self.set_hp(self.hp - damage)
+        return self.hp <= 0
+        
+    def update_defense(self, dt, troop_buckets):
+        """Fire at the nearest troop in range once the attack_speed cooldown has elapsed"""
+        if self.hp <= 0:
+            return None
+        self.cooldown -= dt
+        if self.cooldown > 0:
+            return None
+            
+        target = troop_buckets.nearest_within(self.center(), self.stats["range"])
+        if target is None:
+            self.cooldown = 0.0
+            return None
+            
+        target.take_damage(self.stats["damage"])
+        self.cooldown += self.stats["attack_speed"]
+        return target
+
+class Troop:
+    __slots__ = ("type", "position", "stats", "hp", "target")
+    
+    def __init__(self, troop_type, position):
+        self.type = troop_type
+        self.position = list(position) 
+        self.stats = TROOP_STATS[troop_type]
+        self.hp = self.stats["hp"]
+        self.target = None
+        
+    def update(self, dt, buildings, index=None, paths=None):
+        if not self.target or self.target.hp <= 0:
+          
+            if index is not None:
+                self.target = index.nearest(self.position)
+            else:
+                self.target = self.find_nearest_building(buildings)
+            
+        if self.target:
+            
+            dx = self.target.position[0] - self.position[0]
+            dy = self.target.position[1] - self.position[1]
+            dist = math.sqrt(dx * dx + dy * dy)
+            
+            if dist <= self.stats["range"]:
+                
+                self.attack(self.target, dt)
+            else:
+                
+                if paths is not None:
+                    waypoint = paths.waypoint(self.target, self.position)
+                    if waypoint is not None:
+                        dx = waypoint[0] - self.position[0]
+                        dy = waypoint[1] - self.position[1]
+                        dist = math.sqrt(dx * dx + dy * dy)
+                        
+                if dist > 0:
+                    self.position[0] += (dx / dist) * self.stats["speed"] * dt
+                    self.position[1] += (dy / dist) * self.stats["speed"] * dt
+                    
+    def find_nearest_building(self, buildings):
+        nearest = None
+        min_dist = float('inf')
+        for building in buildings:
+            if building.hp > 0:
+                dx = building.position[0] - self.position[0]
+                dy = building.position[1] - self.position[1]
+                dist = (dx**2 + dy**2)**0.5
+                if dist < min_dist:
+                    min_dist = dist
+                    nearest = building
+        return nearest
+        
+    def attack(self, target, dt):
+        
+        target.take_damage(self.stats["damage"] * dt)
+        
+    def take_damage(self, damage):
+        self.hp -= damage
+        return self.hp <= 0
+
+class TroopPool:
+    """Struct-of-arrays troop storage: one array per field instead of one object per troop.
+    
+    spawn() hands out PooledTroop handles that read and write these arrays
+    and stand in for Troop anywhere troops are used. A slot is reused once
+    its handle is no longer referenced. Attribute access goes through the
+    handle, so this trades some speed for memory in very large simulations.
+    """
+    
+    def __init__(self):
+        self.types = []
+        self.x = array('d')
+        self.y = array('d')
+        self.hp = array('d')
+        self.targets = []
+        self.free = []
+        
+    def __len__(self):
+        return len(self.types) - len(self.free)
+        
+    def spawn(self, troop_type, position):
+        hp = TROOP_STATS[troop_type]["hp"]
+        if self.free:
+            i = self.free.pop()
+            self.types[i] = troop_type
+            self.x[i] = position[0]
+            self.y[i] = position[1]
+            self.hp[i] = hp
+        else:
+            i = len(self.types)
+            self.types.append(troop_type)
+            self.x.append(position[0])
+            self.y.append(position[1])
+            self.hp.append(hp)
+            self.targets.append(None)
+        return PooledTroop(self, i)
+        
+    def release(self, index):
+        self.targets[index] = None
+        self.free.append(index)
+
+class PoolPosition:
+    """Mutable [x, y] view of one pooled troop's position"""
+    __slots__ = ("pool", "index")
+    
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        
+    def __len__(self):
+        return 2
+        
+    def __getitem__(self, i):
+        if i == 0:
+            return self.pool.x[self.index]
+        if i == 1:
+            return self.pool.y[self.index]
+        raise IndexError(i)
+        
+    def __setitem__(self, i, value):
+        if i == 0:
+            self.pool.x[self.index] = value
+        elif i == 1:
+            self.pool.y[self.index] = value
+        else:
+            raise IndexError(i)
+            
+    def __iter__(self):
+        yield self.pool.x[self.index]
+        yield self.pool.y[self.index]
+
+class PooledTroop:
+    """Handle to one troop stored in a TroopPool, with Troop's behaviour"""
+    __slots__ = ("pool", "index")
+    
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        
+    def __del__(self):
+        self.pool.release(self.index)
+        
+    update = Troop.update
+    find_nearest_building = Troop.find_nearest_building
+    attack = Troop.attack
+    take_damage = Troop.take_damage
+    
+    @property
+    def type(self):
+        return self.pool.types[self.index]
+        
+    @property
+    def stats(self):
+        return TROOP_STATS[self.pool.types[self.index]]
+        
+    @property
+    def position(self):
+        return PoolPosition(self.pool, self.index)
+        
+    @position.setter
+    def position(self, value):
+        self.pool.x[self.index] = value[0]
+        self.pool.y[self.index] = value[1]
+        
+    @property
+    def hp(self):
+        return self.pool.hp[self.index]
+        
+    @hp.setter
+    def hp(self, value):
+        self.pool.hp[self.index] = value
+        
+    @property
+    def target(self):
+        return self.pool.targets[self.index]
+        
+    @target.setter
+    def target(self, value):
+        self.pool.targets[self.index] = value
+
+class Base:
+    def __init__(self, clock=time.time, width=GRID_WIDTH, height=GRID_HEIGHT, town_hall=True):
+        self.width = width
+        self.height = height
+        self.buildings = []
+        self.clock = clock
+        self.last_resource_update = clock()
+        self._gold = STARTING_GOLD
+        self._elixir = STARTING_ELIXIR
+        self.gold_rate = 0
+        self.elixir_rate = 0
+        self.capacity = 0
+        self.economy = {}
+        self.index = BuildingGrid()
+        self.occupancy = OccupancyGrid(width, height)
+        self.chunks = ChunkMap()
+        self.defenses = []
+        self.defense_chunks = ChunkMap()
+        self.cooling = {}
+        self.chunked = width > CHUNK_SIZE or height > CHUNK_SIZE
+        self.revision = 0
+        self.paths = FlowFields(self)
+        # A lockstep.BaseHash while this base is part of a lockstep game
+        self.zobrist = None
+        
+        if town_hall:
+            self.add_building(Building("TOWNHALL", (width // 2, height // 2)))
+        
+    def add_building(self, building):
+        self.buildings.append(building)
+        building.owner = self
+        self.update_economy(building)
+        # Destroyed buildings still take their place in the tie-break order
+        if building.hp > 0:
+            self.index.insert(building)
+        else:
+            self.index.reserve(building)
+        self.occupancy.add(building.position, building.stats["size"])
+        self.chunks.insert(building, building.position)
+        if building.is_defense():
+            self.defenses.append(building)
+            self.defense_chunks.insert(building, building.position)
+        if self.zobrist is not None:
+            self.zobrist.add(building)
+        self.revision += 1
+        
+    def add_building_from_dict(self, data):
+        self.add_building(Building.from_dict(data))
+        
+    def remove_building(self, building):
+        self.buildings.remove(building)
+        building.owner = None
+        self.update_economy(building)
+        self.index.forget(building)
+        self.occupancy.remove(building.position, building.stats["size"])
+        self.chunks.remove(building, building.position)
+        if building in self.defenses:
+            self.defenses.remove(building)
+            self.defense_chunks.remove(building, building.position)
+            self.cooling.pop(id(building), None)
+        if self.zobrist is not None:
+            self.zobrist.remove(building)
+        self.revision += 1
+        
+    def set_buildings(self, buildings):
+        """Replace every building and rebuild the spatial index"""
+        for building in self.buildings:
+            building.owner = None
+            self.update_economy(building)
+        self.buildings = []
+        self.index.clear()
+        self.occupancy.clear()
+        self.chunks.clear()
+        self.defenses = []
+        self.defense_chunks.clear()
+        self.cooling = {}
+        if self.zobrist is not None:
+            self.zobrist.clear()
+        self.revision += 1
+        for building in buildings:
+            self.add_building(building)
+        
+    def buildings_in_area(self, x0, y0, x1, y1):
+        """Buildings that may overlap tiles x0 <= x < x1, y0 <= y < y1, in list order"""
+        return self.chunks.in_area(x0 - MAX_BUILDING_SIZE + 1, y0 - MAX_BUILDING_SIZE + 1, x1, y1)
+        
+    def active_defenses(self, troops):
+        """Defenses that can do anything this tick, in list order.
+        
+        On a single-chunk map that is all of them. On larger maps it is the
+        ones anchored in chunks near a troop plus any still cooling down; the
+        rest are idle with a zero cooldown and would find no target, so
+        skipping them changes nothing.
+        """
+        if not self.chunked:
+            return self.defenses
+        reach = range(-DEFENSE_CHUNK_REACH, DEFENSE_CHUNK_REACH + 1)
+        troop_chunks = {self.defense_chunks.chunk_of(troop.position) for troop in troops}
+        keys = {(cx + dx, cy + dy) for cx, cy in troop_chunks for dx in reach for dy in reach}
+        return self.defense_chunks.in_chunks(keys, self.cooling.values())
+        
+    def track_cooldowns(self, defenses):
+        """Remember which of these defenses are cooling down for active_defenses"""
+        if not self.chunked:
+            return
+        for defense in defenses:
+            if defense.cooldown and defense.hp > 0:
+                self.cooling[id(defense)] = defense
+            else:
+                self.cooling.pop(id(defense), None)
+        
+    def building_alive_changed(self, building):
+        """A building was destroyed or restored: its tiles change walkability and its economy share changes.
+        
+        Destroyed buildings leave the target index lazily; restored ones go
+        back in straight away.
+        """
+        if building.hp > 0:
+            self.index.remove(building)
+            self.index.insert(building)
+        self.paths.invalidate(building)
+        self.update_economy(building)
+        
+    def update_economy(self, building):
+        """Bring one building's share of the production rates and storage capacity up to date.
+        
+        Called whenever a building is added, removed, upgraded, destroyed or
+        restored. Only producers and storage take part, and resources are
+        settled at the old rates first, so nothing else ever walks the
+        buildings list for resources.
+        """
+        contribution = None
+        if building.owner is self and building.hp > 0:
+            stats = building.stats
+            resource = PRODUCES.get(building.type)
+            rate = stats.get("production_rate", 0)
+            contribution = (rate if resource == "gold" else 0,
+                            rate if resource == "elixir" else 0,
+                            stats.get("capacity", 0))
+            if contribution == (0, 0, 0):
+                contribution = None
+        old = self.economy.pop(id(building), None)
+        if contribution is not None:
+            self.economy[id(building)] = contribution
+        if old == contribution:
+            return
+        
+        self.update_resources()
+        for sign, change in ((-1, old), (1, contribution)):
+            if change is not None:
+                self.gold_rate += sign * change[0]
+                self.elixir_rate += sign * change[1]
+                self.capacity += sign * change[2]
+            
+    def _produced(self, stored, rate, now):
+        """stored plus production since the last settle, filling up to capacity but never draining"""
+        if stored >= self.capacity:
+            return stored
+        return min(self.capacity, stored + rate * (now - self.last_resource_update))
+        
+    def update_resources(self):
+        """Fold production since the last call into the stored amounts, O(1)"""
+        now = self.clock()
+        self._gold = self._produced(self._gold, self.gold_rate, now)
+        self._elixir = self._produced(self._elixir, self.elixir_rate, now)
+        self.last_resource_update = now
+        
+    def set_clock(self, clock):
+        """Switch to another clock, keeping what was produced up to now on the old one"""
+        self.update_resources()
+        self.clock = clock
+        self.last_resource_update = clock()
+        
+    @property
+    def gold(self):
+        return self._produced(self._gold, self.gold_rate, self.clock())
+        
+    @gold.setter
+    def gold(self, value):
+        self.update_resources()
+        self._gold = value
+        
+    @property
+    def elixir(self):
+        return self._produced(self._elixir, self.elixir_rate, self.clock())
+        
+    @elixir.setter
+    def elixir(self, value):
+        self.update_resources()
+        self._elixir = value
+                
+    def destruction_percent(self):
+        if not self.buildings:
+            return 0.0
+        destroyed = sum(1 for b in self.buildings if b.hp <= 0)
+        return 100.0 * destroyed / len(self.buildings)
+        
+    def town_hall_destroyed(self):
+        return any(b.type == "TOWNHALL" and b.hp <= 0 for b in self.buildings)
+        
+    def can_afford_building(self, building_type):
+        cost_gold = BUILDINGS[building_type]["cost_gold"]
+        cost_elixir = BUILDINGS[building_type]["cost_elixir"]
+        return self.gold >= cost_gold and self.elixir >= cost_elixir
+        
+    def purchase_building(self, building_type):
+        if self.can_afford_building(building_type):
+            self.gold -= BUILDINGS[building_type]["cost_gold"]
+            self.elixir -= BUILDINGS[building_type]["cost_elixir"]
+            return True
+        return False
+        
+    def can_place_building(self, position, size):
+        return self.occupancy.is_free(position, size)
+        
+    def valid_placements(self, size, area=None):
+        """Every anchor where a building of this size could be placed, optionally within area"""
+        return self.occupancy.valid_anchors(size, area)
+        
+    @staticmethod
+    def rectangles_overlap(pos1, size1, pos2, size2):
+        return not (pos1[0] + size1 <= pos2[0] or
+                    pos2[0] + size2 <= pos1[0] or
+                    pos1[1] + size1 <= pos2[1] or
+                    pos2[1] + size2 <= pos1[1])
+                    
+    def to_dict(self):
+        return {
+            "buildings": [b.to_dict() for b in self.buildings],
+            "gold": self.gold,
+            "elixir": self.elixir,
+            "width": self.width,
+            "height": self.height
+        }
+        
+    def fork(self, clock=None):
+        """An independent copy of this base to simulate ahead on, see _fork"""
+        return self._fork(clock)[0]
+        
+    def _fork(self, clock=None):
+        """Copy this base without rebuilding anything, returns the copy and the building copies.
+        
+        Buildings are cheap slotted copies sharing their stats tables, and the
+        spatial indexes are remapped onto them instead of being rebuilt. The
+        occupancy grid and the flow fields built so far are shared until
+        either side changes them. The copy starts with the gold and elixir
+        this base has now and produces on clock from there, without reading
+        the clock for anything else. The second value maps id(building) to
+        its copy, for remapping references such as troop targets.
+        """
+        clock = self.clock if clock is None else clock
+        copies = {}
+        base = Base.__new__(Base)
+        for building in self.buildings:
+            copy = building.copy()
+            copy.owner = base
+            copies[id(building)] = copy
+        base.width = self.width
+        base.height = self.height
+        base.buildings = [copies[id(b)] for b in self.buildings]
+        base.clock = clock
+        base._gold = self.gold
+        base._elixir = self.elixir
+        base.last_resource_update = clock()
+        base.gold_rate = self.gold_rate
+        base.elixir_rate = self.elixir_rate
+        base.capacity = self.capacity
+        base.economy = {id(copies[key]): share for key, share in self.economy.items()}
+        base.index = self.index.clone(copies)
+        base.occupancy = self.occupancy.fork()
+        base.chunks = self.chunks.clone(copies)
+        base.defenses = [copies[id(d)] for d in self.defenses]
+        base.defense_chunks = self.defense_chunks.clone(copies)
+        base.cooling = {id(copies[key]): copies[key] for key in self.cooling}
+        base.chunked = self.chunked
+        base.revision = self.revision
+        base.paths = self.paths.fork(base, copies)
+        base.zobrist = None
+        return base, copies
+        
+    @staticmethod
+    def from_dict(data, clock=time.time):
+        base = Base(clock, data.get("width", GRID_WIDTH), data.get("height", GRID_HEIGHT), town_hall=False)
+        base.set_buildings([Building.from_dict(b) for b in data["buildings"]])
+        base.gold = data["gold"]
+        base.elixir = data["elixir"]
+        return base
+
+class GameState:
+    def __init__(self, engine=SIMULATION_ENGINE, clock=time.time, width=GRID_WIDTH, height=GRID_HEIGHT,
+                 troop_pool=False, bases=None):
+        self.clock = clock
+        self.troop_pool = TroopPool() if troop_pool else None
+        if bases is None:
+            bases = (Base(clock, width, height), Base(clock, width, height))
+        self.player_base, self.opponent_base = bases
+        self.player_troops = []
+        self.opponent_troops = []
+        
+        self.placing_building = None
+        self.selected_troop = "BARBARIAN"
+        self.troop_buckets = TroopBuckets()
+        
+        self.profiler = None
+        
+        self.engine = engine
+        self.simulation = None
+        if engine == "vector":
+            from vector_engine import VectorEngine
+            self.simulation = VectorEngine(self)
+        elif engine != "object":
+            raise ValueError(f"Unknown simulation engine: {engine}")
+        
+    def fork(self, clock=None):
+        """An independent GameState continuing from this one, for simulating ahead.
+        
+        Both bases are forked with Base.fork and the troops are copied with
+        their hp and targets, so stepping the fork with the object engine
+        plays out exactly as stepping this state would while leaving it
+        untouched. The vector engine picks fresh targets for copied troops.
+        """
+        clock = self.clock if clock is None else clock
+        player_base, player_copies = self.player_base._fork(clock)
+        opponent_base, opponent_copies = self.opponent_base._fork(clock)
+        gs = GameState(self.engine, clock, troop_pool=self.troop_pool is not None,
+                       bases=(player_base, opponent_base))
+        gs.placing_building = self.placing_building
+        gs.selected_troop = self.selected_troop
+        for troops, forked, targets, is_player in (
+                (self.player_troops, gs.player_troops, opponent_copies, True),
+                (self.opponent_troops, gs.opponent_troops, player_copies, False)):
+            for troop in troops:
+                copy = gs.new_troop(troop.type, troop.position)
+                copy.hp = troop.hp
+                if troop.target is not None:
+                    copy.target = targets.get(id(troop.target))
+                forked.append(copy)
+                if gs.simulation:
+                    gs.simulation.add_troop(copy, is_player)
+        return gs
+        
+    def start_placing_building(self, building_type):
+        if self.player_base.can_afford_building(building_type):
+            self.placing_building = building_type
+            
+    def place_building(self, position):
+        if self.placing_building:
+            size = BUILDINGS[self.placing_building]["size"]
+            if self.player_base.can_place_building(position, size):
+                if self.player_base.purchase_building(self.placing_building):
+                    building = Building(self.placing_building, position)
+                    self.player_base.add_building(building)
+                    self.placing_building = None
+                    return True
+        return False
+        
+    def deploy_troop(self, position):
+        if self.player_base.elixir >= TROOPS[self.selected_troop]["cost_elixir"]:
+            self.player_base.elixir -= TROOPS[self.selected_troop]["cost_elixir"]
+            troop = self.new_troop(self.selected_troop, position)
+            self.player_troops.append(troop)
+            if self.simulation:
+                self.simulation.add_troop(troop, True)
+            return True
+        return False
+        
+    def new_troop(self, troop_type, position):
+        if self.troop_pool is not None:
+            return self.troop_pool.spawn(troop_type, position)
+        return Troop(troop_type, position)
+        
+    def add_player_troop(self, position, troop_type):
+        troop = self.new_troop(troop_type, position)
+        self.player_troops.append(troop)
+        if self.simulation:
+            self.simulation.add_troop(troop, True)
+        
+    def withdraw_player_troop(self, troop_type):
+        """Remove the newest player troop of troop_type, returns it or None if there is none"""
+        for troop in reversed(self.player_troops):
+            if troop.type == troop_type:
+                self.player_troops.remove(troop)
+                if self.simulation:
+                    self.simulation.remove_troop(troop, True)
+                return troop
+        return None
+        
+    def add_opponent_troop(self, position, troop_type):
+        troop = self.new_troop(troop_type, position)
+        self.opponent_troops.append(troop)
+        if self.simulation:
+            self.simulation.add_troop(troop, False)
+        
+    def update(self, dt):
+        profiler = self.profiler
+        if profiler is not None and profiler.enabled:
+            profiler.measure("update.resources", self.update_resources)
+            if self.simulation:
+                profiler.measure("update.simulation", self.simulation.step, dt)
+                return
+            profiler.measure("update.player_troops", self.update_troops, dt, self.player_troops, self.opponent_base)
+            profiler.measure("update.opponent_troops", self.update_troops, dt, self.opponent_troops, self.player_base)
+            profiler.measure("update.defenses", self.update_all_defenses, dt)
+            return
+        
+        self.update_resources()
+        
+        if self.simulation:
+            self.simulation.step(dt)
+            return
+        
+        self.update_troops(dt, self.player_troops, self.opponent_base)
+        self.update_troops(dt, self.opponent_troops, self.player_base)
+        self.update_all_defenses(dt)
+        
+    def update_resources(self):
+        self.player_base.update_resources()
+        self.opponent_base.update_resources()
+        
+    def update_troops(self, dt, troops, base):
+        """Move troops against base and attack, dropping any that died"""
+        paths = base.paths if TROOP_PATHING == "flow" else None
+        for troop in troops[:]:
+            troop.update(dt, base.buildings, base.index, paths)
+            if troop.hp <= 0:
+                troops.remove(troop)
+                
+    def update_all_defenses(self, dt):
+        self.player_troops = self.update_defenses(dt, self.opponent_base, self.player_troops)
+        self.opponent_troops = self.update_defenses(dt, self.player_base, self.opponent_troops)
+        
+    def update_defenses(self, dt, base, troops):
+        """Let base's defenses shoot at troops, returns the troops still alive"""
+        if not base.defenses:
+            return troops
+            
+        self.troop_buckets.rebuild(troops)
+        killed = False
+        defenses = base.active_defenses(troops)
+        for defense in defenses:
+            target = defense.update_defense(dt, self.troop_buckets)
+            if target is not None and target.hp <= 0:
+                killed = True
+        base.track_cooldowns(defenses)
+                
+        if killed:
+            return [troop for troop in troops if troop.hp > 0]
+        return troops
+                
+    def save_game(self, filename="savegame.json"):
+        """Write a complete save in the savefile format, replacing filename atomically"""
+        write_checkpoint(filename, capture(self))
+            
+    def load_game(self, filename="savegame.json"):
+        try:
+            data = load_state(filename)
+            self.player_base = Base.from_dict(data["player_base"], self.clock)
+            self.opponent_base = Base.from_dict(data["opponent_base"], self.clock)
+            return True
+        except FileNotFoundError:
+
+            return False
@@ -0,0 +1,150 @@
+"""
+Headless simulation for Mini Clans
+Deterministic fixed-timestep battles without pygame, faster than real time
+"""
+
+import argparse
+import json
+import time
+from config import FPS, OUTCOME_CACHE_FILE, SIMULATION_ENGINE, TROOPS
+from game_state import GameState, Base
+from savefile import load_state
+
+DEFAULT_MAX_TICKS = FPS * 180
+
+
+class SimClock:
+    """Simulated wall clock handed to Base in place of time.time()"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, dt):
+        self.now += dt
+
+
+def load_layout(filename):
+    """Read a Base.to_dict layout, or the opponent base out of a save file"""
+    data = load_state(filename)
+    if "buildings" not in data:
+        data = data["opponent_base"]
+    return data
+
+
+class HeadlessRunner:
+    """Steps a GameState with a fixed dt and its own clock.
+
+    The player side attacks opponent_base. Nothing here reads the real clock
+    or imports pygame, so the same layout and deploy script always produce
+    the same battle.
+    """
+
+    def __init__(self, layout=None, dt=1.0 / FPS, engine=SIMULATION_ENGINE, start_time=0.0,
+                 troop_pool=False):
+        self.dt = dt
+        self.clock = SimClock(start_time)
+        self.game_state = GameState(engine=engine, clock=self.clock, troop_pool=troop_pool)
+        if layout is not None:
+            self.game_state.opponent_base = Base.from_dict(layout, self.clock)
+        self.tick = 0
+
+    def step(self):
+        self.clock.advance(self.dt)
+        self.game_state.update(self.dt)
+        self.tick += 1
+
+    def deploy(self, troop_type, position):
+        gs = self.game_state
+        gs.selected_troop = troop_type
+        return gs.deploy_troop(tuple(position))
+
+    def battle_over(self):
+        base = self.game_state.opponent_base
+        return all(b.hp <= 0 for b in base.buildings)
+
+    def run_attack(self, deploys, max_ticks=DEFAULT_MAX_TICKS, elixir=None):
+        """Play a scripted attack and report the outcome.
+
+        deploys is a list of {"tick", "troop_type", "position"} dicts. The
+        battle ends when every building is destroyed, when all deploys are
+        spent and no troops remain, or after max_ticks. The attacker wins by
+        destroying the Town Hall.
+        """
+        gs = self.game_state
+        if elixir is not None:
+            gs.player_base.elixir = elixir
+
+        script = sorted(deploys, key=lambda d: d["tick"])
+        next_deploy = 0
+        deployed = 0
+        elixir_spent = 0
+
+        start = time.perf_counter()
+        while self.tick < max_ticks:
+            while next_deploy < len(script) and script[next_deploy]["tick"] <= self.tick:
+                d = script[next_deploy]
+                next_deploy += 1
+                if self.deploy(d["troop_type"], d["position"]):
+                    deployed += 1
+                    elixir_spent += TROOPS[d["troop_type"]]["cost_elixir"]
+
+            self.step()
+
+            if self.battle_over():
+                break
+            if next_deploy >= len(script) and not gs.player_troops:
+                break
+        wall_time = time.perf_counter() - start
+
+        base = gs.opponent_base
+        town_hall_destroyed = base.town_hall_destroyed()
+        return {
+            "winner": "attacker" if town_hall_destroyed else "defender",
+            "destruction": base.destruction_percent(),
+            "town_hall_destroyed": town_hall_destroyed,
+            "ticks": self.tick,
+            "time": self.tick * self.dt,
+            "deployed": deployed,
+            "elixir_spent": elixir_spent,
+            "wall_time": wall_time,
+            "ticks_per_second": self.tick / wall_time if wall_time > 0 else float('inf')
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a Mini Clans attack without a window")
+    parser.add_argument("layout", help="Base.to_dict JSON file (or a save file's opponent base)")
+    parser.add_argument("deploys", help="JSON list of {tick, troop_type, position} deploys")
+    parser.add_argument("--dt", type=float, default=1.0 / FPS, help="fixed timestep in seconds")
+    parser.add_argument("--engine", choices=("object", "vector"), default=SIMULATION_ENGINE)
+    parser.add_argument("--max-ticks", type=int, default=DEFAULT_MAX_TICKS)
+    parser.add_argument("--elixir", type=float, default=None, help="attacker's starting elixir")
+    parser.add_argument("--troop-pool", action="store_true", help="store troops in a TroopPool")
+    parser.add_argument("--cache", nargs="?", const=OUTCOME_CACHE_FILE, default=None,
+                        help="reuse results for this layout and script from an outcome cache file")
+    args = parser.parse_args()
+
+    with open(args.deploys, 'r') as f:
+        deploys = json.load(f)
+
+    if args.cache:
+        from outcomes import OutcomeCache
+        cache = OutcomeCache(args.cache)
+        result = cache.run_attack(load_layout(args.layout), deploys, dt=args.dt, engine=args.engine,
+                                  max_ticks=args.max_ticks, elixir=args.elixir)
+        result["cache"] = cache.stats()
+        cache.close()
+        print(json.dumps(result, indent=2))
+        return
+
+    runner = HeadlessRunner(load_layout(args.layout), dt=args.dt, engine=args.engine,
+                            troop_pool=args.troop_pool)
+    result = runner.run_attack(deploys, max_ticks=args.max_ticks, elixir=args.elixir)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
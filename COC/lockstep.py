@@ -0,0 +1,225 @@
+"""
+Lockstep multiplayer for Mini Clans
+Both peers run the same fixed-step simulation from tick-stamped inputs and compare state hashes
+"""
+
+import struct
+from config import (
+    BUILDINGS, LOCKSTEP_HASH_INTERVAL, LOCKSTEP_INPUT_DELAY, LOCKSTEP_MAX_CATCHUP,
+    LOCKSTEP_TICK_RATE, TROOPS
+)
+from game_state import Base, Building
+from headless import SimClock
+
+MASK64 = (1 << 64) - 1
+DOUBLE = struct.Struct('<d')
+DOUBLE_BITS = struct.Struct('<Q')
+BUILDING_CODES = {name: i for i, name in enumerate(sorted(BUILDINGS))}
+TROOP_CODES = {name: i for i, name in enumerate(sorted(TROOPS))}
+
+
+def mix64(x):
+    """splitmix64's finaliser: spreads every input bit over the 64-bit result"""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+def float_bits(value):
+    return DOUBLE_BITS.unpack(DOUBLE.pack(value))[0]
+
+
+class BaseHash:
+    """Zobrist-style hash of one base's buildings, kept current as they change.
+
+    Each building contributes a 64-bit key derived from its seat, type,
+    position, level and exact hp, and the hash is the XOR of those keys, so
+    a change costs two key computations however big the base is. Base and
+    Building call add, remove and change through base.zobrist.
+    """
+
+    def __init__(self, base, seat):
+        self.seat = seat
+        self.value = 0
+        base.zobrist = self
+        for building in base.buildings:
+            self.add(building)
+
+    def key(self, building, hp):
+        x, y = building.position
+        salt = mix64((self.seat << 56) ^ (BUILDING_CODES[building.type] << 48)
+                     ^ (building.level << 40) ^ (x << 20) ^ y)
+        return mix64(salt ^ float_bits(hp))
+
+    def add(self, building):
+        self.value ^= self.key(building, building.hp)
+
+    def remove(self, building):
+        self.value ^= self.key(building, building.hp)
+
+    def change(self, building, old_hp):
+        self.value ^= self.key(building, old_hp) ^ self.key(building, building.hp)
+
+    def clear(self):
+        self.value = 0
+
+
+def troops_hash(troops, seat):
+    """Troops move every tick, so their part of the hash is folded in when it is taken"""
+    value = 0
+    for i, troop in enumerate(troops):
+        key = mix64((seat << 56) ^ (TROOP_CODES[troop.type] << 48) ^ i)
+        key = mix64(key ^ float_bits(troop.position[0]))
+        key = mix64(key ^ float_bits(troop.position[1]))
+        value ^= mix64(key ^ float_bits(troop.hp))
+    return value
+
+
+class Lockstep:
+    """Runs a GameState in lockstep with the peer on the other end of a NetworkManager.
+
+    Local inputs are stamped input_delay ticks ahead and sent, one message
+    per tick even when empty, so tick t only runs once both players' inputs
+    for it are known and both apply the same inputs at the same tick. Seat 0
+    is the host. Every hash_interval ticks each side sends a hash of its
+    whole state; desync is set to the first tick whose hashes differ.
+    """
+
+    def __init__(self, game_state, network, seat, tick_rate=LOCKSTEP_TICK_RATE,
+                 input_delay=LOCKSTEP_INPUT_DELAY, hash_interval=LOCKSTEP_HASH_INTERVAL, recorder=None):
+        self.game_state = game_state
+        self.network = network
+        self.seat = seat
+        self.dt = 1.0 / tick_rate
+        self.input_delay = input_delay
+        self.hash_interval = hash_interval
+        self.recorder = recorder
+
+        self.clock = SimClock()
+        game_state.clock = self.clock
+        game_state.player_base.set_clock(self.clock)
+        game_state.opponent_base.set_clock(self.clock)
+
+        self.tick = 0
+        self.accumulator = 0.0
+        self.pending = []
+        self.local = {}
+        self.remote = {}
+        self.hashes = {}
+        self.remote_hashes = {}
+        self.started = False
+        self.desync = None
+        self.stats = {"ticks": 0, "stalls": 0, "hashes_checked": 0}
+
+    def start(self):
+        """Send our base as tick 0's state; ticking starts once the peer's arrives"""
+        self.network.send_data({"action": "lockstep_start", "base": self.game_state.player_base.to_dict()})
+
+    def deploy_troop(self, troop_type, position):
+        """Queue a deploy for the next tick we send inputs for"""
+        self.pending.append(["deploy_troop", troop_type, float(position[0]), float(position[1])])
+
+    def place_building(self, building_type, position):
+        self.pending.append(["place_building", building_type, position[0], position[1]])
+
+    def receive(self, data):
+        """Handle a lockstep message from the peer"""
+        action = data["action"]
+        if action == "lockstep_start":
+            self.game_state.opponent_base = Base.from_dict(data["base"], self.clock)
+            self.started = True
+            BaseHash(self.game_state.player_base, self.seat)
+            BaseHash(self.game_state.opponent_base, 1 - self.seat)
+        elif action == "lockstep_inputs":
+            self.remote[data["tick"]] = data["inputs"]
+        elif action == "lockstep_hash":
+            self.remote_hashes[data["tick"]] = data["hash"]
+            self.check_hash(data["tick"])
+
+    def ready(self):
+        return self.started and (self.tick < self.input_delay or self.tick in self.remote)
+
+    def update(self, frame_dt):
+        """Run as many fixed ticks as frame_dt covers and the peer's inputs allow"""
+        self.accumulator = min(self.accumulator + frame_dt, LOCKSTEP_MAX_CATCHUP * self.dt)
+        while self.accumulator >= self.dt:
+            if not self.ready():
+                self.stats["stalls"] += 1
+                return
+            self.step()
+            self.accumulator -= self.dt
+
+    def step(self):
+        send_tick = self.tick + self.input_delay
+        self.local[send_tick] = self.pending
+        self.network.send_data({"action": "lockstep_inputs", "tick": send_tick, "inputs": self.pending})
+        self.pending = []
+
+        local = self.local.pop(self.tick, [])
+        remote = self.remote.pop(self.tick, [])
+        for seat, inputs in sorted(((self.seat, local), (1 - self.seat, remote))):
+            for command in inputs:
+                self.apply(seat == self.seat, command)
+
+        self.clock.advance(self.dt)
+        self.game_state.update(self.dt)
+        if self.recorder:
+            self.recorder.record_tick(self.dt)
+        self.tick += 1
+        self.stats["ticks"] += 1
+
+        if self.tick % self.hash_interval == 0:
+            value = self.state_hash()
+            self.hashes[self.tick] = value
+            self.network.send_data({"action": "lockstep_hash", "tick": self.tick, "hash": value})
+            self.check_hash(self.tick)
+
+    def apply(self, local, command):
+        """Carry out one input for the local or remote player, exactly as the peer does"""
+        gs = self.game_state
+        action, name, x, y = command
+        base = gs.player_base if local else gs.opponent_base
+        side = "player" if local else "opponent"
+        if action == "deploy_troop":
+            cost = TROOPS[name]["cost_elixir"]
+            if base.elixir < cost:
+                return
+            base.elixir -= cost
+            if local:
+                gs.add_player_troop((x, y), name)
+            else:
+                gs.add_opponent_troop((x, y), name)
+            if self.recorder:
+                self.recorder.deploy(side, name, (x, y))
+        elif action == "place_building":
+            position = (int(x), int(y))
+            if not base.can_place_building(position, BUILDINGS[name]["size"]):
+                return
+            if not base.purchase_building(name):
+                return
+            building = Building(name, position)
+            base.add_building(building)
+            if self.recorder:
+                self.recorder.place(side, building.to_dict())
+
+    def state_hash(self):
+        """Hash of both bases, both armies and the tick, the same on both peers while in sync"""
+        gs = self.game_state
+        value = mix64(self.tick)
+        for seat, base, troops in ((self.seat, gs.player_base, gs.player_troops),
+                                   (1 - self.seat, gs.opponent_base, gs.opponent_troops)):
+            value ^= base.zobrist.value ^ troops_hash(troops, seat)
+            value ^= mix64((seat << 56) ^ mix64(float_bits(base.gold)) ^ float_bits(base.elixir))
+        return value
+
+    def check_hash(self, tick):
+        local = self.hashes.get(tick)
+        remote = self.remote_hashes.get(tick)
+        if local is None or remote is None:
+            return
+        del self.hashes[tick]
+        del self.remote_hashes[tick]
+        self.stats["hashes_checked"] += 1
+        if local != remote and self.desync is None:
+            self.desync = tick
+            print(f"Lockstep desync detected at tick {tick}")
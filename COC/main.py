@@ -1,159 +1,297 @@
-"""
-Mini Clans - 2-Player Strategy Game
-Main entry point and game initialization
-"""
-
-import pygame
-import sys
-from enum import Enum
-from game_state import GameState
-from network import NetworkManager
-from ui import UI
-from config import *
-
-class GameMode(Enum):
-    MENU = 0
-    BUILD = 1
-    ATTACK = 2
-    WAITING = 3
-
-class MiniClans:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Mini Clans - 2-Player Strategy")
-        self.clock = pygame.time.Clock()
-        
-        self.game_state = GameState()
-        self.network = NetworkManager()
-        self.ui = UI(self.screen)
-        
-        self.mode = GameMode.MENU
-        self.running = True
-        self.is_host = False
-        self.connected = False
-        
-    def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.running = False
-                
-            if self.mode == GameMode.MENU:
-                self.handle_menu_events(event)
-            elif self.mode == GameMode.BUILD:
-                self.handle_build_events(event)
-            elif self.mode == GameMode.ATTACK:
-                self.handle_attack_events(event)
-                
-    def handle_menu_events(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            action = self.ui.handle_menu_click(event.pos)
-            if action == "HOST":
-                self.is_host = True
-                self.network.start_host()
-                self.mode = GameMode.WAITING
-                print("Waiting for player to join...")
-            elif action == "JOIN":
-                self.is_host = False
-                ip = self.ui.get_ip_input()
-                if self.network.join_game(ip):
-                    self.connected = True
-                    self.mode = GameMode.BUILD
-                    print("Connected to host!")
-                    
-    def handle_build_events(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            action = self.ui.handle_build_click(event.pos)
-            if action == "ATTACK":
-                self.mode = GameMode.ATTACK
-                
-                self.network.send_data({"action": "ready_to_attack"})
-            elif action and action.startswith("BUILD_"):
-                building_type = action.split("_")[1]
-                self.game_state.start_placing_building(building_type)
-            elif self.game_state.placing_building:
-                
-                grid_pos = self.ui.screen_to_grid(event.pos)
-                if self.game_state.place_building(grid_pos):
-                    
-                    self.network.send_data({
-                        "action": "place_building",
-                        "building": self.game_state.player_base.buildings[-1].to_dict()
-                    })
-                    
-    def handle_attack_events(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1:  
-                grid_pos = self.ui.screen_to_grid(event.pos)
-                if self.game_state.deploy_troop(grid_pos):
-                    
-                    self.network.send_data({
-                        "action": "deploy_troop",
-                        "position": grid_pos,
-                        "troop_type": self.game_state.selected_troop
-                    })
-                    
-    def update(self, dt):
-        
-        self.game_state.update(dt)
-        
-        
-        if self.connected or self.is_host:
-            data = self.network.receive_data()
-            if data:
-                self.process_network_data(data)
-                
-        
-        if self.is_host and not self.connected and self.mode == GameMode.WAITING:
-            if self.network.check_connection():
-                self.connected = True
-                self.mode = GameMode.BUILD
-                print("Player joined!")
-                
-    def process_network_data(self, data):
-        action = data.get("action")
-        if action == "place_building":
-            
-            building_data = data.get("building")
-            self.game_state.opponent_base.add_building_from_dict(building_data)
-        elif action == "deploy_troop":
-            
-            pos = data.get("position")
-            troop_type = data.get("troop_type")
-            self.game_state.add_opponent_troop(pos, troop_type)
-        elif action == "ready_to_attack":
-            
-            pass
-            
-    def render(self):
-        self.screen.fill(BACKGROUND_COLOR)
-        
-        if self.mode == GameMode.MENU:
-            self.ui.draw_menu()
-        elif self.mode == GameMode.WAITING:
-            self.ui.draw_waiting()
-        elif self.mode == GameMode.BUILD:
-            self.ui.draw_build_mode(self.game_state)
-        elif self.mode == GameMode.ATTACK:
-            self.ui.draw_attack_mode(self.game_state)
-            
-        pygame.display.flip()
-        
-    def run(self):
-        while self.running:
-            dt = self.clock.tick(FPS) / 1000.0
-            self.handle_events()
-            self.update(dt)
-            self.render()
-            
-        self.cleanup()
-        
-    def cleanup(self):
-        self.network.close()
-        pygame.quit()
-        sys.exit()
-
-if __name__ == "__main__":
-    game = MiniClans()
-
-    game.run()
+"""
+Mini Clans - 2-Player Strategy Game
+Main entry point and game initialization
+"""
+
+import pygame
+import sys
+from enum import Enum
+from game_state import GameState
+from lockstep import Lockstep
+from network import NetworkManager
+from profiler import Profiler
+from protocol import StateSync, apply_rejection
+from replay import ReplayRecorder
+from savefile import Autosaver
+from ui import UI
+from config import *
+
+class GameMode(Enum):
+    MENU = 0
+    BUILD = 1
+    ATTACK = 2
+    WAITING = 3
+
+class MiniClans:
+    def __init__(self):
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Mini Clans - 2-Player Strategy")
+        self.clock = pygame.time.Clock()
+        
+        self.game_state = GameState()
+        self.network = NetworkManager()
+        self.ui = UI(self.screen)
+        
+        self.mode = GameMode.MENU
+        self.running = True
+        self.is_host = False
+        self.connected = False
+        
+        self.state_sync = StateSync()
+        self.state_sync_timer = 0.0
+        
+        self.autosaver = Autosaver(self.game_state)
+        self.recorder = None
+        self.lockstep = None
+        
+        self.profiler = Profiler()
+        self.game_state.profiler = self.profiler
+        self.ui.profiler = self.profiler
+        self.ui.renderer.profiler = self.profiler
+        
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+                
+            if event.type == pygame.KEYDOWN and event.key in (pygame.K_F3, pygame.K_F4):
+                self.handle_profiler_key(event.key)
+                continue
+                
+            if self.mode in (GameMode.BUILD, GameMode.ATTACK) and self.ui.handle_camera_event(event):
+                continue
+                
+            if self.mode == GameMode.MENU:
+                self.handle_menu_events(event)
+            elif self.mode == GameMode.BUILD:
+                self.handle_build_events(event)
+            elif self.mode == GameMode.ATTACK:
+                self.handle_attack_events(event)
+                
+    def handle_profiler_key(self, key):
+        if key == pygame.K_F3:
+            self.profiler.toggle()
+        elif self.profiler.frames:
+            self.profiler.dump(PROFILER_DUMP_FILE)
+            print(f"Profile written to {PROFILER_DUMP_FILE}")
+            
+    def handle_menu_events(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            action = self.ui.handle_menu_click(event.pos)
+            if action == "HOST":
+                self.is_host = True
+                self.network.start_host()
+                self.mode = GameMode.WAITING
+                print("Waiting for player to join...")
+            elif action == "JOIN":
+                self.is_host = False
+                ip = self.ui.get_ip_input()
+                if self.network.join_game(ip):
+                    self.connected = True
+                    self.start_match()
+                    print("Connected to host!")
+                    
+    def handle_build_events(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            action = self.ui.handle_build_click(event.pos)
+            if action == "ATTACK":
+                self.mode = GameMode.ATTACK
+                
+                self.network.send_data({"action": "ready_to_attack"})
+            elif action and action.startswith("BUILD_"):
+                building_type = action.split("_")[1]
+                self.game_state.start_placing_building(building_type)
+            elif self.game_state.placing_building:
+                
+                grid_pos = self.ui.screen_to_grid(event.pos)
+                if self.lockstep:
+                    self.queue_building(grid_pos)
+                elif self.game_state.place_building(grid_pos):
+                    building = self.game_state.player_base.buildings[-1].to_dict()
+                    if self.recorder:
+                        self.recorder.place("player", building)
+                    self.network.send_data({
+                        "action": "place_building",
+                        "building": building
+                    })
+                    
+    def handle_attack_events(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 1:  
+                grid_pos = self.ui.screen_to_grid(event.pos)
+                if self.lockstep:
+                    self.lockstep.deploy_troop(self.game_state.selected_troop, grid_pos)
+                elif self.game_state.deploy_troop(grid_pos):
+                    if self.recorder:
+                        self.recorder.deploy("player", self.game_state.selected_troop, grid_pos)
+                    self.network.send_data({
+                        "action": "deploy_troop",
+                        "position": grid_pos,
+                        "troop_type": self.game_state.selected_troop
+                    })
+                    
+    def queue_building(self, grid_pos):
+        """Lockstep placement: checked here for feedback, carried out when its tick runs"""
+        building_type = self.game_state.placing_building
+        base = self.game_state.player_base
+        if (base.can_place_building(grid_pos, BUILDINGS[building_type]["size"])
+                and base.can_afford_building(building_type)):
+            self.lockstep.place_building(building_type, grid_pos)
+            self.game_state.placing_building = None
+            
+    def update(self, dt):
+        
+        if self.lockstep:
+            self.lockstep.update(dt)
+        else:
+            self.game_state.update(dt)
+            if self.recorder:
+                self.recorder.record_tick(dt)
+        
+        if self.mode in (GameMode.BUILD, GameMode.ATTACK):
+            self.ui.update_camera(dt)
+            self.autosaver.update(dt)
+        
+        
+        # Before receiving, so the joining player's first messages find the match started
+        if self.is_host and not self.connected and self.mode == GameMode.WAITING:
+            if self.network.check_connection():
+                self.connected = True
+                self.start_match()
+                print("Player joined!")
+                
+        if self.connected or self.is_host:
+            batch = self.network.receive_all()
+            if batch:
+                self.process_network_batch(batch)
+                self.network.mark_applied()
+                
+        
+        if self.connected and self.mode == GameMode.ATTACK and not self.lockstep:
+            self.state_sync_timer += dt
+            if self.state_sync_timer >= STATE_SYNC_INTERVAL:
+                self.state_sync_timer = 0.0
+                update = self.state_sync.make_update(self.game_state.player_base)
+                if update:
+                    self.network.send_data(update)
+                
+
+        
+        self.network.flush()
+                
+    def process_network_batch(self, batch):
+        """Apply every message received since the last frame, in arrival order"""
+        for data in batch:
+            self.process_network_data(data)
+            
+    def start_match(self):
+        """Both players are connected: go to build mode, in lockstep if configured"""
+        self.mode = GameMode.BUILD
+        if MULTIPLAYER_MODE == "lockstep":
+            # Recording starts once the opponent's starting base arrives
+            self.lockstep = Lockstep(self.game_state, self.network, 0 if self.is_host else 1)
+            self.lockstep.start()
+        else:
+            self.start_recording()
+            
+    def start_recording(self):
+        """Record the match from here on, so it can be replayed with replay.py"""
+        self.recorder = ReplayRecorder(self.game_state)
+        if self.lockstep:
+            self.lockstep.recorder = self.recorder
+        
+    def process_network_data(self, data):
+        action = data.get("action")
+        if action == "place_building":
+            
+            building_data = data.get("building")
+            self.game_state.opponent_base.add_building_from_dict(building_data)
+            if self.recorder:
+                self.recorder.place("opponent", building_data)
+        elif action == "deploy_troop":
+            
+            pos = data.get("position")
+            troop_type = data.get("troop_type")
+            self.game_state.add_opponent_troop(pos, troop_type)
+            if self.recorder:
+                self.recorder.deploy("opponent", troop_type, pos)
+        elif action in ("snapshot", "state_delta"):
+            
+            StateSync.apply_update(self.game_state.opponent_base, data, self.game_state.player_troops)
+            if self.recorder:
+                self.recorder.sync(data)
+        elif action == "rejected":
+            
+            apply_rejection(self.game_state, data)
+            if self.recorder:
+                self.recorder.reject(data)
+        elif action == "ready_to_attack":
+            
+            pass
+        elif action in ("lockstep_start", "lockstep_inputs", "lockstep_hash") and self.lockstep:
+            self.lockstep.receive(data)
+            if action == "lockstep_start":
+                self.start_recording()
+            
+    def render(self):
+        if self.mode == GameMode.BUILD:
+            pygame.display.update(self.ui.draw_build_mode(self.game_state))
+            return
+        if self.mode == GameMode.ATTACK:
+            pygame.display.update(self.ui.draw_attack_mode(self.game_state))
+            return
+            
+        self.screen.fill(BACKGROUND_COLOR)
+        
+        draw = self.ui.draw_menu if self.mode == GameMode.MENU else self.ui.draw_waiting
+        if self.profiler.enabled:
+            self.profiler.measure("ui." + draw.__qualname__, draw)
+        else:
+            draw()
+            
+        pygame.display.flip()
+        
+    def run(self):
+        while self.running:
+            dt = self.clock.tick(FPS) / 1000.0
+            if self.profiler.enabled:
+                self.profiled_frame(dt)
+                continue
+            self.handle_events()
+            self.update(dt)
+            self.render()
+            
+        self.cleanup()
+        
+    def profiled_frame(self, dt):
+        """One pass of the main loop with every phase timed"""
+        profiler = self.profiler
+        profiler.set("frame.dt", dt * 1000.0)
+        profiler.set("net.queue_in", len(self.network.message_queue))
+        profiler.set("net.queue_out", len(self.network.outgoing))
+        profiler.measure("frame.events", self.handle_events)
+        profiler.measure("frame.update", self.update, dt)
+        profiler.measure("frame.render", self.render)
+        
+        stats = self.network.stats
+        profiler.counter("net.messages_in", stats["messages_in"])
+        profiler.counter("net.messages_out", stats["messages_out"])
+        profiler.counter("net.bytes_in", stats["bytes_in"])
+        profiler.counter("net.bytes_out", stats["bytes_out"])
+        profiler.counter("ui.dirty_rects", self.ui.renderer.dirty_rects)
+        profiler.counter("ui.draw_calls", self.ui.renderer.draw_calls)
+        profiler.end_frame()
+        
+    def cleanup(self):
+        self.autosaver.close()
+        if self.recorder:
+            self.recorder.close()
+        self.network.close()
+        pygame.quit()
+        sys.exit()
+
+if __name__ == "__main__":
+    game = MiniClans()
+
+    game.run()
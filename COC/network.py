@@ -1,133 +1,287 @@
-"""
-Network Manager for multiplayer functionality
-Handles socket communication between host and client
-"""
-
-import socket
-import json
-import threading
-from config import DEFAULT_HOST, DEFAULT_PORT
-
-class NetworkManager:
-    def __init__(self):
-        self.socket = None
-        self.is_host = False
-        self.connected = False
-        self.client_socket = None
-        self.message_queue = []
-        self.lock = threading.Lock()
-        
-    def start_host(self):
-        """Start as host (server)"""
-        self.is_host = True
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((DEFAULT_HOST, DEFAULT_PORT))
-        self.socket.listen(1)
-        self.socket.settimeout(0.1)  
-        print(f"Server started on {DEFAULT_HOST}:{DEFAULT_PORT}")
-        
-    def check_connection(self):
-        """Check for incoming connections (host only)"""
-        if self.is_host and not self.connected:
-            try:
-                client, addr = self.socket.accept()
-                self.client_socket = client
-                self.client_socket.settimeout(0.1)
-                self.connected = True
-                print(f"Client connected from {addr}")
-                
-                
-                thread = threading.Thread(target=self._listen_thread, daemon=True)
-                thread.start()
-                return True
-            except socket.timeout:
-                return False
-        return False
-        
-    def join_game(self, host_ip=DEFAULT_HOST):
-        """Join as client"""
-        self.is_host = False
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((host_ip, DEFAULT_PORT))
-            self.socket.settimeout(0.1)
-            self.connected = True
-            print(f"Connected to {host_ip}:{DEFAULT_PORT}")
-            
-            
-            thread = threading.Thread(target=self._listen_thread, daemon=True)
-            thread.start()
-            return True
-        except Exception as e:
-            print(f"Connection failed: {e}")
-            return False
-            
-    def _listen_thread(self):
-        """Background thread to listen for incoming messages"""
-        active_socket = self.client_socket if self.is_host else self.socket
-        buffer = ""
-        
-        while self.connected:
-            try:
-                data = active_socket.recv(4096).decode('utf-8')
-                if not data:
-                    break
-                    
-                buffer += data
-                
-                
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line.strip():
-                        try:
-                            msg = json.loads(line)
-                            with self.lock:
-                                self.message_queue.append(msg)
-                        except json.JSONDecodeError:
-                            print(f"Invalid JSON received: {line}")
-                            
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"Connection error: {e}")
-                break
-                
-        self.connected = False
-        
-    def send_data(self, data):
-        """Send data to the other player"""
-        if not self.connected:
-            return False
-            
-        try:
-            msg = json.dumps(data) + '\n'
-            active_socket = self.client_socket if self.is_host else self.socket
-            active_socket.sendall(msg.encode('utf-8'))
-            return True
-        except Exception as e:
-            print(f"Send error: {e}")
-            self.connected = False
-            return False
-            
-    def receive_data(self):
-        """Get next message from queue"""
-        with self.lock:
-            if self.message_queue:
-                return self.message_queue.pop(0)
-        return None
-        
-    def close(self):
-        """Close all connections"""
-        self.connected = False
-        if self.client_socket:
-            try:
-                self.client_socket.close()
-            except:
-                pass
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-
-                pass
+"""
+Network Manager for multiplayer functionality
+Handles socket communication between host and client
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from config import DEFAULT_HOST, DEFAULT_PORT
+from protocol import (
+    BINARY_VERSION, JSON_LINES_VERSION, PROTOCOL_VERSION, StreamDecoder,
+    encode_json_line, encode_message, encode_sent_at
+)
+
+CONNECT_TIMEOUT = 5.0
+
+class LatencyHistogram:
+    """Power-of-two millisecond buckets for send-to-apply latency"""
+    
+    BUCKETS_MS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        
+    def add(self, seconds):
+        ms = seconds * 1000
+        i = 0
+        while i < len(self.BUCKETS_MS) and ms >= self.BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        
+    def summary(self):
+        labels = [f"<{b}ms" for b in self.BUCKETS_MS] + [f">={self.BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+class NetworkManager:
+    def __init__(self):
+        self.is_host = False
+        self.connected = False
+        self.message_queue = deque()
+        self.lock = threading.Lock()
+        self.outgoing = []
+        self.send_lock = threading.Lock()
+        self.protocol = JSON_LINES_VERSION
+        self.applying = []
+        self.stats = {
+            "messages_in": 0,
+            "messages_out": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "flushes": 0,
+            "latency": LatencyHistogram()
+        }
+        
+        self.loop = None
+        self.loop_thread = None
+        self.server = None
+        self.writer = None
+        self.just_connected = False
+        
+    def _ensure_loop(self):
+        """Start the background event loop thread that owns all sockets"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loop_thread.start()
+        
+    def _run(self, coro, timeout=None):
+        """Run a coroutine on the network loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+        
+    def start_host(self, port=DEFAULT_PORT):
+        """Start as host (server)"""
+        self.is_host = True
+        self._ensure_loop()
+        self.server = self._run(
+            asyncio.start_server(self._on_client, DEFAULT_HOST, port, reuse_address=True)
+        )
+        print(f"Server started on {DEFAULT_HOST}:{port}")
+        
+    async def _on_client(self, reader, writer):
+        if self.writer is not None:
+            # A match has exactly one opponent
+            writer.close()
+            return
+        self.writer = writer
+        self.connected = True
+        self.just_connected = True
+        print(f"Client connected from {writer.get_extra_info('peername')}")
+        try:
+            await self._read_loop(reader)
+        finally:
+            # Free the seat so the next client can connect, starting over on
+            # JSON lines until it says hello and with nothing left queued
+            if self.writer is writer:
+                self.writer = None
+                self.connected = False
+                self.protocol = JSON_LINES_VERSION
+                with self.send_lock:
+                    self.outgoing = []
+            writer.close()
+        
+    def check_connection(self):
+        """Check for incoming connections (host only)"""
+        if self.is_host and self.just_connected:
+            self.just_connected = False
+            return True
+        return False
+        
+    def join_game(self, host_ip=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Join as client"""
+        self.is_host = False
+        self._ensure_loop()
+        try:
+            reader, self.writer = self._run(
+                asyncio.open_connection(host_ip, port), CONNECT_TIMEOUT
+            )
+            self.connected = True
+            print(f"Connected to {host_ip}:{port}")
+            
+            # Offer the binary protocol; hosts that predate it ignore this line
+            # and we keep talking JSON lines. This goes out ahead of anything
+            # queued with send_data.
+            self._send_raw(encode_json_line({"action": "hello", "protocol": PROTOCOL_VERSION}))
+            
+            asyncio.run_coroutine_threadsafe(self._read_loop(reader), self.loop)
+            return True
+        except Exception as e:
+            print(f"Connection failed: {e}")
+            return False
+        
+    async def _read_loop(self, reader):
+        """Decode messages as bytes arrive and queue them for the game loop"""
+        decoder = StreamDecoder()
+        sent_at = None
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                self.stats["bytes_in"] += len(data)
+                
+                received = []
+                for msg in decoder.feed(data):
+                    action = msg.get("action")
+                    if action == "hello":
+                        self._negotiate(msg)
+                    elif action == "sent_at":
+                        sent_at = msg["time"]
+                    else:
+                        received.append((sent_at, msg))
+                if received:
+                    with self.lock:
+                        self.message_queue.extend(received)
+        except Exception as e:
+            print(f"Connection error: {e}")
+        
+        self.connected = False
+        
+    def _negotiate(self, msg):
+        """Handle the peer's protocol hello; the host answers with the version both sides speak"""
+        version = min(int(msg.get("protocol", JSON_LINES_VERSION)), PROTOCOL_VERSION)
+        if self.is_host:
+            self.writer.write(encode_json_line({"action": "hello", "protocol": version}))
+        self.protocol = version
+        print(f"Using protocol version {version}")
+        
+    def _send_raw(self, payload):
+        """Queue bytes for the loop thread to write; never blocks the caller"""
+        self.stats["bytes_out"] += len(payload)
+        self.loop.call_soon_threadsafe(self.writer.write, payload)
+        
+    def send_data(self, data):
+        """Queue data for the other player; it goes out on the next flush()"""
+        if not self.connected:
+            return False
+        
+        try:
+            payload = encode_message(data, self.protocol)
+        except Exception as e:
+            print(f"Send error: {e}")
+            return False
+        with self.send_lock:
+            self.outgoing.append(payload)
+        self.stats["messages_out"] += 1
+        return True
+        
+    def flush(self):
+        """Write everything queued by send_data since the last flush as one write.
+
+        The game loop calls this once per frame, so a frame's messages share
+        a single write; anything else that sends must flush too.
+        """
+        with self.send_lock:
+            if not self.outgoing:
+                return
+            pending = self.outgoing
+            self.outgoing = []
+        if not self.connected:
+            return
+        
+        if self.protocol >= BINARY_VERSION:
+            pending.insert(0, encode_sent_at(time.time()))
+        try:
+            self._send_raw(b''.join(pending))
+            self.stats["flushes"] += 1
+        except Exception as e:
+            print(f"Send error: {e}")
+            self.connected = False
+        
+    def receive_data(self):
+        """Get next message from queue"""
+        with self.lock:
+            if self.message_queue:
+                sent_at, msg = self.message_queue.popleft()
+                self.applying.append(sent_at)
+                self.stats["messages_in"] += 1
+                return msg
+        return None
+        
+    def receive_all(self):
+        """Take every queued message in one lock hold, oldest first"""
+        with self.lock:
+            if not self.message_queue:
+                return []
+            batch = self.message_queue
+            self.message_queue = deque()
+        self.applying.extend(sent_at for sent_at, _ in batch)
+        self.stats["messages_in"] += len(batch)
+        return [msg for _, msg in batch]
+        
+    def mark_applied(self):
+        """Record send-to-apply latency for the messages handed out since the last call.
+
+        Timestamps come from the sender's clock, so across machines the
+        histogram also includes any clock offset between them.
+        """
+        if not self.applying:
+            return
+        now = time.time()
+        latency = self.stats["latency"]
+        for sent_at in self.applying:
+            if sent_at is not None:
+                latency.add(max(0.0, now - sent_at))
+        self.applying = []
+        
+    def close(self):
+        """Close all connections"""
+        if self.loop is None:
+            self.connected = False
+            return
+        
+        self.flush()
+        self.connected = False
+        try:
+            self._run(self._shutdown(), 1.0)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(1.0)
+        
+    async def _shutdown(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        if self.server:
+            self.server.close()
+        
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,282 @@
+"""
+Layout optimizer for Mini Clans
+Evolves defensive base layouts for a gold/elixir budget, scoring them by simulating reference attacks in parallel
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    BUILDINGS, GRID_HEIGHT, GRID_WIDTH, OPTIMIZER_BATTLE_TIME, OPTIMIZER_DT, OPTIMIZER_GENERATIONS,
+    OPTIMIZER_POPULATION, SIMULATION_ENGINE
+)
+from game_state import Base, Building
+from headless import HeadlessRunner, SimClock
+from outcomes import canonical_layout, layout_hash
+
+# Added to a layout's score for each reference attack its Town Hall survives
+TOWN_HALL_BONUS = 50.0
+# Placements tried when filling a random layout before giving up on more buildings
+FILL_ATTEMPTS = 50
+
+# Set once per worker by _init_worker, so tasks only carry layouts
+_attacks = None
+_options = None
+
+
+def _init_worker(attacks, options):
+    global _attacks, _options
+    _attacks = attacks
+    _options = options
+
+
+def score_layout(layout, attacks, dt=OPTIMIZER_DT, engine=SIMULATION_ENGINE, battle_time=OPTIMIZER_BATTLE_TIME):
+    """Mean over attacks of the destruction prevented, plus TOWN_HALL_BONUS when the Town Hall stands"""
+    max_ticks = int(round(battle_time / dt))
+    total = 0.0
+    for deploys in attacks:
+        runner = HeadlessRunner(layout, dt=dt, engine=engine)
+        result = runner.run_attack(deploys, max_ticks=max_ticks)
+        total += 100.0 - result["destruction"]
+        if not result["town_hall_destroyed"]:
+            total += TOWN_HALL_BONUS
+    return total / len(attacks)
+
+
+def _score(layout):
+    return score_layout(layout, _attacks, **_options)
+
+
+def default_attacks(width=GRID_WIDTH, height=GRID_HEIGHT):
+    """One wave of barbarians and archers from the middle of each edge"""
+    attacks = []
+    for x, y in ((0, height // 2), (width - 1, height // 2), (width // 2, 0), (width // 2, height - 1)):
+        wave = []
+        for i, troop_type in enumerate(["BARBARIAN"] * 5 + ["ARCHER"] * 3):
+            offset = i % 3 - 1
+            if x in (0, width - 1):
+                position = [x, y + offset]
+            else:
+                position = [x + offset, y]
+            wave.append({"tick": 0, "troop_type": troop_type, "position": position})
+        attacks.append(wave)
+    return attacks
+
+
+class LayoutOptimizer:
+    """Genetic search for the layout that best holds off a set of reference attacks.
+
+    A genome is a list of [type, x, y] placements with the Town Hall first.
+    Decoding places them in order on an empty base, dropping any that
+    overlap an earlier one or no longer fit the gold/elixir budget, so every
+    genome stands for a legal layout. Each generation keeps the best layouts,
+    then fills the population with children made by crossing two parents
+    along a random column and mutating the result by moving, adding or
+    removing buildings. Layouts are scored across a process pool and every
+    score is cached by outcomes.layout_hash, so a layout seen before is never
+    simulated again.
+    """
+
+    def __init__(self, gold, elixir, attacks=None, width=GRID_WIDTH, height=GRID_HEIGHT,
+                 population=OPTIMIZER_POPULATION, elite=None, workers=None, seed=None,
+                 dt=OPTIMIZER_DT, engine=SIMULATION_ENGINE, battle_time=OPTIMIZER_BATTLE_TIME):
+        self.gold = gold
+        self.elixir = elixir
+        self.attacks = attacks if attacks is not None else default_attacks(width, height)
+        self.width = width
+        self.height = height
+        self.population = population
+        self.elite = elite if elite is not None else max(1, population // 4)
+        self.workers = workers or os.cpu_count() or 1
+        self.rng = random.Random(seed)
+        self.options = {"dt": dt, "engine": engine, "battle_time": battle_time}
+        self.scores = {}
+        self.layouts = {}
+        self.stats = {"generations": 0, "candidates": 0, "simulated": 0, "cache_hits": 0}
+
+    def empty_base(self):
+        base = Base(SimClock(), self.width, self.height, town_hall=False)
+        base.gold = self.gold
+        base.elixir = self.elixir
+        return base
+
+    def build(self, genes, skip=None):
+        """Place genes in order on an empty base, returns the base and the genes that were kept"""
+        base = self.empty_base()
+        kept = []
+        for i, (building_type, x, y) in enumerate(genes):
+            if i == skip:
+                continue
+            if not base.can_place_building((x, y), BUILDINGS[building_type]["size"]):
+                continue
+            if not base.purchase_building(building_type):
+                continue
+            base.add_building(Building(building_type, (x, y)))
+            kept.append([building_type, x, y])
+        return base, kept
+
+    def place_random(self, base, building_type):
+        """A random legal anchor for building_type on base, or None"""
+        anchors = base.valid_placements(BUILDINGS[building_type]["size"])
+        return self.rng.choice(anchors) if anchors else None
+
+    def affordable(self, base):
+        return [t for t in sorted(BUILDINGS) if t != "TOWNHALL" and base.can_afford_building(t)]
+
+    def add_random(self, genes):
+        base, genes = self.build(genes)
+        choices = self.affordable(base)
+        if choices:
+            building_type = self.rng.choice(choices)
+            anchor = self.place_random(base, building_type)
+            if anchor is not None:
+                genes.append([building_type, anchor[0], anchor[1]])
+        return genes
+
+    def random_genome(self):
+        size = BUILDINGS["TOWNHALL"]["size"]
+        genes = [["TOWNHALL", self.rng.randrange(self.width - size + 1), self.rng.randrange(self.height - size + 1)]]
+        for _ in range(FILL_ATTEMPTS):
+            count = len(genes)
+            genes = self.add_random(genes)
+            if len(genes) == count:
+                break
+        return genes
+
+    def mutate(self, genes):
+        """Move, add or remove one building"""
+        roll = self.rng.random()
+        if roll < 0.6 or len(genes) == 1:
+            i = self.rng.randrange(len(genes))
+            base, _ = self.build(genes, skip=i)
+            anchor = self.place_random(base, genes[i][0])
+            if anchor is not None:
+                genes = genes[:i] + [[genes[i][0], anchor[0], anchor[1]]] + genes[i + 1:]
+            return genes
+        if roll < 0.8:
+            return self.add_random(genes)
+        i = self.rng.randrange(1, len(genes))
+        return genes[:i] + genes[i + 1:]
+
+    def crossover(self, a, b):
+        """a's buildings left of a random column and b's from it on, keeping a's Town Hall"""
+        split = self.rng.randrange(1, self.width)
+        genes = [a[0]]
+        genes += [g for g in a[1:] if g[1] < split]
+        genes += [g for g in b[1:] if g[1] >= split]
+        return genes
+
+    def select(self, ranked):
+        """Tournament of two over the ranked population"""
+        i = min(self.rng.randrange(len(ranked)), self.rng.randrange(len(ranked)))
+        return ranked[i]
+
+    def to_layout(self, genes):
+        """Base.to_dict of the decoded genome in canonical_layout order, so its hash describes what is simulated"""
+        base, _ = self.build(genes)
+        return canonical_layout(base.to_dict())
+
+    def evaluate(self, pool, genomes):
+        """Scores for genomes, simulating only layouts without a cached score"""
+        layouts = [self.to_layout(genes) for genes in genomes]
+        keys = [layout_hash(layout) for layout in layouts]
+        todo = {}
+        for key, layout in zip(keys, layouts):
+            if key in self.scores or key in todo:
+                self.stats["cache_hits"] += 1
+            else:
+                todo[key] = layout
+        if todo:
+            chunksize = max(1, len(todo) // (self.workers * 4))
+            for key, score in zip(todo, pool.map(_score, todo.values(), chunksize=chunksize)):
+                self.scores[key] = score
+                self.layouts[key] = todo[key]
+        self.stats["candidates"] += len(genomes)
+        self.stats["simulated"] += len(todo)
+        return [self.scores[key] for key in keys]
+
+    def run(self, generations=OPTIMIZER_GENERATIONS, time_budget=None, top=1):
+        """Evolve for generations (or until time_budget seconds pass), returns the top (score, layout) pairs"""
+        start = time.perf_counter()
+        genomes = [self.random_genome() for _ in range(self.population)]
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.attacks, self.options)
+        ) as pool:
+            for generation in range(generations):
+                scores = self.evaluate(pool, genomes)
+                self.stats["generations"] = generation + 1
+                ranked = [genes for _, genes in sorted(zip(scores, genomes), key=lambda pair: -pair[0])]
+                if time_budget is not None and time.perf_counter() - start >= time_budget:
+                    break
+                if generation == generations - 1:
+                    break
+                children = ranked[:self.elite]
+                while len(children) < self.population:
+                    parent = self.select(ranked)
+                    if self.rng.random() < 0.5:
+                        parent = self.crossover(parent, self.select(ranked))
+                    children.append(self.build(self.mutate(parent))[1])
+                genomes = children
+
+        self.stats["wall_time"] = time.perf_counter() - start
+        self.stats["cache_hit_rate"] = self.stats["cache_hits"] / max(1, self.stats["candidates"])
+        best = sorted(self.scores, key=lambda key: -self.scores[key])[:top]
+        return [(self.scores[key], self.layouts[key]) for key in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for a strong Mini Clans base layout")
+    parser.add_argument("--gold", type=float, required=True, help="gold to spend on buildings")
+    parser.add_argument("--elixir", type=float, required=True, help="elixir to spend on buildings")
+    parser.add_argument("--attacks", nargs="+", default=None,
+                        help="JSON files with a deploy script or a list of them (default: one wave per edge)")
+    parser.add_argument("--out", default="best_layouts.json", help="where to write the best Base.to_dict layouts")
+    parser.add_argument("--top", type=int, default=3, help="how many layouts to write")
+    parser.add_argument("--generations", type=int, default=OPTIMIZER_GENERATIONS)
+    parser.add_argument("--population", type=int, default=OPTIMIZER_POPULATION)
+    parser.add_argument("--time-budget", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--dt", type=float, default=OPTIMIZER_DT)
+    parser.add_argument("--engine", choices=("object", "vector"), default=SIMULATION_ENGINE)
+    parser.add_argument("--battle-time", type=float, default=OPTIMIZER_BATTLE_TIME)
+    args = parser.parse_args()
+
+    attacks = None
+    if args.attacks:
+        attacks = []
+        for filename in args.attacks:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            if not data or isinstance(data[0], dict):
+                attacks.append(data)
+            else:
+                attacks.extend(data)
+
+    optimizer = LayoutOptimizer(
+        args.gold, args.elixir, attacks,
+        width=args.width,
+        height=args.height,
+        population=args.population,
+        workers=args.workers,
+        seed=args.seed,
+        dt=args.dt,
+        engine=args.engine,
+        battle_time=args.battle_time
+    )
+    best = optimizer.run(args.generations, args.time_budget, args.top)
+
+    with open(args.out, 'w') as f:
+        json.dump([layout for _, layout in best], f, indent=2)
+    print(json.dumps({"scores": [score for score, _ in best], **optimizer.stats}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
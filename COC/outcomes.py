@@ -0,0 +1,176 @@
+"""
+Battle outcome cache for Mini Clans
+Canonical layout and deploy hashes, and a memory plus sqlite cache of attack results keyed by them
+"""
+
+import hashlib
+import json
+import sqlite3
+from collections import OrderedDict
+from config import (
+    BUILDINGS, FPS, GRID_HEIGHT, GRID_WIDTH, LEVEL_GROWTH, OUTCOME_CACHE_FILE, OUTCOME_CACHE_SIZE,
+    SIMULATION_ENGINE, STARTING_ELIXIR, STARTING_GOLD, TROOP_PATHING, TROOPS
+)
+from game_state import BUILDING_LEVELS
+from headless import DEFAULT_MAX_TICKS, HeadlessRunner
+from pathing import FLOW_FIELD_RADIUS
+
+# Uncommitted writes allowed before the disk tier commits on its own
+COMMIT_EVERY = 100
+
+
+def _digest(data):
+    return hashlib.sha1(json.dumps(data, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def config_hash():
+    """Hash of every table that changes how a battle plays out; colours are left out"""
+    def stats(table):
+        return {name: {k: v for k, v in row.items() if k != "color"} for name, row in table.items()}
+    return _digest({
+        "buildings": stats(BUILDINGS),
+        "troops": stats(TROOPS),
+        "level_growth": LEVEL_GROWTH,
+        "pathing": TROOP_PATHING,
+        "flow_field_radius": FLOW_FIELD_RADIUS,
+        "starting_gold": STARTING_GOLD,
+        "starting_elixir": STARTING_ELIXIR
+    })
+
+
+def _canonical_key(building):
+    """Sort and hash key for one building, with each number in one form so hp 500 and 500.0 match"""
+    level = int(building.get("level", 1))
+    hp = float(building.get("hp", BUILDING_LEVELS[building["type"]][level]["hp"]))
+    x, y = building["position"]
+    return (building["type"], float(x), float(y), level, hp)
+
+
+def canonical_layout(layout):
+    """A copy of a Base.to_dict layout with its buildings sorted by type, position, level and hp.
+
+    Troops break ties between equally near buildings by list order, which
+    happens often on the tile grid, so the same buildings in another order
+    can play out differently. Everything the cache stores is simulated from
+    this order, which is what layout_hash describes.
+    """
+    layout = dict(layout)
+    layout["buildings"] = sorted(layout["buildings"], key=_canonical_key)
+    return layout
+
+
+def layout_hash(layout):
+    """Hash of a Base.to_dict layout from its map size and canonical_layout's building order.
+
+    Stored resources do not change a battle and are left out.
+    """
+    buildings = sorted(_canonical_key(b) for b in layout["buildings"])
+    return _digest([layout.get("width", GRID_WIDTH), layout.get("height", GRID_HEIGHT), buildings])
+
+
+def base_hash(base):
+    return layout_hash(base.to_dict())
+
+
+def deploy_hash(deploys):
+    """Hash of a deploy script, ordered by tick the way HeadlessRunner plays it"""
+    script = sorted(deploys, key=lambda d: d["tick"])
+    return _digest([[d["tick"], d["troop_type"], list(d["position"])] for d in script])
+
+
+def outcome_key(layout_key, deploys_key, dt=1.0 / FPS, engine=SIMULATION_ENGINE,
+                max_ticks=DEFAULT_MAX_TICKS, elixir=None):
+    """Key for one attack: the layout and deploy hashes plus the run_attack options"""
+    return _digest([layout_key, deploys_key, dt, engine, max_ticks, elixir])
+
+
+class OutcomeCache:
+    """HeadlessRunner.run_attack results by outcome_key, in an LRU in memory and optionally in sqlite.
+
+    The disk tier remembers the config_hash it was filled under and empties
+    itself when opened under a different one, so results never outlive the
+    stats they were simulated with. Lookups count towards stats().
+    """
+
+    def __init__(self, filename=OUTCOME_CACHE_FILE, memory_size=OUTCOME_CACHE_SIZE):
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.config = config_hash()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.unsaved = 0
+        self.db = None
+        if filename is not None:
+            self.db = sqlite3.connect(filename)
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS outcomes (key TEXT PRIMARY KEY, result TEXT)")
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+            if row is None or row[0] != self.config:
+                self.db.execute("DELETE FROM outcomes")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (self.config,))
+            self.db.commit()
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """The cached result for key, or None"""
+        result = self.memory.get(key)
+        if result is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return dict(result)
+        if self.db is not None:
+            row = self.db.execute("SELECT result FROM outcomes WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                self._remember(key, result)
+                self.disk_hits += 1
+                return dict(result)
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self._remember(key, dict(result))
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO outcomes VALUES (?, ?)", (key, json.dumps(result)))
+            self.unsaved += 1
+            if self.unsaved >= COMMIT_EVERY:
+                self.flush()
+
+    def run_attack(self, layout, deploys, dt=1.0 / FPS, engine=SIMULATION_ENGINE,
+                   max_ticks=DEFAULT_MAX_TICKS, elixir=None):
+        """HeadlessRunner(canonical_layout(layout)).run_attack(deploys), simulated only on a cache miss"""
+        key = outcome_key(layout_hash(layout), deploy_hash(deploys), dt, engine, max_ticks, elixir)
+        result = self.get(key)
+        if result is None:
+            runner = HeadlessRunner(canonical_layout(layout), dt=dt, engine=engine)
+            result = runner.run_attack(deploys, max_ticks=max_ticks, elixir=elixir)
+            self.put(key, result)
+        return result
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
+
+    def flush(self):
+        if self.db is not None and self.unsaved:
+            self.db.commit()
+            self.unsaved = 0
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
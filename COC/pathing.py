@@ -0,0 +1,169 @@
+"""
+Troop pathing for Mini Clans
+Flow fields over a base's occupancy grid, so every troop heading for the same building shares one search
+"""
+
+import math
+from array import array
+from collections import OrderedDict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Tiles around a target covered by its field; beyond that troops walk straight at it
+FLOW_FIELD_RADIUS = 24
+FLOW_FIELD_CACHE_SIZE = 64
+
+# Orthogonal steps first so ties between equally short paths prefer them
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+class FlowField:
+    """Next step towards one building from every tile within FLOW_FIELD_RADIUS of it.
+
+    Built by a single breadth-first search outwards from the building's
+    footprint through tiles no live building stands on; rubble is walkable
+    and diagonal steps may not cut the corner of a blocked tile. step[i] is
+    the tile to walk to from tile i, i itself on the goal footprint, and -1
+    where the tile is blocked or cut off.
+    """
+
+    def __init__(self, base, building, radius=FLOW_FIELD_RADIUS):
+        size = building.stats["size"]
+        bx, by = building.position
+        self.x0 = max(0, bx - radius)
+        self.y0 = max(0, by - radius)
+        x1 = min(base.width, bx + size + radius)
+        y1 = min(base.height, by + size + radius)
+        self.width = w = x1 - self.x0
+        self.height = h = y1 - self.y0
+
+        blocked = base.occupancy.region(self.x0, self.y0, x1, y1)
+        for other in base.buildings_in_area(self.x0, self.y0, x1, y1):
+            if other is building or other.hp <= 0:
+                self._clear(blocked, other.position, other.stats["size"])
+
+        step = array('i', [-1]) * (w * h)
+        queue = deque()
+        for y in range(max(by, self.y0), min(by + size, y1)):
+            for x in range(max(bx, self.x0), min(bx + size, x1)):
+                i = (y - self.y0) * w + (x - self.x0)
+                step[i] = i
+                queue.append(i)
+
+        while queue:
+            i = queue.popleft()
+            y, x = divmod(i, w)
+            for dx, dy in NEIGHBOURS:
+                nx = x + dx
+                ny = y + dy
+                if nx < 0 or nx >= w or ny < 0 or ny >= h:
+                    continue
+                j = ny * w + nx
+                if step[j] != -1 or blocked[j]:
+                    continue
+                if dx and dy and (blocked[y * w + nx] or blocked[ny * w + x]):
+                    continue
+                step[j] = i
+                queue.append(j)
+        self.step = step
+
+    def covers(self, position, size):
+        """Whether a building's footprint overlaps this field's window"""
+        return (position[0] < self.x0 + self.width and position[0] + size > self.x0
+                and position[1] < self.y0 + self.height and position[1] + size > self.y0)
+        
+    def _clear(self, blocked, position, size):
+        """Take one building's footprint back out of the blocked counts"""
+        w = self.width
+        for y in range(max(position[1], self.y0), min(position[1] + size, self.y0 + self.height)):
+            row = (y - self.y0) * w
+            for x in range(max(position[0], self.x0), min(position[0] + size, self.x0 + w)):
+                blocked[row + x - self.x0] -= 1
+
+    def waypoint(self, position):
+        """Centre of the next tile to walk to, or None to head straight for the building"""
+        x = math.floor(position[0]) - self.x0
+        y = math.floor(position[1]) - self.y0
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        i = y * self.width + x
+        j = self.step[i]
+        if j < 0 or j == i:
+            return None
+        y, x = divmod(j, self.width)
+        return (self.x0 + x + 0.5, self.y0 + y + 0.5)
+
+    def waypoints(self, positions):
+        """waypoint() for an (n, 2) array of positions at once.
+
+        Returns the waypoints and a mask of which rows have one; the other
+        rows should head straight for the building.
+        """
+        tiles = np.floor(positions).astype(np.intp) - (self.x0, self.y0)
+        inside = ((tiles[:, 0] >= 0) & (tiles[:, 0] < self.width)
+                  & (tiles[:, 1] >= 0) & (tiles[:, 1] < self.height))
+        index = np.where(inside, tiles[:, 1] * self.width + tiles[:, 0], 0)
+        step = np.frombuffer(self.step, dtype=np.int32)[index]
+        valid = inside & (step >= 0) & (step != index)
+        points = np.empty_like(positions)
+        points[:, 0] = self.x0 + step % self.width + 0.5
+        points[:, 1] = self.y0 + step // self.width + 0.5
+        return points, valid
+
+
+class FlowFields:
+    """Flow fields for one base's buildings, built on first use.
+
+    The whole cache is dropped when the base's layout changes. When a
+    building is destroyed or restored only the fields whose window it
+    overlaps are dropped. Least recently used fields are evicted past
+    FLOW_FIELD_CACHE_SIZE or one per building, whichever is larger, so a
+    battle targeting every building at once does not rebuild fields each
+    tick.
+    """
+
+    def __init__(self, base, capacity=FLOW_FIELD_CACHE_SIZE):
+        self.base = base
+        self.capacity = capacity
+        self.revision = None
+        self.fields = OrderedDict()
+
+    def invalidate(self, building):
+        """Drop the fields a change to building's walkability affects"""
+        size = building.stats["size"]
+        stale = [key for key, field in self.fields.items() if field.covers(building.position, size)]
+        for key in stale:
+            del self.fields[key]
+
+    def fork(self, base, copies):
+        """The cache for a fork of our base, starting with every field built so far.
+
+        Fields are never changed once built, only dropped, so both caches can
+        hold the same ones. copies maps id(original building) to its copy.
+        """
+        other = FlowFields(base, self.capacity)
+        if self.revision == self.base.revision:
+            other.revision = self.revision
+            other.fields = OrderedDict((id(copies[key]), field) for key, field in self.fields.items())
+        return other
+
+    def field(self, building):
+        if self.base.revision != self.revision:
+            self.revision = self.base.revision
+            self.fields.clear()
+
+        field = self.fields.get(id(building))
+        if field is not None:
+            self.fields.move_to_end(id(building))
+            return field
+        field = FlowField(self.base, building)
+        self.fields[id(building)] = field
+        if len(self.fields) > max(self.capacity, len(self.base.buildings)):
+            self.fields.popitem(last=False)
+        return field
+
+    def waypoint(self, building, position):
+        return self.field(building).waypoint(position)
@@ -0,0 +1,158 @@
+"""
+Deploy planner for Mini Clans
+Monte-Carlo search for where to drop a wave of troops, simulating every candidate on a fork of the game
+"""
+
+import argparse
+import json
+import random
+import time
+from config import PLANNER_BUDGET, PLANNER_DT, PLANNER_HORIZON, SIMULATION_ENGINE, TROOP_PATHING
+from game_state import Base, GameState
+from headless import SimClock, load_layout
+
+# Share of candidates drawn at random once there is a best wave to mutate
+EXPLORE = 0.3
+# Standard deviation, in tiles, of the jitter applied to a mutated deploy
+JITTER = 2.0
+
+
+class DeployPlanner:
+    """Picks deploy positions for a wave of troops against the defending base.
+
+    Every candidate wave is played out on game_state.fork() for horizon
+    simulated seconds at a coarse dt, then scored by (Town Hall destroyed,
+    destruction percent, damage dealt), higher being better. Candidates are
+    random waves or jittered copies of the best one so far, tried until the
+    time budget or max_evaluations runs out. The game_state itself is never
+    changed: candidates fork a root copy taken when planning starts, whose
+    flow fields are built once up front so every fork shares them.
+    """
+
+    def __init__(self, game_state, attacker="player", budget=PLANNER_BUDGET, horizon=PLANNER_HORIZON,
+                 dt=PLANNER_DT, seed=None, max_evaluations=None):
+        if attacker not in ("player", "opponent"):
+            raise ValueError(f"Unknown attacker: {attacker}")
+        self.game_state = game_state
+        self.attacker = attacker
+        self.budget = budget
+        self.horizon = horizon
+        self.dt = dt
+        self.max_evaluations = max_evaluations
+        self.rng = random.Random(seed)
+        self.root = None
+        self.stats = {}
+
+    def defender(self, gs):
+        return gs.opponent_base if self.attacker == "player" else gs.player_base
+
+    def fork_root(self):
+        self.root = self.game_state.fork(SimClock(self.game_state.clock()))
+        if TROOP_PATHING == "flow":
+            base = self.defender(self.root)
+            for building in base.buildings:
+                if building.hp > 0:
+                    base.paths.field(building)
+
+    def random_position(self, base):
+        return (self.rng.randrange(base.width), self.rng.randrange(base.height))
+
+    def random_wave(self, troops):
+        base = self.defender(self.game_state)
+        return [(troop_type, self.random_position(base)) for troop_type in troops]
+
+    def mutate(self, wave):
+        """Jitter every deploy of wave, or with some chance move one of them anywhere"""
+        base = self.defender(self.game_state)
+        if self.rng.random() < EXPLORE:
+            i = self.rng.randrange(len(wave))
+            return wave[:i] + [(wave[i][0], self.random_position(base))] + wave[i + 1:]
+        mutated = []
+        for troop_type, (x, y) in wave:
+            x = min(base.width - 1, max(0, round(x + self.rng.gauss(0, JITTER))))
+            y = min(base.height - 1, max(0, round(y + self.rng.gauss(0, JITTER))))
+            mutated.append((troop_type, (x, y)))
+        return mutated
+
+    def evaluate(self, wave):
+        """Play wave out on a fork and score the result"""
+        if self.root is None:
+            self.fork_root()
+        clock = SimClock(self.root.clock())
+        gs = self.root.fork(clock)
+        deploy = gs.add_player_troop if self.attacker == "player" else gs.add_opponent_troop
+        for troop_type, position in wave:
+            deploy(position, troop_type)
+
+        base = self.defender(gs)
+        for _ in range(int(round(self.horizon / self.dt))):
+            clock.advance(self.dt)
+            gs.update(self.dt)
+            troops = gs.player_troops if self.attacker == "player" else gs.opponent_troops
+            if not troops or all(b.hp <= 0 for b in base.buildings):
+                break
+
+        damage = sum(b.max_hp - max(b.hp, 0) for b in base.buildings)
+        return (base.town_hall_destroyed(), round(base.destruction_percent(), 6), round(damage, 6))
+
+    def plan(self, troops):
+        """Best wave found for troops, a list of troop types, as [(troop_type, position)] and its score"""
+        if not troops:
+            return [], None
+        start = time.perf_counter()
+        deadline = start + self.budget
+        self.fork_root()
+        best = None
+        best_score = None
+        evaluated = 0
+        while best is None or time.perf_counter() < deadline:
+            if self.max_evaluations is not None and evaluated >= self.max_evaluations:
+                break
+            if best is None or self.rng.random() < EXPLORE:
+                wave = self.random_wave(troops)
+            else:
+                wave = self.mutate(best)
+            score = self.evaluate(wave)
+            evaluated += 1
+            if best_score is None or score > best_score:
+                best, best_score = wave, score
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            "evaluated": evaluated,
+            "elapsed": elapsed,
+            "forks_per_second": evaluated / elapsed if elapsed > 0 else float('inf')
+        }
+        return best, best_score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a troop wave against a Mini Clans base")
+    parser.add_argument("layout", help="Base.to_dict JSON file (or a save file's opponent base)")
+    parser.add_argument("troops", nargs="+", help="troop types in the wave, e.g. BARBARIAN BARBARIAN ARCHER")
+    parser.add_argument("--budget", type=float, default=PLANNER_BUDGET, help="seconds of search")
+    parser.add_argument("--horizon", type=float, default=PLANNER_HORIZON, help="simulated seconds per candidate")
+    parser.add_argument("--dt", type=float, default=PLANNER_DT)
+    parser.add_argument("--evaluations", type=int, default=None, help="stop after this many candidates")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engine", choices=("object", "vector"), default=SIMULATION_ENGINE)
+    args = parser.parse_args()
+
+    clock = SimClock()
+    game_state = GameState(engine=args.engine, clock=clock)
+    game_state.opponent_base = Base.from_dict(load_layout(args.layout), clock)
+    planner = DeployPlanner(game_state, budget=args.budget, horizon=args.horizon, dt=args.dt,
+                            seed=args.seed, max_evaluations=args.evaluations)
+    wave, score = planner.plan(args.troops)
+
+    town_hall_destroyed, destruction, damage = score
+    print(json.dumps({
+        "deploys": [{"tick": 0, "troop_type": t, "position": list(p)} for t, p in wave],
+        "town_hall_destroyed": town_hall_destroyed,
+        "destruction": destruction,
+        "damage": damage,
+        **planner.stats
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
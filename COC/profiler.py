@@ -0,0 +1,101 @@
+"""
+Profiler for Mini Clans
+Per-frame timings and counters, summarised on screen and dumped to CSV or JSON
+"""
+
+import csv
+import json
+import time
+from collections import deque
+from config import PROFILER_HISTORY, PROFILER_OVERLAY_REFRESH
+
+# Columns are dotted names; the prefix says which part of the game they come from:
+#   frame.*   MiniClans.run phases (events, update, render) and the frame's dt, in ms
+#   update.*  GameState.update stages, in ms
+#   ui.*      time in each draw function (ui.UI.draw_troop, ui.Button.draw, ...), in
+#             DirtyRenderer.present and in background builds, in ms, plus the
+#             renderer's dirty rects and draw calls this frame
+#   net.*     NetworkManager inbound and outbound queue depths and bytes in/out this frame
+
+
+class Profiler:
+    """Collects one row of timings and counters per frame while enabled.
+
+    Instrumented code checks enabled and only then takes timings, so a
+    disabled profiler costs a single attribute test per call site. The last
+    PROFILER_HISTORY frames are kept for the overlay and for dump().
+    """
+
+    def __init__(self, history=PROFILER_HISTORY):
+        self.enabled = False
+        self.frames = deque(maxlen=history)
+        self.columns = []
+        self.row = {}
+        self.totals = {}
+        self.lines = []
+        self.frames_since_refresh = PROFILER_OVERLAY_REFRESH
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.row = {}
+        self.totals = {}
+        self.frames_since_refresh = PROFILER_OVERLAY_REFRESH
+        return self.enabled
+
+    def measure(self, name, fn, *args):
+        """Call fn(*args), adding its duration in ms to this frame's name column"""
+        start = time.perf_counter()
+        result = fn(*args)
+        self.add(name, (time.perf_counter() - start) * 1000.0)
+        return result
+
+    def add(self, name, value):
+        self.row[name] = self.row.get(name, 0) + value
+
+    def set(self, name, value):
+        self.row[name] = value
+
+    def counter(self, name, total):
+        """Record how much a running total grew since the last frame"""
+        last = self.totals.get(name)
+        self.totals[name] = total
+        if last is not None:
+            self.row[name] = total - last
+
+    def end_frame(self):
+        for name in self.row:
+            if name not in self.columns:
+                self.columns.append(name)
+        self.frames.append(self.row)
+        self.row = {}
+        self.frames_since_refresh += 1
+
+    def summary(self):
+        """{column: (mean, max)} over the kept frames"""
+        result = {}
+        for name in self.columns:
+            values = [frame[name] for frame in self.frames if name in frame]
+            if values:
+                result[name] = (sum(values) / len(values), max(values))
+        return result
+
+    def overlay_lines(self):
+        """Text for the on-screen overlay, recomputed every PROFILER_OVERLAY_REFRESH frames"""
+        if self.frames_since_refresh >= PROFILER_OVERLAY_REFRESH:
+            self.frames_since_refresh = 0
+            self.lines = [f"{len(self.frames)} frames  mean / max"]
+            for name, (mean, peak) in self.summary().items():
+                self.lines.append(f"{name:<24}{mean:8.2f}{peak:8.2f}")
+        return self.lines
+
+    def dump(self, filename):
+        """Write the kept frames as CSV, or as JSON when filename ends in .json"""
+        if filename.endswith(".json"):
+            with open(filename, 'w') as f:
+                json.dump({"columns": self.columns, "frames": list(self.frames),
+                           "summary": self.summary()}, f, indent=2)
+            return
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            writer.writeheader()
+            writer.writerows(self.frames)
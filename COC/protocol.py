@@ -0,0 +1,305 @@
+"""
+Wire protocol for Mini Clans
+Binary length-prefixed frames for common messages, with the original JSON-lines format as fallback
+"""
+
+import json
+import struct
+from config import BUILDINGS, TROOPS
+from game_state import BUILDING_LEVELS, Building
+
+JSON_LINES_VERSION = 1
+BINARY_VERSION = 2
+PROTOCOL_VERSION = BINARY_VERSION
+
+# JSON lines always start with '{', so a byte outside ASCII marks a binary
+# frame and both encodings can share one stream during negotiation.
+FRAME_MAGIC = 0xB1
+FRAME_HEADER = struct.Struct('<BBI')
+
+MSG_PLACE_BUILDING = 1
+MSG_DEPLOY_TROOP = 2
+MSG_READY_TO_ATTACK = 3
+MSG_SNAPSHOT = 4
+MSG_STATE_DELTA = 5
+MSG_SENT_AT = 6
+MSG_LOCKSTEP_INPUTS = 7
+MSG_LOCKSTEP_HASH = 8
+MSG_JSON = 255
+
+# hp and positions travel as doubles so the peer's copy matches ours to the bit
+BUILDING_STRUCT = struct.Struct('<BHHBd')
+TROOP_STRUCT = struct.Struct('<Bdd')
+COUNT_STRUCT = struct.Struct('<H')
+DELTA_STRUCT = struct.Struct('<Hd')
+SENT_AT_STRUCT = struct.Struct('<d')
+# Lockstep positions stay doubles so both peers apply bit-identical inputs
+TICK_STRUCT = struct.Struct('<IH')
+INPUT_STRUCT = struct.Struct('<BBdd')
+HASH_STRUCT = struct.Struct('<IQ')
+INPUT_ACTIONS = ("deploy_troop", "place_building")
+
+BUILDING_CODES = {name: i for i, name in enumerate(sorted(BUILDINGS))}
+BUILDING_NAMES = sorted(BUILDINGS)
+TROOP_CODES = {name: i for i, name in enumerate(sorted(TROOPS))}
+TROOP_NAMES = sorted(TROOPS)
+
+
+def encode_json_line(data):
+    return (json.dumps(data) + '\n').encode('utf-8')
+
+
+def _frame(msg_type, payload=b''):
+    return FRAME_HEADER.pack(FRAME_MAGIC, msg_type, len(payload)) + payload
+
+
+def _pack_building(b):
+    hp = b.get("hp")
+    if hp is None:
+        hp = BUILDING_LEVELS[b["type"]][b["level"]]["hp"]
+    return BUILDING_STRUCT.pack(
+        BUILDING_CODES[b["type"]], b["position"][0], b["position"][1], b["level"], hp
+    )
+
+
+def _unpack_building(payload, offset):
+    code, x, y, level, hp = BUILDING_STRUCT.unpack_from(payload, offset)
+    return {"type": BUILDING_NAMES[code], "position": [x, y], "level": level, "hp": hp}
+
+
+def _check_building(b):
+    if b["type"] not in BUILDINGS or b.get("level", 1) not in BUILDING_LEVELS[b["type"]]:
+        raise ValueError(f"Unknown building {b['type']} level {b.get('level', 1)}")
+
+
+def check_message(msg):
+    """Return msg if it is a message the game can apply, else raise ValueError"""
+    if not isinstance(msg, dict):
+        raise ValueError(f"Message is not an object: {msg!r}")
+    action = msg.get("action")
+    try:
+        if action == "place_building":
+            _check_building(msg["building"])
+        elif action == "snapshot":
+            for b in msg["buildings"]:
+                _check_building(b)
+        elif action in ("lockstep_start", "rejected"):
+            for b in msg["base"]["buildings"]:
+                _check_building(b)
+        elif action == "deploy_troop" and msg["troop_type"] not in TROOPS:
+            raise ValueError(f"Unknown troop {msg['troop_type']}")
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed {action} message: {e!r}")
+    return msg
+
+
+def _encode_struct(data):
+    action = data.get("action")
+    if action == "place_building":
+        return _frame(MSG_PLACE_BUILDING, _pack_building(data["building"]))
+    if action == "deploy_troop":
+        x, y = data["position"]
+        return _frame(MSG_DEPLOY_TROOP, TROOP_STRUCT.pack(TROOP_CODES[data["troop_type"]], x, y))
+    if action == "ready_to_attack" and len(data) == 1:
+        return _frame(MSG_READY_TO_ATTACK)
+    if action == "snapshot":
+        buildings = data["buildings"]
+        payload = COUNT_STRUCT.pack(len(buildings)) + b''.join(_pack_building(b) for b in buildings)
+        return _frame(MSG_SNAPSHOT, payload)
+    if action == "state_delta":
+        changes = data["changes"]
+        payload = COUNT_STRUCT.pack(len(changes)) + b''.join(DELTA_STRUCT.pack(i, hp) for i, hp in changes)
+        return _frame(MSG_STATE_DELTA, payload)
+    if action == "lockstep_inputs":
+        inputs = data["inputs"]
+        payload = TICK_STRUCT.pack(data["tick"], len(inputs)) + b''.join(
+            INPUT_STRUCT.pack(INPUT_ACTIONS.index(kind),
+                              TROOP_CODES[name] if kind == "deploy_troop" else BUILDING_CODES[name], x, y)
+            for kind, name, x, y in inputs
+        )
+        return _frame(MSG_LOCKSTEP_INPUTS, payload)
+    if action == "lockstep_hash":
+        return _frame(MSG_LOCKSTEP_HASH, HASH_STRUCT.pack(data["tick"], data["hash"]))
+    return None
+
+
+def encode_binary(data):
+    """Encode a message as a binary frame, using a JSON frame for anything without a struct"""
+    try:
+        frame = _encode_struct(data)
+    except (KeyError, TypeError, ValueError, struct.error):
+        frame = None
+    if frame is None:
+        frame = _frame(MSG_JSON, json.dumps(data).encode('utf-8'))
+    return frame
+
+
+def encode_sent_at(timestamp):
+    """Frame stamping the wall-clock send time of the messages that follow it"""
+    return _frame(MSG_SENT_AT, SENT_AT_STRUCT.pack(timestamp))
+
+
+def encode_message(data, version):
+    if version >= BINARY_VERSION:
+        return encode_binary(data)
+    return encode_json_line(data)
+
+
+def decode_frame(msg_type, payload):
+    if msg_type == MSG_PLACE_BUILDING:
+        return {"action": "place_building", "building": _unpack_building(payload, 0)}
+    if msg_type == MSG_DEPLOY_TROOP:
+        code, x, y = TROOP_STRUCT.unpack(payload)
+        return {"action": "deploy_troop", "position": [x, y], "troop_type": TROOP_NAMES[code]}
+    if msg_type == MSG_READY_TO_ATTACK:
+        return {"action": "ready_to_attack"}
+    if msg_type == MSG_SNAPSHOT:
+        (count,) = COUNT_STRUCT.unpack_from(payload, 0)
+        offset = COUNT_STRUCT.size
+        buildings = []
+        for _ in range(count):
+            buildings.append(_unpack_building(payload, offset))
+            offset += BUILDING_STRUCT.size
+        return {"action": "snapshot", "buildings": buildings}
+    if msg_type == MSG_STATE_DELTA:
+        (count,) = COUNT_STRUCT.unpack_from(payload, 0)
+        changes = [
+            list(DELTA_STRUCT.unpack_from(payload, COUNT_STRUCT.size + i * DELTA_STRUCT.size))
+            for i in range(count)
+        ]
+        return {"action": "state_delta", "changes": changes}
+    if msg_type == MSG_SENT_AT:
+        return {"action": "sent_at", "time": SENT_AT_STRUCT.unpack(payload)[0]}
+    if msg_type == MSG_LOCKSTEP_INPUTS:
+        tick, count = TICK_STRUCT.unpack_from(payload, 0)
+        inputs = []
+        for i in range(count):
+            kind, code, x, y = INPUT_STRUCT.unpack_from(payload, TICK_STRUCT.size + i * INPUT_STRUCT.size)
+            if kind == 0:
+                inputs.append([INPUT_ACTIONS[kind], TROOP_NAMES[code], x, y])
+            else:
+                inputs.append([INPUT_ACTIONS[kind], BUILDING_NAMES[code], int(x), int(y)])
+        return {"action": "lockstep_inputs", "tick": tick, "inputs": inputs}
+    if msg_type == MSG_LOCKSTEP_HASH:
+        tick, value = HASH_STRUCT.unpack(payload)
+        return {"action": "lockstep_hash", "tick": tick, "hash": value}
+    return json.loads(payload.decode('utf-8'))
+
+
+class StreamDecoder:
+    """Splits a byte stream into messages, accepting JSON lines and binary frames interleaved.
+
+    Messages check_message rejects are reported and dropped like undecodable ones.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes, returns every complete message decoded from them"""
+        self.buffer += data
+        messages = []
+        buf = self.buffer
+        pos = 0
+        while pos < len(buf):
+            if buf[pos] == FRAME_MAGIC:
+                if len(buf) - pos < FRAME_HEADER.size:
+                    break
+                _, msg_type, length = FRAME_HEADER.unpack_from(buf, pos)
+                end = pos + FRAME_HEADER.size + length
+                if end > len(buf):
+                    break
+                payload = bytes(buf[pos + FRAME_HEADER.size:end])
+                pos = end
+                try:
+                    messages.append(check_message(decode_frame(msg_type, payload)))
+                except (ValueError, IndexError, struct.error):
+                    print(f"Invalid frame received: type {msg_type}")
+            else:
+                end = buf.find(b'\n', pos)
+                if end < 0:
+                    break
+                line = bytes(buf[pos:end]).decode('utf-8', errors='replace')
+                pos = end + 1
+                if line.strip():
+                    try:
+                        messages.append(check_message(json.loads(line)))
+                    except ValueError:
+                        print(f"Invalid JSON received: {line}")
+        del buf[:pos]
+        return messages
+
+
+class StateSync:
+    """Produces snapshot and hp-delta messages for one base.
+
+    The first update, and any update after the layout changes, is a full
+    snapshot. After that only buildings whose hp moved since the last message
+    are sent, as (index, hp) pairs.
+    """
+
+    def __init__(self):
+        self.revision = None
+        self.last_hp = []
+
+    def make_update(self, base):
+        hp = [b.hp for b in base.buildings]
+        if base.revision != self.revision:
+            self.revision = base.revision
+            self.last_hp = hp
+            return {"action": "snapshot", "buildings": [b.to_dict() for b in base.buildings]}
+
+        changes = [[i, h] for i, (h, old) in enumerate(zip(hp, self.last_hp)) if h != old]
+        self.last_hp = hp
+        if not changes:
+            return None
+        return {"action": "state_delta", "changes": changes}
+
+    @staticmethod
+    def apply_update(base, data, troops=()):
+        """Apply a snapshot or delta from the peer to our copy of their base.
+
+        troops are the ones attacking base. A snapshot of the layout we
+        already have only updates hp, so the Building objects they target
+        stay live; a changed layout replaces the buildings and moves their
+        targets onto the new ones.
+        """
+        if data["action"] == "snapshot":
+            buildings = data["buildings"]
+            current = base.buildings
+            if len(buildings) == len(current) and all(
+                    b.type == d["type"] and tuple(b.position) == tuple(d["position"])
+                    and b.level == d.get("level", 1)
+                    for b, d in zip(current, buildings)):
+                for b, d in zip(current, buildings):
+                    b.set_hp(d.get("hp", b.max_hp))
+                return
+            replacements = [Building.from_dict(b) for b in buildings]
+            base.set_buildings(replacements)
+            by_place = {(b.type, b.position): b for b in replacements}
+            for troop in troops:
+                target = troop.target
+                if target is not None and target.owner is not base:
+                    troop.target = by_place.get((target.type, tuple(target.position)))
+        else:
+            for i, hp in data["changes"]:
+                if 0 <= i < len(base.buildings):
+                    base.buildings[i].set_hp(hp)
+
+
+def apply_rejection(game_state, data):
+    """Undo a move the match server refused and take its copy of our base.
+
+    A refused deploy withdraws the newest player troop of that type. The
+    base's buildings and resources become the server's, which drops a
+    refused placement and puts back whatever it cost.
+    """
+    request = data.get("request")
+    if isinstance(request, dict) and request.get("action") == "deploy_troop":
+        game_state.withdraw_player_troop(request.get("troop_type"))
+    base = game_state.player_base
+    server_base = data["base"]
+    StateSync.apply_update(base, {"action": "snapshot", "buildings": server_base["buildings"]},
+                           game_state.opponent_troops)
+    base.gold = server_base["gold"]
+    base.elixir = server_base["elixir"]
@@ -0,0 +1,238 @@
+"""
+Battle replays for Mini Clans
+Records the inputs of a match and plays them back deterministically through GameState.update
+"""
+
+import argparse
+import json
+import time
+from config import REPLAY_FILE, REPLAY_KEYFRAME_INTERVAL
+from game_state import GameState, Base, Troop
+from headless import SimClock
+from protocol import StateSync, apply_rejection
+
+REPLAY_FORMAT = "mini-clans-replay"
+REPLAY_VERSION = 1
+SIDES = ("player", "opponent")
+
+# After the header line every line is one JSON array:
+#   ["start", {"player_base": ..., "opponent_base": ..., "time": clock}]
+#   ["dt", tick, dt]                        dt for this tick onwards
+#   ["deploy_troop", tick, side, troop_type, [x, y]]
+#   ["place_building", tick, side, Building.to_dict()]
+#   ["sync", tick, StateSync snapshot or delta for the opponent base]
+#   ["rejected", tick, the match server's rejection of a player input]
+#   ["end", tick]
+# An event at tick t is applied before the t-th call to GameState.update
+# (counting from 0), matching when it reached the live game.
+
+
+def _line(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+class ReplayRecorder:
+    """Writes a match's starting bases and every input after it to a replay file"""
+
+    def __init__(self, game_state, filename=REPLAY_FILE):
+        self.file = open(filename, 'w')
+        self.tick = 0
+        self.dt = None
+        self.file.write(_line({"format": REPLAY_FORMAT, "version": REPLAY_VERSION}))
+        self.file.write(_line(["start", {
+            "player_base": game_state.player_base.to_dict(),
+            "opponent_base": game_state.opponent_base.to_dict(),
+            "time": game_state.clock()
+        }]))
+
+    def record_tick(self, dt):
+        """Call after every GameState.update"""
+        if dt != self.dt:
+            self.dt = dt
+            self.file.write(_line(["dt", self.tick, dt]))
+        self.tick += 1
+
+    def deploy(self, side, troop_type, position):
+        self.file.write(_line(["deploy_troop", self.tick, side, troop_type, list(position)]))
+
+    def place(self, side, building):
+        self.file.write(_line(["place_building", self.tick, side, building]))
+
+    def sync(self, data):
+        self.file.write(_line(["sync", self.tick, data]))
+
+    def reject(self, data):
+        self.file.write(_line(["rejected", self.tick, data]))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(_line(["end", self.tick]))
+            self.file.close()
+
+
+def snapshot_state(game_state):
+    """Everything GameState.update depends on, as plain data detached from the live objects"""
+    state = {"time": game_state.clock()}
+    for side, other in (("player", "opponent"), ("opponent", "player")):
+        base = getattr(game_state, side + "_base")
+        state[side + "_base"] = (base.to_dict(), [b.cooldown for b in base.buildings])
+        # Troops attack the other side's base, so their targets index into it
+        targets = {id(b): i for i, b in enumerate(getattr(game_state, other + "_base").buildings)}
+        state[side + "_troops"] = [(t.type, tuple(t.position), t.hp, targets.get(id(t.target), -1))
+                                   for t in getattr(game_state, side + "_troops")]
+    return state
+
+
+def restore_state(state, clock):
+    """A fresh object-engine GameState equal to the one snapshot_state was given"""
+    clock.now = state["time"]
+    gs = GameState(clock=clock)
+    for side in SIDES:
+        data, cooldowns = state[side + "_base"]
+        base = Base.from_dict(data, clock)
+        for building, cooldown in zip(base.buildings, cooldowns):
+            building.cooldown = cooldown
+        base.track_cooldowns(base.defenses)
+        setattr(gs, side + "_base", base)
+    for side, other in (("player", gs.opponent_base), ("opponent", gs.player_base)):
+        troops = []
+        for troop_type, position, hp, target in state[side + "_troops"]:
+            troop = Troop(troop_type, position)
+            troop.hp = hp
+            troop.target = other.buildings[target] if target >= 0 else None
+            troops.append(troop)
+        setattr(gs, side + "_troops", troops)
+    return gs
+
+
+class ReplayPlayer:
+    """Replays a recorded match through GameState.update on a simulated clock.
+
+    Playback always uses the object engine. A keyframe of the whole state is
+    kept every keyframe_interval ticks as they are first simulated, so
+    seeking restores the nearest earlier keyframe and only simulates the
+    ticks after it.
+    """
+
+    def __init__(self, filename, keyframe_interval=REPLAY_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.events = {}
+        self.dts = {}
+        self.end_tick = 0
+        start = None
+        with open(filename, 'r') as f:
+            header = json.loads(f.readline())
+            if header.get("format") != REPLAY_FORMAT:
+                raise ValueError(f"{filename} is not a replay")
+            if header.get("version", 0) > REPLAY_VERSION:
+                raise ValueError(f"Replay version {header['version']} is newer than {REPLAY_VERSION}")
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                record = json.loads(line)
+                kind = record[0]
+                if kind == "start":
+                    start = record[1]
+                elif kind == "dt":
+                    self.dts[record[1]] = record[2]
+                elif kind == "end":
+                    self.end_tick = record[1]
+                else:
+                    self.events.setdefault(record[1], []).append(record)
+                    self.end_tick = max(self.end_tick, record[1])
+        if start is None:
+            raise ValueError(f"{filename} has no starting state")
+        if self.dts:
+            self.end_tick = max(self.end_tick, max(self.dts))
+
+        self.clock = SimClock(start["time"])
+        self.game_state = GameState(clock=self.clock)
+        self.game_state.player_base = Base.from_dict(start["player_base"], self.clock)
+        self.game_state.opponent_base = Base.from_dict(start["opponent_base"], self.clock)
+        self.tick = 0
+        self.dt = None
+        self.keyframes = {0: (snapshot_state(self.game_state), None)}
+
+    def apply(self, record):
+        gs = self.game_state
+        kind = record[0]
+        if kind == "deploy_troop":
+            _, _, side, troop_type, position = record
+            if side == "player":
+                gs.add_player_troop(position, troop_type)
+            else:
+                gs.add_opponent_troop(position, troop_type)
+        elif kind == "place_building":
+            base = gs.player_base if record[2] == "player" else gs.opponent_base
+            base.add_building_from_dict(record[3])
+        elif kind == "sync":
+            StateSync.apply_update(gs.opponent_base, record[2], gs.player_troops)
+        elif kind == "rejected":
+            apply_rejection(gs, record[2])
+
+    def step(self):
+        """Apply this tick's inputs and run one update"""
+        for record in self.events.get(self.tick, ()):
+            self.apply(record)
+        self.dt = self.dts.get(self.tick, self.dt)
+        self.clock.advance(self.dt)
+        self.game_state.update(self.dt)
+        self.tick += 1
+        if self.tick % self.keyframe_interval == 0 and self.tick not in self.keyframes:
+            self.keyframes[self.tick] = (snapshot_state(self.game_state), self.dt)
+
+    def seek(self, tick):
+        """Jump to just before the given tick's update, from the closest keyframe at or before it"""
+        tick = max(0, min(tick, self.end_tick))
+        start = max(k for k in self.keyframes if k <= tick)
+        if tick < self.tick or start > self.tick:
+            state, self.dt = self.keyframes[start]
+            self.game_state = restore_state(state, self.clock)
+            self.tick = start
+        while self.tick < tick:
+            self.step()
+
+    def play(self, speed=1.0, until=None, on_tick=None):
+        """Run to until (default the end) at speed times real time, or as fast as possible for None"""
+        until = self.end_tick if until is None else min(until, self.end_tick)
+        start = time.perf_counter()
+        sim_start = self.clock()
+        while self.tick < until:
+            self.step()
+            if on_tick:
+                on_tick(self)
+            if speed is not None:
+                ahead = (self.clock() - sim_start) / speed - (time.perf_counter() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play back a recorded Mini Clans match")
+    parser.add_argument("replay", nargs="?", default=REPLAY_FILE)
+    parser.add_argument("--speed", default="uncapped", help="1, 10 or any multiple of real time, or uncapped")
+    parser.add_argument("--seek", type=int, default=0, help="tick to jump to before playing")
+    parser.add_argument("--until", type=int, default=None, help="tick to stop at")
+    args = parser.parse_args()
+
+    player = ReplayPlayer(args.replay)
+    player.seek(args.seek)
+    speed = None if args.speed == "uncapped" else float(args.speed)
+    wall_time = player.play(speed, args.until)
+
+    gs = player.game_state
+    print(json.dumps({
+        "tick": player.tick,
+        "end_tick": player.end_tick,
+        "time": player.clock(),
+        "player_troops": len(gs.player_troops),
+        "opponent_troops": len(gs.opponent_troops),
+        "player_destruction": gs.player_base.destruction_percent(),
+        "opponent_destruction": gs.opponent_base.destruction_percent(),
+        "wall_time": wall_time
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
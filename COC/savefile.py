@@ -0,0 +1,262 @@
+"""
+Save files for Mini Clans
+Line-delimited records behind a versioned header, updated incrementally by a background autosaver
+"""
+
+import json
+import os
+import threading
+from config import AUTOSAVE_COMPACT_EVERY, AUTOSAVE_FILE, AUTOSAVE_INTERVAL
+
+SAVE_FORMAT = "mini-clans-save"
+SAVE_VERSION = 2
+SIDES = ("player_base", "opponent_base")
+
+# After the header line every line is one JSON array:
+#   ["base", side, {"gold", "elixir", "width", "height"}]
+#   ["building", side, key, Building.to_dict()]
+#   ["remove", side, key]
+#   ["commit"]
+# Later records override earlier ones and buildings keep the position of
+# their first record, so appending what changed is enough to update a save.
+# Records only take effect at the commit that ends their batch (version 1
+# files have no commits and apply every record as it comes).
+RECORD_LENGTHS = {"base": 3, "building": 4, "remove": 3, "commit": 1}
+
+
+def _line(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+class SaveKeys:
+    """Small numbers that identify the same building across saves, keeping records short"""
+
+    def __init__(self):
+        self.keys = {}
+        self.next = 0
+
+    def key(self, building):
+        key = self.keys.get(id(building))
+        if key is None:
+            key = self.keys[id(building)] = self.next
+            self.next += 1
+        return key
+
+    def keep(self, live):
+        """Forget every building not in live, a list of ids"""
+        self.keys = {ident: self.keys[ident] for ident in live}
+
+
+def capture(game_state, keys=None):
+    """Both bases as plain data, taken on the game thread so the saver never touches live objects.
+
+    With keys (a SaveKeys) each building keeps its number from one capture to
+    the next; without, buildings are numbered in order.
+    """
+    state = {}
+    live = []
+    for side in SIDES:
+        base = getattr(game_state, side)
+        info = {"gold": base.gold, "elixir": base.elixir, "width": base.width, "height": base.height}
+        if keys is None:
+            buildings = {i: b.to_dict() for i, b in enumerate(base.buildings)}
+        else:
+            buildings = {keys.key(b): b.to_dict() for b in base.buildings}
+            live.extend(id(b) for b in base.buildings)
+        state[side] = (info, buildings)
+    if keys is not None:
+        keys.keep(live)
+    return state
+
+
+def write_checkpoint(filename, state):
+    """Write state as a complete save to a temporary file, then rename it over filename"""
+    tmp = filename + ".tmp"
+    with open(tmp, 'w') as f:
+        f.write(_line({"format": SAVE_FORMAT, "version": SAVE_VERSION}))
+        for side in SIDES:
+            info, buildings = state[side]
+            f.write(_line(["base", side, info]))
+            for key, building in buildings.items():
+                f.write(_line(["building", side, key, building]))
+        f.write(_line(["commit"]))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def append_changes(filename, old, new):
+    """Append records turning save state old into new, returns how many were written.
+
+    The records go out in one write ending with a commit record. If the
+    write is cut short the commit is missing, so load_state drops the whole
+    batch and the save reads back as state old.
+    """
+    lines = []
+    for side in SIDES:
+        info, buildings = new[side]
+        old_info, old_buildings = old[side]
+        if info != old_info:
+            lines.append(_line(["base", side, info]))
+        for key, building in buildings.items():
+            if old_buildings.get(key) != building:
+                lines.append(_line(["building", side, key, building]))
+        for key in old_buildings:
+            if key not in buildings:
+                lines.append(_line(["remove", side, key]))
+    if lines:
+        with open(filename, 'a') as f:
+            f.write(''.join(lines) + _line(["commit"]))
+            f.flush()
+            os.fsync(f.fileno())
+    return len(lines)
+
+
+def _parse(line):
+    """One record from a save line, ValueError if it is not a well-formed record"""
+    record = json.loads(line)
+    if (not isinstance(record, list) or not record or not isinstance(record[0], str)
+            or RECORD_LENGTHS.get(record[0]) != len(record)):
+        raise ValueError(f"Bad save record {line!r}")
+    kind = record[0]
+    if kind != "commit" and (
+            record[1] not in SIDES
+            or (kind == "base" and not isinstance(record[2], dict))
+            or (kind != "base" and (isinstance(record[2], bool) or not isinstance(record[2], int)))
+            or (kind == "building" and not isinstance(record[3], dict))):
+        raise ValueError(f"Bad save record {line!r}")
+    return record
+
+
+def _apply(sides, record):
+    info, buildings = sides[record[1]]
+    kind = record[0]
+    if kind == "base":
+        info.update(record[2])
+    elif kind == "building":
+        buildings[record[2]] = record[3]
+    elif kind == "remove":
+        buildings.pop(record[2], None)
+
+
+def load_state(filename):
+    """Stream a save into {side: Base.to_dict data}, one line at a time.
+
+    Reading stops at the first torn or malformed line, as if the file ended
+    there, and records after the last commit are dropped. Files without the
+    header are read as the older single JSON document.
+    """
+    with open(filename, 'r') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != SAVE_FORMAT:
+            f.seek(0)
+            return json.load(f)
+        if header.get("version", 0) > SAVE_VERSION:
+            raise ValueError(f"Save version {header['version']} is newer than {SAVE_VERSION}")
+
+        atomic = header.get("version", 0) >= 2
+        sides = {side: ({}, {}) for side in SIDES}
+        batch = []
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                record = _parse(line)
+            except ValueError:
+                break
+            if not atomic:
+                _apply(sides, record)
+            elif record[0] != "commit":
+                batch.append(record)
+            else:
+                for staged in batch:
+                    _apply(sides, staged)
+                batch = []
+
+    return {side: dict(info, buildings=list(buildings.values())) for side, (info, buildings) in sides.items()}
+
+
+class Autosaver:
+    """Saves a GameState every AUTOSAVE_INTERVAL seconds on a background thread.
+
+    The game thread only captures the bases; diffing, encoding and file I/O
+    happen on the saver thread. The first save rewrites the file through
+    write_checkpoint, as does every AUTOSAVE_COMPACT_EVERY-th save or any
+    save once appended records outnumber the live buildings. The rest only
+    append what changed since the previous save.
+    """
+
+    def __init__(self, game_state, filename=AUTOSAVE_FILE, interval=AUTOSAVE_INTERVAL,
+                 compact_every=AUTOSAVE_COMPACT_EVERY):
+        self.game_state = game_state
+        self.filename = filename
+        self.interval = interval
+        self.compact_every = compact_every
+        self.timer = 0.0
+        self.keys = SaveKeys()
+        self.stats = {"checkpoints": 0, "appends": 0, "records": 0}
+
+        self.saved = None
+        self.appends = 0
+        self.appended_records = 0
+
+        self.pending = None
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def update(self, dt):
+        self.timer += dt
+        if self.timer >= self.interval:
+            self.timer = 0.0
+            self.save()
+
+    def save(self):
+        """Capture the game now and hand it to the saver thread, replacing any capture not yet written"""
+        state = capture(self.game_state, self.keys)
+        with self.cond:
+            self.pending = state
+            self.cond.notify()
+
+    def close(self):
+        """Write a final save and stop the saver thread"""
+        self.save()
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and self.running:
+                    self.cond.wait()
+                state = self.pending
+                self.pending = None
+            if state is None:
+                return
+            try:
+                self._write(state)
+            except OSError as e:
+                print(f"Autosave failed: {e}")
+
+    def _write(self, state):
+        live = sum(len(buildings) for _, buildings in state.values())
+        if (self.saved is None or not os.path.exists(self.filename)
+                or self.appends >= self.compact_every or self.appended_records > live):
+            write_checkpoint(self.filename, state)
+            self.appends = 0
+            self.appended_records = 0
+            self.stats["checkpoints"] += 1
+        else:
+            written = append_changes(self.filename, self.saved, state)
+            if written:
+                self.appends += 1
+                self.appended_records += written
+                self.stats["appends"] += 1
+                self.stats["records"] += written
+        self.saved = state
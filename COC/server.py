@@ -0,0 +1,420 @@
+"""
+Dedicated game server for Mini Clans
+Pairs clients into matches and runs each match authoritatively in worker processes
+"""
+
+import argparse
+import asyncio
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import time
+from config import (
+    BUILDINGS, DEFAULT_PORT, SERVER_STATS_INTERVAL, SERVER_TICK_RATE, STATE_SYNC_INTERVAL, TROOPS
+)
+from game_state import Building, GameState
+from protocol import (
+    JSON_LINES_VERSION, PROTOCOL_VERSION, StateSync, StreamDecoder,
+    encode_json_line, encode_message
+)
+
+# Clients send their own base as snapshots too, but the server's copy wins
+SERVER_OWNED_ACTIONS = ("snapshot", "state_delta")
+# Passed on to the other player untouched
+RELAYED_ACTIONS = ("ready_to_attack",)
+# Timestamps a client puts in front of each flush for its peer's latency stats
+IGNORED_ACTIONS = ("sent_at",)
+
+
+class InvalidMessage(ValueError):
+    """A client message the server refuses to apply"""
+
+
+def _position(value, integer=False):
+    """An (x, y) pair of finite numbers, whole numbers when integer is set"""
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise InvalidMessage(f"bad position {value!r}")
+    for v in value:
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v):
+            raise InvalidMessage(f"bad position {value!r}")
+        if integer and v != int(v):
+            raise InvalidMessage(f"bad position {value!r}")
+    if integer:
+        return (int(value[0]), int(value[1]))
+    return (float(value[0]), float(value[1]))
+
+
+class Match:
+    """One authoritative battle between two players.
+
+    Player 0's base is game_state.player_base and player 1's is
+    opponent_base, so player 0's troops are player_troops and player 1's are
+    opponent_troops. Every input is checked the way the client game checks
+    it, applied here and relayed to the other player; anything refused is
+    answered with a rejection carrying the sender's base as the server has
+    it. Base state is pushed to each player's opponent every
+    STATE_SYNC_INTERVAL seconds of simulated time.
+
+    The battle steps by dt, but resources are produced on clock, the wall
+    clock by default, which is the clock clients produce on too: a worker
+    that falls behind its tick rate must not leave a player short of the
+    elixir their own game shows.
+    """
+
+    def __init__(self, match_id, dt, clock=time.time):
+        self.match_id = match_id
+        self.dt = dt
+        self.game_state = GameState(clock=clock)
+        self.syncs = (StateSync(), StateSync())
+        self.sync_timer = 0.0
+        self.ticks = 0
+        self.tick_time = 0.0
+
+    def base(self, player):
+        gs = self.game_state
+        return gs.player_base if player == 0 else gs.opponent_base
+
+    def apply(self, player, msg):
+        """Apply one client message, returns (player, message) pairs to send.
+
+        A message the client game would refuse (unknown types, blocked or
+        unaffordable placements, deploys off the map or without the elixir
+        for them) is answered with reject() instead of being relayed.
+        """
+        try:
+            return self.check_and_apply(player, msg)
+        except InvalidMessage as e:
+            return self.reject(player, msg, e)
+
+    def reject(self, player, msg, error):
+        """Tell player msg was refused, with their base as the server has it to correct theirs"""
+        return [(player, {
+            "action": "rejected",
+            "request": msg if isinstance(msg, dict) else None,
+            "reason": str(error),
+            "base": self.base(player).to_dict()
+        })]
+
+    def check_and_apply(self, player, msg):
+        """apply() without the rejection reply, raises InvalidMessage instead"""
+        if not isinstance(msg, dict):
+            raise InvalidMessage(f"not a message: {msg!r}")
+        action = msg.get("action")
+        if action in SERVER_OWNED_ACTIONS or action in IGNORED_ACTIONS:
+            return []
+        base = self.base(player)
+        if action == "place_building":
+            data = msg.get("building")
+            if not isinstance(data, dict):
+                raise InvalidMessage("place_building without a building")
+            building_type = data.get("type")
+            if building_type not in BUILDINGS or building_type == "TOWNHALL":
+                raise InvalidMessage(f"cannot build {building_type!r}")
+            if data.get("level", 1) != 1:
+                raise InvalidMessage("new buildings start at level 1")
+            position = _position(data.get("position"), integer=True)
+            if not base.can_place_building(position, BUILDINGS[building_type]["size"]):
+                raise InvalidMessage(f"{building_type} does not fit at {position}")
+            if not base.purchase_building(building_type):
+                raise InvalidMessage(f"cannot afford {building_type}")
+            building = Building(building_type, position)
+            base.add_building(building)
+            msg = {"action": "place_building", "building": building.to_dict()}
+        elif action == "deploy_troop":
+            troop_type = msg.get("troop_type")
+            if troop_type not in TROOPS:
+                raise InvalidMessage(f"unknown troop {troop_type!r}")
+            position = _position(msg.get("position"))
+            target = self.base(1 - player)
+            if not (0 <= position[0] < target.width and 0 <= position[1] < target.height):
+                raise InvalidMessage(f"deploy off the map at {position}")
+            cost = TROOPS[troop_type]["cost_elixir"]
+            if base.elixir < cost:
+                raise InvalidMessage(f"not enough elixir for {troop_type}")
+            base.elixir -= cost
+            if player == 0:
+                self.game_state.add_player_troop(position, troop_type)
+            else:
+                self.game_state.add_opponent_troop(position, troop_type)
+            msg = {"action": "deploy_troop", "position": list(position), "troop_type": troop_type}
+        elif action not in RELAYED_ACTIONS:
+            raise InvalidMessage(f"unknown action {action!r}")
+        return [(1 - player, msg)]
+
+    def step(self):
+        """Advance one fixed tick, returns (player, message) pairs to send"""
+        start = time.perf_counter()
+        self.game_state.update(self.dt)
+
+        out = []
+        self.sync_timer += self.dt
+        if self.sync_timer >= STATE_SYNC_INTERVAL:
+            self.sync_timer = 0.0
+            for player in (0, 1):
+                update = self.syncs[player].make_update(self.base(player))
+                if update:
+                    out.append((1 - player, update))
+
+        self.tick_time += time.perf_counter() - start
+        self.ticks += 1
+        return out
+
+
+def worker_main(worker_id, inbox, outbox, tick_rate):
+    """Run every match assigned to this worker at a fixed tick rate.
+
+    inbox carries ("start", match_id), ("input", match_id, player, msg),
+    ("end", match_id) and ("stop",). Each tick's outgoing messages go to
+    outbox as one list, plus a ("stats", ...) report every
+    SERVER_STATS_INTERVAL seconds.
+    """
+    dt = 1.0 / tick_rate
+    matches = {}
+    next_tick = time.perf_counter()
+    next_report = next_tick + SERVER_STATS_INTERVAL
+    report_start = next_tick
+    busy = 0.0
+
+    while True:
+        timeout = max(0.0, next_tick - time.perf_counter())
+        try:
+            item = inbox.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+
+        while item is not None:
+            kind = item[0]
+            if kind == "stop":
+                return
+            if kind == "start":
+                matches[item[1]] = Match(item[1], dt)
+            elif kind == "end":
+                matches.pop(item[1], None)
+            elif kind == "input":
+                match = matches.get(item[1])
+                if match:
+                    # One bad message must not take down every match on this worker
+                    try:
+                        out = match.apply(item[2], item[3])
+                    except Exception as e:
+                        print(f"Match {item[1]}: failed on message from player {item[2]}: {e}")
+                        out = match.reject(item[2], item[3], e)
+                    if out:
+                        outbox.put([("send", item[1], player, msg) for player, msg in out])
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                item = None
+
+        now = time.perf_counter()
+        if now < next_tick:
+            continue
+
+        start = now
+        sends = []
+        for match in matches.values():
+            for player, msg in match.step():
+                sends.append(("send", match.match_id, player, msg))
+        if sends:
+            outbox.put(sends)
+        busy += time.perf_counter() - start
+
+        # Skip ahead rather than bursting if we fell far behind
+        next_tick += dt
+        if time.perf_counter() - next_tick > 5 * dt:
+            next_tick = time.perf_counter() + dt
+
+        if now >= next_report:
+            outbox.put([("stats", worker_id, {
+                "matches": len(matches),
+                "match_tick_ms": {
+                    m.match_id: 1000 * m.tick_time / m.ticks for m in matches.values() if m.ticks
+                },
+                "busy": busy / (now - report_start)
+            })])
+            busy = 0.0
+            report_start = now
+            next_report = now + SERVER_STATS_INTERVAL
+
+
+class ClientConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.protocol = JSON_LINES_VERSION
+        self.match = None
+        self.player = None
+        self.backlog = []
+
+    def send(self, msg):
+        self.writer.write(encode_message(msg, self.protocol))
+
+
+class GameServer:
+    """Accepts clients, pairs them in arrival order and relays between them and the workers"""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, workers=None, tick_rate=SERVER_TICK_RATE):
+        self.host = host
+        self.port = port
+        self.worker_count = workers or os.cpu_count() or 1
+        self.tick_rate = tick_rate
+        self.waiting = None
+        self.matches = {}
+        self.match_ids = itertools.count(1)
+        self.worker_load = [0] * self.worker_count
+        self.worker_stats = {}
+        self.inboxes = []
+        self.outbox = None
+        self.processes = []
+
+    def start_workers(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.outbox = ctx.Queue()
+        for worker_id in range(self.worker_count):
+            inbox = ctx.Queue()
+            process = ctx.Process(
+                target=worker_main,
+                args=(worker_id, inbox, self.outbox, self.tick_rate),
+                daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+
+    def stop_workers(self):
+        for inbox in self.inboxes:
+            inbox.put(("stop",))
+        for process in self.processes:
+            process.join(1.0)
+        # Wake pump_outbox's blocking get so the executor thread can exit
+        self.outbox.put([])
+
+    async def handle_client(self, reader, writer):
+        client = ClientConnection(reader, writer)
+        print(f"Client connected from {writer.get_extra_info('peername')}")
+        self.pair(client)
+
+        decoder = StreamDecoder()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                for msg in decoder.feed(data):
+                    if msg.get("action") == "hello":
+                        version = min(int(msg.get("protocol", JSON_LINES_VERSION)), PROTOCOL_VERSION)
+                        writer.write(encode_json_line({"action": "hello", "protocol": version}))
+                        client.protocol = version
+                    elif client.match is None:
+                        client.backlog.append(msg)
+                    else:
+                        self.forward(client, msg)
+        except Exception as e:
+            print(f"Connection error: {e}")
+        finally:
+            self.disconnect(client)
+
+    def pair(self, client):
+        if self.waiting is None:
+            self.waiting = client
+            return
+
+        other = self.waiting
+        self.waiting = None
+        match_id = next(self.match_ids)
+        worker = self.worker_load.index(min(self.worker_load))
+        self.worker_load[worker] += 1
+        self.matches[match_id] = (worker, [other, client])
+        for player, c in enumerate((other, client)):
+            c.match = match_id
+            c.player = player
+        self.inboxes[worker].put(("start", match_id))
+        print(f"Match {match_id} started on worker {worker}")
+
+        for c in (other, client):
+            for msg in c.backlog:
+                self.forward(c, msg)
+            c.backlog = []
+
+    def forward(self, client, msg):
+        worker, _ = self.matches[client.match]
+        self.inboxes[worker].put(("input", client.match, client.player, msg))
+
+    def disconnect(self, client):
+        if self.waiting is client:
+            self.waiting = None
+        entry = self.matches.pop(client.match, None) if client.match else None
+        if entry:
+            worker, players = entry
+            self.inboxes[worker].put(("end", client.match))
+            self.worker_load[worker] -= 1
+            for c in players:
+                c.writer.close()
+            print(f"Match {client.match} ended")
+        client.writer.close()
+
+    async def pump_outbox(self):
+        """Deliver worker output to clients and collect stats"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, self.outbox.get)
+            for item in batch:
+                if item[0] == "stats":
+                    self.worker_stats[item[1]] = item[2]
+                    continue
+                _, match_id, player, msg = item
+                entry = self.matches.get(match_id)
+                if entry:
+                    entry[1][player].send(msg)
+
+    def report(self):
+        """Summarise per-match tick time and matches per core across workers"""
+        tick_ms = [ms for s in self.worker_stats.values() for ms in s["match_tick_ms"].values()]
+        matches = len(self.matches)
+        budget_ms = 1000.0 / self.tick_rate
+        mean_ms = sum(tick_ms) / len(tick_ms) if tick_ms else 0.0
+        return {
+            "matches": matches,
+            "workers": self.worker_count,
+            "matches_per_core": matches / self.worker_count,
+            "mean_match_tick_ms": mean_ms,
+            "max_match_tick_ms": max(tick_ms, default=0.0),
+            "est_capacity_per_core": budget_ms / mean_ms if mean_ms else None,
+            "worker_busy": {w: s["busy"] for w, s in sorted(self.worker_stats.items())}
+        }
+
+    async def report_loop(self):
+        while True:
+            await asyncio.sleep(SERVER_STATS_INTERVAL)
+            print(self.report())
+
+    async def serve(self):
+        self.start_workers()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, reuse_address=True)
+        print(f"Server started on {self.host}:{self.port} with {self.worker_count} workers")
+        try:
+            async with server:
+                await asyncio.gather(server.serve_forever(), self.pump_outbox(), self.report_loop())
+        finally:
+            self.stop_workers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a dedicated Mini Clans match server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tick-rate", type=int, default=SERVER_TICK_RATE)
+    args = parser.parse_args()
+
+    server = GameServer(args.host, args.port, args.workers, args.tick_rate)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Spatial indexing for Mini Clans
+Uniform-grid buckets used to answer nearest-target queries without scanning every building
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from config import CHUNK_SIZE
+
+INDEX_CELL_SIZE = 4
+
+
+class BuildingGrid:
+    """Uniform grid of live buildings keyed by their anchor position.
+
+    Each entry remembers the order it was first inserted in, so ties between
+    equally distant buildings resolve exactly like a front-to-back scan of
+    the buildings list. reserve() hands out an order without inserting, for
+    buildings that join the list destroyed. A building taken out by
+    remove() keeps its order and gets it back when inserted again; forget()
+    drops it for good.
+    """
+
+    def __init__(self, cell_size=INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.orders = {}
+        self.count = 0
+        self._next_order = 0
+        self._bounds = None
+
+    def _cell_of(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def clear(self):
+        self.cells = {}
+        self.orders = {}
+        self.count = 0
+        self._next_order = 0
+        self._bounds = None
+
+    def reserve(self, building):
+        """The building's tie-break order, handing out the next one if it has none yet"""
+        order = self.orders.get(id(building))
+        if order is None:
+            order = self.orders[id(building)] = self._next_order
+            self._next_order += 1
+        return order
+
+    def insert(self, building):
+        order = self.reserve(building)
+        cell = self._cell_of(building.position[0], building.position[1])
+        self.cells.setdefault(cell, []).append((order, building))
+        self.count += 1
+
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            b = self._bounds
+            b[0] = min(b[0], cell[0])
+            b[1] = min(b[1], cell[1])
+            b[2] = max(b[2], cell[0])
+            b[3] = max(b[3], cell[1])
+
+    def remove(self, building):
+        """Drop a building from the index, returns True if it was present"""
+        cell = self._cell_of(building.position[0], building.position[1])
+        entries = self.cells.get(cell)
+        if not entries:
+            return False
+        for i, (_, other) in enumerate(entries):
+            if other is building:
+                del entries[i]
+                self.count -= 1
+                if not entries:
+                    del self.cells[cell]
+                return True
+        return False
+
+    def forget(self, building):
+        """Remove a building that is leaving the base, along with its order"""
+        self.remove(building)
+        self.orders.pop(id(building), None)
+
+    def clone(self, copies):
+        """The same index over copies of its buildings, copies mapping id(original) to copy"""
+        grid = BuildingGrid(self.cell_size)
+        grid.cells = {cell: [(order, copies[id(building)]) for order, building in entries]
+                      for cell, entries in self.cells.items()}
+        grid.orders = {id(copies[key]): order for key, order in self.orders.items()}
+        grid.count = self.count
+        grid._next_order = self._next_order
+        grid._bounds = list(self._bounds) if self._bounds is not None else None
+        return grid
+
+    def nearest(self, position):
+        """Return the closest live building to position, or None.
+
+        Cells are visited in rings of growing Chebyshev radius around the
+        query cell. A ring r can hold nothing closer than (r - 1) cells, so the
+        search stops as soon as that bound exceeds the best squared distance.
+        Destroyed buildings met along the way are evicted.
+        """
+        if self.count == 0:
+            return None
+
+        px, py = position[0], position[1]
+        cx, cy = self._cell_of(px, py)
+        min_x, min_y, max_x, max_y = self._bounds
+        max_r = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+
+        best = None
+        best_order = None
+        best_d2 = float('inf')
+        size = self.cell_size
+
+        r = 0
+        while r <= max_r:
+            if r > 1:
+                bound = (r - 1) * size
+                if bound * bound > best_d2:
+                    break
+
+            for cell in self._ring(cx, cy, r):
+                entries = self.cells.get(cell)
+                if not entries:
+                    continue
+                dead = None
+                for order, building in entries:
+                    if building.hp <= 0:
+                        if dead is None:
+                            dead = []
+                        dead.append(building)
+                        continue
+                    dx = building.position[0] - px
+                    dy = building.position[1] - py
+                    d2 = dx * dx + dy * dy
+                    if d2 < best_d2 or (d2 == best_d2 and order < best_order):
+                        best_d2 = d2
+                        best_order = order
+                        best = building
+                if dead:
+                    for building in dead:
+                        self.remove(building)
+            r += 1
+
+        return best
+
+    @staticmethod
+    def _ring(cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (x, cy - r)
+            yield (x, cy + r)
+        for y in range(cy - r + 1, cy + r):
+            yield (cx - r, y)
+            yield (cx + r, y)
+
+
+class TroopBuckets:
+    """Uniform grid of troop positions, rebuilt at most once per tick.
+
+    Defenses query it for the closest live troop within their range, touching
+    only the cells that overlap the range circle instead of every troop. The
+    grid is only built on the first query after rebuild(), so ticks where every
+    defense is cooling down cost nothing here.
+    """
+
+    def __init__(self, cell_size=INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.troops = None
+
+    def rebuild(self, troops):
+        self.troops = troops
+        self.cells = None
+
+    def _build(self):
+        cells = {}
+        size = self.cell_size
+        for order, troop in enumerate(self.troops):
+            cell = (int(troop.position[0] // size), int(troop.position[1] // size))
+            bucket = cells.get(cell)
+            if bucket is None:
+                cells[cell] = [(order, troop)]
+            else:
+                bucket.append((order, troop))
+        self.cells = cells
+
+    def nearest_within(self, position, radius):
+        """Closest live troop within radius of position, ties going to the earliest troop"""
+        if self.cells is None:
+            self._build()
+        if not self.cells:
+            return None
+
+        px, py = position[0], position[1]
+        size = self.cell_size
+        min_cx = int((px - radius) // size)
+        max_cx = int((px + radius) // size)
+        min_cy = int((py - radius) // size)
+        max_cy = int((py + radius) // size)
+
+        best = None
+        best_order = None
+        best_d2 = radius * radius
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                bucket = self.cells.get((cx, cy))
+                if not bucket:
+                    continue
+                for order, troop in bucket:
+                    if troop.hp <= 0:
+                        continue
+                    dx = troop.position[0] - px
+                    dy = troop.position[1] - py
+                    d2 = dx * dx + dy * dy
+                    if d2 < best_d2 or (d2 == best_d2 and (best is None or order < best_order)):
+                        best_d2 = d2
+                        best_order = order
+                        best = troop
+        return best
+
+
+class ChunkMap:
+    """Items bucketed by the CHUNK_SIZE chunk holding their anchor tile.
+
+    Lookups return items in the order they were inserted, so anything
+    iterating a subset of chunks sees them in the same order as a scan of the
+    full list would.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def clear(self):
+        self.chunks = {}
+        self.orders = {}
+        self.counter = 0
+
+    def chunk_of(self, position):
+        c = self.chunk_size
+        return (int(position[0] // c), int(position[1] // c))
+
+    def insert(self, item, position):
+        self.counter += 1
+        self.orders[id(item)] = self.counter
+        self.chunks.setdefault(self.chunk_of(position), {})[id(item)] = item
+
+    def remove(self, item, position):
+        key = self.chunk_of(position)
+        bucket = self.chunks.get(key)
+        if bucket is not None:
+            bucket.pop(id(item), None)
+            if not bucket:
+                del self.chunks[key]
+        self.orders.pop(id(item), None)
+
+    def clone(self, copies):
+        """The same buckets over copies of the items, copies mapping id(original) to copy"""
+        other = ChunkMap(self.chunk_size)
+        other.chunks = {key: {id(copies[i]): copies[i] for i in bucket} for key, bucket in self.chunks.items()}
+        other.orders = {id(copies[i]): order for i, order in self.orders.items()}
+        other.counter = self.counter
+        return other
+
+    def in_chunks(self, keys, extra=()):
+        """Items in any of the given chunks, plus extra, in insertion order"""
+        found = {id(item): item for item in extra}
+        for key in keys:
+            bucket = self.chunks.get(key)
+            if bucket:
+                found.update(bucket)
+        orders = self.orders
+        return sorted(found.values(), key=lambda item: orders[id(item)])
+
+    def in_area(self, x0, y0, x1, y1):
+        """Items anchored in chunks overlapping tiles x0 <= x < x1, y0 <= y < y1"""
+        c = self.chunk_size
+        keys = [(cx, cy)
+                for cy in range(int(y0 // c), int((y1 - 1) // c) + 1)
+                for cx in range(int(x0 // c), int((x1 - 1) // c) + 1)]
+        return self.in_chunks(keys)
+
+
+class OccupancyGrid:
+    """Per-tile count of the buildings covering it, stored in CHUNK_SIZE square chunks.
+
+    Counts rather than flags so overlapping buildings (which can arrive over
+    the network or from old saves) free their tiles correctly. Tiles outside
+    the grid are ignored. A chunk's bytearray is only allocated once
+    something is built in it, so a large, mostly empty map costs memory and
+    time in proportion to what is on it rather than to its area. After
+    fork() both grids share their chunks, and whichever writes to a shared
+    chunk first copies it.
+    """
+
+    def __init__(self, width, height, chunk_size=CHUNK_SIZE):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.shared = set()
+
+    def clear(self):
+        self.chunks = {}
+        self.shared = set()
+
+    def fork(self):
+        """A grid with the same counts, sharing every chunk until one side changes it"""
+        other = OccupancyGrid(self.width, self.height, self.chunk_size)
+        other.chunks = dict(self.chunks)
+        self.shared = set(self.chunks)
+        other.shared = set(self.chunks)
+        return other
+
+    def _spans(self, x0, x1, y):
+        """(chunk key, start, end) slices of row y between x0 and x1 inside chunk bytearrays"""
+        c = self.chunk_size
+        cy, ly = divmod(y, c)
+        x = x0
+        while x < x1:
+            cx, lx = divmod(x, c)
+            end = min(x1, (cx + 1) * c)
+            start = ly * c + lx
+            yield (cx, cy), start, start + end - x
+            x = end
+
+    def _mark(self, position, size, delta):
+        x0 = max(0, int(position[0]))
+        y0 = max(0, int(position[1]))
+        x1 = min(self.width, int(position[0]) + size)
+        y1 = min(self.height, int(position[1]) + size)
+        chunks = self.chunks
+        for y in range(y0, y1):
+            for key, start, end in self._spans(x0, x1, y):
+                cells = chunks.get(key)
+                if cells is None:
+                    cells = chunks[key] = bytearray(self.chunk_size * self.chunk_size)
+                elif key in self.shared:
+                    cells = chunks[key] = bytearray(cells)
+                    self.shared.discard(key)
+                for i in range(start, end):
+                    cells[i] += delta
+
+    def add(self, position, size):
+        self._mark(position, size, 1)
+
+    def remove(self, position, size):
+        self._mark(position, size, -1)
+
+    def is_free(self, position, size):
+        """True when every tile of the size x size footprint at position is empty and inside the grid"""
+        x, y = position
+        if x < 0 or x + size > self.width or y < 0 or y + size > self.height:
+            return False
+        chunks = self.chunks
+        for row in range(y, y + size):
+            for key, start, end in self._spans(x, x + size, row):
+                cells = chunks.get(key)
+                if cells is not None and any(cells[start:end]):
+                    return False
+        return True
+
+    def region(self, x0, y0, x1, y1):
+        """Row-major bytearray of the counts for tiles x0 <= x < x1, y0 <= y < y1"""
+        w = x1 - x0
+        out = bytearray(w * (y1 - y0))
+        chunks = self.chunks
+        for y in range(y0, y1):
+            row = (y - y0) * w
+            for key, start, end in self._spans(x0, x1, y):
+                cells = chunks.get(key)
+                if cells is not None:
+                    i = row + (key[0] * self.chunk_size + start % self.chunk_size) - x0
+                    out[i:i + end - start] = cells[start:end]
+        return out
+
+    def valid_anchors(self, size, area=None):
+        """Every (x, y) where a size x size building fits, from one summed-area table.
+
+        area limits the anchors considered to x0 <= x < x1, y0 <= y < y1, so
+        callers that only show part of a large map only pay for that part.
+        """
+        x0, y0, x1, y1 = area or (0, 0, self.width, self.height)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1 = min(self.width, x1 + size - 1)
+        y1 = min(self.height, y1 + size - 1)
+        w, h = x1 - x0, y1 - y0
+        if size > w or size > h:
+            return []
+        cells = self.region(x0, y0, x1, y1)
+
+        if np is not None:
+            occupied = np.frombuffer(cells, dtype=np.uint8).reshape(h, w) > 0
+            sat = np.zeros((h + 1, w + 1), dtype=np.int32)
+            sat[1:, 1:] = occupied.cumsum(axis=0).cumsum(axis=1)
+            window = sat[size:, size:] - sat[:-size, size:] - sat[size:, :-size] + sat[:-size, :-size]
+            ys, xs = np.nonzero(window == 0)
+            return list(zip((xs + x0).tolist(), (ys + y0).tolist()))
+
+        sat = [[0] * (w + 1) for _ in range(h + 1)]
+        for y in range(h):
+            row_sum = 0
+            for x in range(w):
+                row_sum += cells[y * w + x] > 0
+                sat[y + 1][x + 1] = sat[y][x + 1] + row_sum
+        anchors = []
+        for y in range(h - size + 1):
+            for x in range(w - size + 1):
+                if (sat[y + size][x + size] - sat[y][x + size]
+                        - sat[y + size][x] + sat[y][x]) == 0:
+                    anchors.append((x + x0, y + y0))
+        return anchors
@@ -0,0 +1,73 @@
+"""
+Network tests for Mini Clans
+Loopback matches between NetworkManagers and plain sockets
+"""
+
+import json
+import socket
+import time
+
+import pytest
+
+from network import NetworkManager
+from protocol import BINARY_VERSION
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def host():
+    manager = NetworkManager()
+    manager.start_host(0)
+    yield manager
+    manager.close()
+
+
+def port_of(host):
+    return host.server.sockets[0].getsockname()[1]
+
+
+def test_legacy_client_after_binary_client_gets_json_lines(host):
+    client = NetworkManager()
+    assert client.join_game("127.0.0.1", port_of(host))
+    assert wait_for(lambda: host.protocol == BINARY_VERSION)
+    client.close()
+    assert wait_for(lambda: not host.connected)
+
+    # A client from before the binary protocol never says hello
+    with socket.create_connection(("127.0.0.1", port_of(host)), timeout=2.0) as legacy:
+        assert wait_for(host.check_connection)
+        host.send_data({"action": "ready_to_attack"})
+        host.flush()
+        line = legacy.makefile('rb').readline()
+        assert json.loads(line) == {"action": "ready_to_attack"}
+
+        legacy.sendall(b'{"action": "deploy_troop", "position": [1, 2], "troop_type": "ARCHER"}\n')
+        received = []
+        assert wait_for(lambda: received.extend(host.receive_all()) or received)
+        assert received == [{"action": "deploy_troop", "position": [1, 2], "troop_type": "ARCHER"}]
+
+
+def test_sends_in_a_frame_share_one_write(host):
+    client = NetworkManager()
+    assert client.join_game("127.0.0.1", port_of(host))
+    assert wait_for(host.check_connection)
+    messages = [{"action": "deploy_troop", "position": [i, 1.5], "troop_type": "ARCHER"} for i in range(5)]
+    for message in messages:
+        client.send_data(message)
+    time.sleep(0.1)
+    assert host.receive_all() == []
+
+    client.flush()
+    received = []
+    assert wait_for(lambda: received.extend(host.receive_all()) or len(received) == len(messages))
+    assert received == messages
+    assert client.stats["flushes"] == 1
+    client.close()
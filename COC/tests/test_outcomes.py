@@ -0,0 +1,78 @@
+"""
+Outcome cache tests for Mini Clans
+Cache keys ignore building order, and so do the results stored under them
+"""
+
+import pytest
+
+from optimizer import LayoutOptimizer, default_attacks
+from outcomes import OutcomeCache, canonical_layout, config_hash, layout_hash
+
+
+def layouts(count, seed=3):
+    optimizer = LayoutOptimizer(2000, 1000, seed=seed)
+    return [optimizer.to_layout(optimizer.random_genome()) for _ in range(count)]
+
+
+def reordered(layout):
+    layout = dict(layout)
+    layout["buildings"] = layout["buildings"][::-1]
+    return layout
+
+
+@pytest.mark.parametrize("layout", layouts(10))
+def test_hash_ignores_building_order(layout):
+    assert layout_hash(reordered(layout)) == layout_hash(layout)
+    assert canonical_layout(reordered(layout)) == canonical_layout(layout)
+
+
+@pytest.mark.parametrize("layout", layouts(10))
+def test_result_ignores_building_order(layout):
+    attack = default_attacks()[0]
+    results = [OutcomeCache(None).run_attack(l, attack, dt=0.1, max_ticks=900) for l in (layout, reordered(layout))]
+    for result in results:
+        del result["wall_time"], result["ticks_per_second"]
+    assert results[0] == results[1]
+
+
+def test_hash_changes_with_hp_and_level():
+    layout = layouts(1)[0]
+    damaged = dict(layout, buildings=[dict(b) for b in layout["buildings"]])
+    damaged["buildings"][0]["hp"] = 1.0
+    upgraded = dict(layout, buildings=[dict(b) for b in layout["buildings"]])
+    upgraded["buildings"][0]["level"] = 2
+    assert len({layout_hash(layout), layout_hash(damaged), layout_hash(upgraded)}) == 3
+
+
+def test_hash_ignores_how_numbers_are_written():
+    layout = layouts(1)[0]
+    ints = dict(layout, buildings=[dict(b, hp=300) for b in layout["buildings"]])
+    floats = dict(layout, buildings=[
+        dict(b, hp=300.0, level=float(b["level"]), position=[float(v) for v in b["position"]])
+        for b in layout["buildings"]
+    ])
+    assert layout_hash(ints) == layout_hash(floats)
+    assert ([tuple(b["position"]) for b in canonical_layout(ints)["buildings"]]
+            == [tuple(b["position"]) for b in canonical_layout(floats)["buildings"]])
+
+
+def test_cache_hits_on_reordered_layout():
+    layout = layouts(1)[0]
+    attack = default_attacks()[0]
+    cache = OutcomeCache(None)
+    first = cache.run_attack(layout, attack, dt=0.1, max_ticks=300)
+    assert cache.run_attack(reordered(layout), attack, dt=0.1, max_ticks=300) == first
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_is_emptied_when_config_changes(tmp_path, monkeypatch):
+    filename = str(tmp_path / "outcomes.sqlite")
+    cache = OutcomeCache(filename)
+    cache.put("key", {"winner": "defender"})
+    cache.close()
+    assert OutcomeCache(filename, memory_size=0).get("key") == {"winner": "defender"}
+
+    old = config_hash()
+    monkeypatch.setattr("outcomes.STARTING_GOLD", -1)
+    assert config_hash() != old
+    assert OutcomeCache(filename).get("key") is None
@@ -0,0 +1,114 @@
+"""
+Protocol tests for Mini Clans
+Every message survives encoding and decoding, and snapshots keep troop targets live
+"""
+
+import pytest
+
+from game_state import Base, Building, GameState
+from headless import SimClock
+from protocol import (
+    BINARY_VERSION, BUILDING_CODES, BUILDING_STRUCT, FRAME_HEADER, FRAME_MAGIC, JSON_LINES_VERSION, MSG_JSON,
+    MSG_PLACE_BUILDING, StateSync, StreamDecoder, encode_binary, encode_message, encode_sent_at
+)
+
+MESSAGES = [
+    {"action": "place_building", "building": {"type": "CANNON", "position": [3, 4], "level": 2, "hp": 150.1}},
+    {"action": "deploy_troop", "position": [2.1, 7.3], "troop_type": "ARCHER"},
+    {"action": "ready_to_attack"},
+    {"action": "snapshot", "buildings": [
+        {"type": "TOWNHALL", "position": [18, 18], "level": 1, "hp": 1000.0},
+        {"type": "GOLDMINE", "position": [0, 39], "level": 3, "hp": 12.345678901234}
+    ]},
+    {"action": "state_delta", "changes": [[0, 99.9], [7, 0.0]]},
+    {"action": "lockstep_inputs", "tick": 1234, "inputs": [
+        ["deploy_troop", "BARBARIAN", 1.5, 2.75], ["place_building", "STORAGE", 10, 12]
+    ]},
+    {"action": "lockstep_hash", "tick": 60, "hash": 0xFEDCBA9876543210},
+    {"action": "lockstep_start", "base": {"buildings": [], "gold": 500, "elixir": 250, "width": 40, "height": 40}},
+    {"action": "ready_to_attack", "base": {"buildings": []}}
+]
+
+
+@pytest.mark.parametrize("version", [JSON_LINES_VERSION, BINARY_VERSION])
+@pytest.mark.parametrize("message", MESSAGES, ids=[m["action"] for m in MESSAGES])
+def test_round_trip(version, message):
+    assert StreamDecoder().feed(encode_message(message, version)) == [message]
+
+
+def test_stream_split_at_every_byte():
+    data = b''.join(encode_binary(m) for m in MESSAGES) + b''.join(encode_message(m, JSON_LINES_VERSION)
+                                                                   for m in MESSAGES)
+    decoder = StreamDecoder()
+    received = []
+    for i in range(len(data)):
+        received += decoder.feed(data[i:i + 1])
+    assert received == MESSAGES + MESSAGES
+
+
+@pytest.mark.parametrize("line", [
+    b'[1, 2]\n',
+    b'"ready_to_attack"\n',
+    b'{"action": "place_building", "building": {"type": "CANNON", "position": [1, 1], "level": 99}}\n',
+    b'{"action": "snapshot", "buildings": [{"type": "CASTLE", "position": [1, 1]}]}\n',
+    b'{"action": "deploy_troop", "position": [1, 1], "troop_type": "DRAGON"}\n',
+    b'{"action": "lockstep_start", "base": {}}\n'
+])
+def test_malformed_json_messages_are_dropped(line):
+    assert StreamDecoder().feed(line + encode_binary({"action": "ready_to_attack"})) == [{"action": "ready_to_attack"}]
+
+
+def frame(msg_type, payload):
+    return FRAME_HEADER.pack(FRAME_MAGIC, msg_type, len(payload)) + payload
+
+
+def test_malformed_frames_are_dropped():
+    frames = [
+        frame(MSG_PLACE_BUILDING, BUILDING_STRUCT.pack(BUILDING_CODES["CANNON"], 3, 4, 99, 100.0)),
+        frame(MSG_JSON, b'[1, 2]'),
+        frame(MSG_JSON, b'{"action": "snapshot", "buildings": [{"type": "CANNON", "position": [1, 1], "level": 0}]}')
+    ]
+    assert StreamDecoder().feed(b''.join(frames) + encode_binary(MESSAGES[2])) == [MESSAGES[2]]
+
+
+def test_sent_at():
+    assert StreamDecoder().feed(encode_sent_at(1234.5)) == [{"action": "sent_at", "time": 1234.5}]
+
+
+def test_state_sync_sends_snapshot_then_deltas():
+    clock = SimClock()
+    sender = Base(clock)
+    sender.add_building(Building("CANNON", (2, 2)))
+    receiver = Base.from_dict(sender.to_dict(), clock)
+    sync = StateSync()
+
+    first = sync.make_update(sender)
+    assert first["action"] == "snapshot"
+    assert sync.make_update(sender) is None
+
+    sender.buildings[-1].take_damage(100)
+    update = StreamDecoder().feed(encode_binary(sync.make_update(sender)))[0]
+    assert update["action"] == "state_delta"
+    StateSync.apply_update(receiver, update)
+    assert [b.hp for b in receiver.buildings] == [b.hp for b in sender.buildings]
+
+
+def test_snapshot_keeps_troop_targets_on_the_live_base():
+    clock = SimClock()
+    gs = GameState(clock=clock)
+    gs.opponent_base.add_building(Building("CANNON", (2, 2)))
+    sender = Base.from_dict(gs.opponent_base.to_dict(), clock)
+    gs.add_player_troop((7, 5), "BARBARIAN")
+    for _ in range(30):
+        clock.advance(0.05)
+        gs.update(0.05)
+    sync = StateSync()
+
+    StateSync.apply_update(gs.opponent_base, sync.make_update(sender), gs.player_troops)
+    assert gs.player_troops[0].target.owner is gs.opponent_base
+
+    sender.add_building(Building("CANNON", (12, 12)))
+    StateSync.apply_update(gs.opponent_base, sync.make_update(sender), gs.player_troops)
+    target = gs.player_troops[0].target
+    assert target.owner is gs.opponent_base
+    assert target in gs.opponent_base.buildings
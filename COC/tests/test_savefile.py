@@ -0,0 +1,151 @@
+"""
+Save file tests for Mini Clans
+Loading a save, full or incremental, gives back the state that was saved
+"""
+
+import json
+import random
+import time
+
+import pytest
+
+from game_state import Building, GameState
+from headless import SimClock
+from savefile import SIDES, Autosaver, append_changes, capture, load_state
+
+
+def random_game(rng, size=60, count=300):
+    gs = GameState(clock=SimClock(), width=size, height=size)
+    for base in (gs.player_base, gs.opponent_base):
+        for _ in range(count):
+            position = (rng.randrange(size - 1), rng.randrange(size - 1))
+            if base.can_place_building(position, 2):
+                base.add_building(Building(rng.choice(["CANNON", "GOLDMINE", "ELIXIR", "STORAGE"]), position))
+        for building in rng.sample(base.buildings, 10):
+            building.take_damage(rng.uniform(1, 50))
+        base.buildings[1].upgrade()
+    return gs
+
+
+def state(gs):
+    """Both bases as they would read back from JSON"""
+    return json.loads(json.dumps({"player": gs.player_base.to_dict(), "opponent": gs.opponent_base.to_dict()}))
+
+
+def test_save_then_load(tmp_path):
+    gs = random_game(random.Random(0))
+    filename = str(tmp_path / "game.sav")
+    gs.save_game(filename)
+    loaded = GameState(clock=gs.clock)
+    assert loaded.load_game(filename)
+    assert state(loaded) == state(gs)
+
+
+def test_legacy_json_save(tmp_path):
+    gs = random_game(random.Random(1))
+    filename = str(tmp_path / "legacy.json")
+    with open(filename, 'w') as f:
+        json.dump({"player_base": gs.player_base.to_dict(), "opponent_base": gs.opponent_base.to_dict()}, f)
+    loaded = GameState(clock=gs.clock)
+    assert loaded.load_game(filename)
+    assert state(loaded) == state(gs)
+
+
+def test_autosave_appends_match_the_game(tmp_path):
+    rng = random.Random(2)
+    gs = random_game(rng)
+    filename = str(tmp_path / "auto.sav")
+    saver = Autosaver(gs, filename, compact_every=3)
+    for step in range(8):
+        base = gs.player_base
+        for building in rng.sample(base.buildings, 5):
+            building.take_damage(rng.uniform(1, 50))
+        base.remove_building(base.buildings[-1])
+        if base.can_place_building((58, step * 2), 2):
+            base.add_building(Building("STORAGE", (58, step * 2)))
+        saver.save()
+        # Let the saver thread take each capture so none are coalesced
+        while saver.pending is not None:
+            time.sleep(0.001)
+    saver.close()
+    assert saver.stats["appends"] > 0
+    loaded = GameState(clock=gs.clock)
+    assert loaded.load_game(filename)
+    assert state(loaded) == state(gs)
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    gs = random_game(random.Random(3))
+    filename = str(tmp_path / "game.sav")
+    gs.save_game(filename)
+    with open(filename, 'a') as f:
+        f.write('["building","player_base",1,{"ty')
+    assert len(load_state(filename)["player_base"]["buildings"]) == len(gs.player_base.buildings)
+
+
+def changed_save(tmp_path, seed):
+    """A checkpoint of a game plus one appended batch, with the game before and after it"""
+    rng = random.Random(seed)
+    gs = random_game(rng)
+    filename = str(tmp_path / "game.sav")
+    gs.save_game(filename)
+    before = state(gs)
+    old = capture(gs)
+    for building in rng.sample(gs.player_base.buildings, 5):
+        building.take_damage(rng.uniform(1, 50))
+    gs.player_base.remove_building(gs.player_base.buildings[-1])
+    assert append_changes(filename, old, capture(gs)) > 1
+    return gs, filename, before
+
+
+def loaded_state(filename):
+    loaded = GameState(clock=SimClock())
+    assert loaded.load_game(filename)
+    return state(loaded)
+
+
+@pytest.mark.parametrize("keep", [1, 2, -1])
+def test_cut_short_batch_reads_back_as_before(tmp_path, keep):
+    gs, filename, before = changed_save(tmp_path, 4)
+    assert loaded_state(filename) == state(gs)
+    with open(filename) as f:
+        lines = f.readlines()
+    # Drop the batch's commit, or everything after its first records
+    batch_start = lines.index('["commit"]\n') + 1
+    end = len(lines) - 1 if keep == -1 else batch_start + keep
+    with open(filename, 'w') as f:
+        f.writelines(lines[:end])
+    assert loaded_state(filename) == before
+
+
+@pytest.mark.parametrize("bad", [
+    'not json\n',
+    '{"format":"mini-clans-save"}\n',
+    '[]\n',
+    '["building","player_base"]\n',
+    '["building","nobody",3,{}]\n',
+    '["remove","player_base",[1]]\n',
+    '["base","player_base",5]\n',
+])
+def test_malformed_record_ends_the_save(tmp_path, bad):
+    gs, filename, before = changed_save(tmp_path, 5)
+    with open(filename) as f:
+        lines = f.readlines()
+    batch_start = lines.index('["commit"]\n') + 1
+    with open(filename, 'w') as f:
+        f.writelines(lines[:batch_start + 1] + [bad] + lines[batch_start + 1:])
+    assert loaded_state(filename) == before
+
+
+def test_version_1_save_without_commits(tmp_path):
+    gs = random_game(random.Random(6))
+    filename = str(tmp_path / "v1.sav")
+    with open(filename, 'w') as f:
+        f.write(json.dumps({"format": "mini-clans-save", "version": 1}) + '\n')
+        saved = capture(gs)
+        for side in SIDES:
+            info, buildings = saved[side]
+            f.write(json.dumps(["base", side, info]) + '\n')
+            for key, building in buildings.items():
+                f.write(json.dumps(["building", side, key, building]) + '\n')
+    assert loaded_state(filename) == state(gs)
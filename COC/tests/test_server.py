@@ -0,0 +1,108 @@
+"""
+Match server tests for Mini Clans
+Refused inputs are answered with the server's base, and resources follow the clients' clock
+"""
+
+import pytest
+
+from config import BUILDINGS
+from game_state import GameState
+from headless import SimClock
+from protocol import apply_rejection, check_message
+from server import Match
+
+DT = 1.0 / 30
+
+
+def free_spot(base, building_type):
+    size = BUILDINGS[building_type]["size"]
+    return next((x, y) for y in range(base.height) for x in range(base.width)
+                if base.can_place_building((x, y), size))
+
+
+def test_blocked_placement_is_answered_with_the_servers_base():
+    match = Match(1, DT, SimClock())
+    townhall = match.base(0).buildings[0]
+    msg = {"action": "place_building",
+           "building": {"type": "CANNON", "position": list(townhall.position), "level": 1}}
+    [(player, reply)] = match.apply(0, msg)
+    assert player == 0
+    assert reply["action"] == "rejected"
+    assert reply["request"] == msg
+    assert reply["base"] == match.base(0).to_dict()
+    assert check_message(reply) is reply
+
+
+def test_timestamps_and_snapshots_are_not_answered():
+    match = Match(1, DT, SimClock())
+    assert match.apply(0, {"action": "sent_at", "time": 12.5}) == []
+    assert match.apply(0, {"action": "snapshot", "buildings": []}) == []
+
+
+def test_accepted_placement_goes_to_the_other_player():
+    match = Match(1, DT, SimClock())
+    position = free_spot(match.base(0), "CANNON")
+    msg = {"action": "place_building", "building": {"type": "CANNON", "position": list(position), "level": 1}}
+    [(player, reply)] = match.apply(0, msg)
+    assert player == 1
+    assert reply["action"] == "place_building"
+
+
+@pytest.mark.parametrize("engine", ["object", "vector"])
+@pytest.mark.parametrize("stepped", [False, True])
+def test_client_withdraws_a_refused_deploy(engine, stepped):
+    clock = SimClock()
+    match = Match(1, DT, clock)
+    match.base(0).elixir = 0
+    client = GameState(engine=engine, clock=clock)
+    client.selected_troop = "BARBARIAN"
+    client.deploy_troop((1.0, 1.0))
+    client.update(DT)
+    first = client.player_troops[0]
+    client.deploy_troop((2.0, 1.0))
+    if stepped:
+        client.update(DT)
+    assert len(client.player_troops) == 2
+
+    [(player, reply)] = match.apply(0, {"action": "deploy_troop", "position": [2.0, 1.0], "troop_type": "BARBARIAN"})
+    assert player == 0 and reply["action"] == "rejected"
+    assert not match.game_state.player_troops
+
+    apply_rejection(client, reply)
+    assert client.player_troops == [first]
+    assert client.player_base.elixir == 0
+    client.update(DT)
+    assert client.player_troops == [first]
+
+
+def test_client_drops_a_refused_placement():
+    clock = SimClock()
+    match = Match(1, DT, clock)
+    client = GameState(clock=clock)
+    gold = client.player_base.gold
+    client.start_placing_building("CANNON")
+    assert client.place_building(free_spot(client.player_base, "CANNON"))
+    match.base(0).gold = 0
+
+    [(_, reply)] = match.apply(0, {"action": "place_building",
+                                   "building": client.player_base.buildings[-1].to_dict()})
+    assert reply["action"] == "rejected"
+    apply_rejection(client, reply)
+    assert [b.type for b in client.player_base.buildings] == ["TOWNHALL"]
+    assert client.player_base.gold == 0 != gold
+
+
+def test_resources_follow_the_clock_not_the_tick_count():
+    clock = SimClock()
+    match = Match(1, DT, clock)
+    base = match.base(0)
+    position = free_spot(base, "ELIXIR")
+    match.apply(0, {"action": "place_building", "building": {"type": "ELIXIR", "position": list(position)}})
+    base.elixir = 0
+
+    for _ in range(300):
+        match.step()
+    assert base.elixir == 0
+
+    clock.advance(10.0)
+    assert base.elixir > 0
@@ -0,0 +1,71 @@
+"""
+Spatial index tests for Mini Clans
+The target index must always give the building a full scan would
+"""
+
+import random
+
+import pytest
+
+from game_state import Base, Building, Troop
+from headless import SimClock
+
+
+def random_base(rng, size=15, count=8):
+    base = Base(SimClock(), size, size)
+    for _ in range(count):
+        position = (rng.randrange(size - 1), rng.randrange(size - 1))
+        if base.can_place_building(position, 2):
+            base.add_building(Building(rng.choice(["CANNON", "GOLDMINE", "STORAGE"]), position))
+    return base
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_nearest_matches_scan_through_damage_restores_upgrades_and_removals(seed):
+    rng = random.Random(seed)
+    base = random_base(rng)
+    for _ in range(40):
+        building = rng.choice(base.buildings)
+        roll = rng.random()
+        if roll < 0.4:
+            building.set_hp(0)
+        elif roll < 0.7:
+            building.set_hp(building.max_hp / 2)
+        elif roll < 0.8:
+            building.upgrade()
+        elif len(base.buildings) > 1:
+            base.remove_building(building)
+        position = [rng.uniform(0, 15), rng.uniform(0, 15)]
+        troop = Troop("BARBARIAN", position)
+        assert base.index.nearest(position) is troop.find_nearest_building(base.buildings)
+
+
+def test_destroyed_building_comes_back_when_restored():
+    base = Base(SimClock(), town_hall=False)
+    cannon = Building("CANNON", (5, 5))
+    base.add_building(cannon)
+    cannon.set_hp(0)
+    assert base.index.nearest((6, 6)) is None
+    cannon.set_hp(cannon.max_hp)
+    assert base.index.nearest((6, 6)) is cannon
+
+
+def test_upgrade_of_destroyed_building_restores_it():
+    base = Base(SimClock(), town_hall=False)
+    cannon = Building("CANNON", (5, 5))
+    base.add_building(cannon)
+    cannon.set_hp(0)
+    assert cannon.upgrade()
+    assert cannon.hp == cannon.max_hp
+    assert base.index.nearest((6, 6)) is cannon
+
+
+def test_building_added_destroyed_keeps_its_list_position():
+    base = Base(SimClock(), town_hall=False)
+    first = Building.from_dict({"type": "CANNON", "position": [2, 2], "hp": 0})
+    base.add_building(first)
+    base.add_building(Building("CANNON", (6, 2)))
+    first.set_hp(100)
+    troop = Troop("BARBARIAN", [4, 3])
+    assert troop.find_nearest_building(base.buildings) is first
+    assert base.index.nearest([4, 3]) is first
@@ -0,0 +1,77 @@
+"""
+Vector engine tests for Mini Clans
+The NumPy engine must play every battle exactly like the object engine, and faster with many troops
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from benchmarks import bench_ticks
+from game_state import Building, GameState
+from headless import HeadlessRunner, SimClock
+
+
+def random_layout(rng, size=15, count=14):
+    gs = GameState(clock=SimClock(), width=size, height=size)
+    base = gs.opponent_base
+    for _ in range(count):
+        building_type = rng.choice(["CANNON", "GOLDMINE", "ELIXIR", "STORAGE"])
+        position = (rng.randrange(size - 1), rng.randrange(size - 1))
+        if base.can_place_building(position, 2):
+            base.add_building(Building(building_type, position))
+    return base.to_dict()
+
+
+def random_deploys(rng, size=15, count=25):
+    return [{"tick": rng.randrange(200), "troop_type": rng.choice(["BARBARIAN", "ARCHER"]),
+             "position": [rng.choice([0, size - 1]), rng.uniform(0, size - 1)]} for _ in range(count)]
+
+
+def battle_state(gs):
+    buildings = [b.hp for b in gs.player_base.buildings + gs.opponent_base.buildings]
+    troops = [(tuple(t.position), t.hp) for t in gs.player_troops + gs.opponent_troops]
+    return buildings, troops
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_outcomes_match(seed):
+    rng = random.Random(seed)
+    layout = random_layout(rng)
+    deploys = random_deploys(rng)
+    results = [HeadlessRunner(layout, dt=1 / 30, engine=engine).run_attack(deploys, max_ticks=3000, elixir=1e5)
+               for engine in ("object", "vector")]
+    keys = ("winner", "destruction", "ticks", "deployed")
+    assert [results[0][k] for k in keys] == [results[1][k] for k in keys]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_every_tick_matches_with_both_sides_attacking(seed):
+    games = []
+    for engine in ("object", "vector"):
+        rng = random.Random(seed)
+        gs = GameState(engine=engine, clock=SimClock(), width=40, height=40)
+        for base in (gs.player_base, gs.opponent_base):
+            for _ in range(25):
+                position = (rng.randrange(38), rng.randrange(38))
+                building_type = rng.choice(["CANNON", "CANNON", "GOLDMINE", "STORAGE"])
+                if base.can_place_building(position, 2):
+                    base.add_building(Building(building_type, position))
+        for _ in range(40):
+            gs.add_player_troop((rng.uniform(0, 40), rng.choice([0, 39])), rng.choice(["BARBARIAN", "ARCHER"]))
+            gs.add_opponent_troop((rng.choice([0, 39]), rng.uniform(0, 40)), rng.choice(["BARBARIAN", "ARCHER"]))
+        games.append(gs)
+
+    for tick in range(600):
+        for gs in games:
+            gs.clock.advance(1 / 30)
+            gs.update(1 / 30)
+        assert battle_state(games[0]) == battle_state(games[1]), f"diverged at tick {tick}"
+
+
+@pytest.mark.parametrize("buildings", [100, 1000])
+def test_faster_than_object_engine_with_many_troops(buildings):
+    results = {row["engine"]: row["ms_per_tick"] for row in bench_ticks((10000,), (buildings,))}
+    assert results["vector"] < results["object"]
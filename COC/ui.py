@@ -1,285 +1,634 @@
-"""
-UI System for Mini Clans
-Handles all rendering and user interface
-"""
-
-import pygame
-from config import *
-
-class Button:
-    def __init__(self, x, y, width, height, text, action):
-        self.rect = pygame.Rect(x, y, width, height)
-        self.text = text
-        self.action = action
-        self.hovered = False
-        
-    def draw(self, screen, font):
-        color = BUTTON_HOVER if self.hovered else BUTTON_COLOR
-        pygame.draw.rect(screen, color, self.rect)
-        pygame.draw.rect(screen, UI_TEXT_COLOR, self.rect, 2)
-        
-        text_surf = font.render(self.text, True, UI_TEXT_COLOR)
-        text_rect = text_surf.get_rect(center=self.rect.center)
-        screen.blit(text_surf, text_rect)
-        
-    def check_hover(self, pos):
-        self.hovered = self.rect.collidepoint(pos)
-        
-    def is_clicked(self, pos):
-        return self.rect.collidepoint(pos)
-
-class UI:
-    def __init__(self, screen):
-        self.screen = screen
-        self.font = pygame.font.Font(None, 32)
-        self.small_font = pygame.font.Font(None, 24)
-        self.title_font = pygame.font.Font(None, 64)
-        
-        
-        self.menu_buttons = [
-            Button(450, 300, 300, 60, "HOST GAME", "HOST"),
-            Button(450, 380, 300, 60, "JOIN GAME", "JOIN"),
-            Button(450, 460, 300, 60, "QUIT", "QUIT")
-        ]
-        
-        
-        self.build_buttons = [
-            Button(850, 50, 150, 40, "Gold Mine", "BUILD_GOLDMINE"),
-            Button(850, 100, 150, 40, "Elixir Coll.", "BUILD_ELIXIR"),
-            Button(850, 150, 150, 40, "Cannon", "BUILD_CANNON"),
-            Button(850, 200, 150, 40, "Storage", "BUILD_STORAGE"),
-            Button(850, 300, 150, 40, "ATTACK!", "ATTACK")
-        ]
-        
-        
-        self.troop_buttons = [
-            Button(850, 50, 150, 40, "Barbarian", "TROOP_BARBARIAN"),
-            Button(850, 100, 150, 40, "Archer", "TROOP_ARCHER")
-        ]
-        
-    def draw_menu(self):
-        """Draw main menu"""
-        title = self.title_font.render("MINI CLANS", True, UI_TEXT_COLOR)
-        title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 150))
-        self.screen.blit(title, title_rect)
-        
-        subtitle = self.font.render("2-Player Strategy Game", True, UI_TEXT_COLOR)
-        subtitle_rect = subtitle.get_rect(center=(SCREEN_WIDTH // 2, 220))
-        self.screen.blit(subtitle, subtitle_rect)
-        
-        mouse_pos = pygame.mouse.get_pos()
-        for button in self.menu_buttons:
-            button.check_hover(mouse_pos)
-            button.draw(self.screen, self.font)
-            
-    def draw_waiting(self):
-        """Draw waiting screen"""
-        text = self.title_font.render("Waiting for player...", True, UI_TEXT_COLOR)
-        text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-        self.screen.blit(text, text_rect)
-        
-    def draw_build_mode(self, game_state):
-        """Draw build mode interface"""
-        
-        self.draw_grid()
-        
-     
-        for building in game_state.player_base.buildings:
-            self.draw_building(building, (0, 255, 0))
-            
-        if game_state.placing_building:
-            mouse_pos = pygame.mouse.get_pos()
-            grid_pos = self.screen_to_grid(mouse_pos)
-            size = BUILDINGS[game_state.placing_building]["size"]
-            color = BUILDINGS[game_state.placing_building]["color"]
-            self.draw_building_preview(grid_pos, size, color)
-            
-        
-        self.draw_ui_panel(game_state.player_base)
-        
-        
-        mouse_pos = pygame.mouse.get_pos()
-        for button in self.build_buttons:
-            button.check_hover(mouse_pos)
-            button.draw(self.screen, self.small_font)
-            
-        
-        y_offset = 50
-        for button in self.build_buttons[:4]:
-            building_type = button.action.split("_")[1]
-            cost = BUILDINGS[building_type]
-            cost_text = f"G:{cost['cost_gold']} E:{cost['cost_elixir']}"
-            text_surf = self.small_font.render(cost_text, True, UI_TEXT_COLOR)
-            self.screen.blit(text_surf, (1010, y_offset + 10))
-            y_offset += 50
-            
-    def draw_attack_mode(self, game_state):
-        """Draw attack mode interface"""
-       
-        self.draw_grid()
-        
-        for building in game_state.opponent_base.buildings:
-            self.draw_building(building, (255, 0, 0))
-            
-        for troop in game_state.player_troops:
-            self.draw_troop(troop, (0, 255, 0))
-            
-        
-        for troop in game_state.opponent_troops:
-            self.draw_troop(troop, (255, 0, 0))
-            
-        
-        self.draw_ui_panel(game_state.player_base)
-        
-        
-        mouse_pos = pygame.mouse.get_pos()
-        for button in self.troop_buttons:
-            button.check_hover(mouse_pos)
-            button.draw(self.screen, self.small_font)
-            
-        
-        y_offset = 50
-        for button in self.troop_buttons:
-            troop_type = button.action.split("_")[1]
-            cost = TROOPS[troop_type]["cost_elixir"]
-            cost_text = f"E:{cost}"
-            text_surf = self.small_font.render(cost_text, True, UI_TEXT_COLOR)
-            self.screen.blit(text_surf, (1010, y_offset + 10))
-            y_offset += 50
-            
-        inst_text = self.small_font.render("Click to deploy troops", True, UI_TEXT_COLOR)
-        self.screen.blit(inst_text, (850, 200))
-            
-    def draw_grid(self):
-        """Draw the game grid"""
-        for x in range(GRID_WIDTH + 1):
-            start_pos = (GRID_OFFSET_X + x * GRID_SIZE, GRID_OFFSET_Y)
-            end_pos = (GRID_OFFSET_X + x * GRID_SIZE, GRID_OFFSET_Y + GRID_HEIGHT * GRID_SIZE)
-            pygame.draw.line(self.screen, GRID_COLOR, start_pos, end_pos, 1)
-            
-        for y in range(GRID_HEIGHT + 1):
-            start_pos = (GRID_OFFSET_X, GRID_OFFSET_Y + y * GRID_SIZE)
-            end_pos = (GRID_OFFSET_X + GRID_WIDTH * GRID_SIZE, GRID_OFFSET_Y + y * GRID_SIZE)
-            pygame.draw.line(self.screen, GRID_COLOR, start_pos, end_pos, 1)
-            
-    def draw_building(self, building, outline_color):
-        """Draw a building on the grid"""
-        x = GRID_OFFSET_X + building.position[0] * GRID_SIZE
-        y = GRID_OFFSET_Y + building.position[1] * GRID_SIZE
-        size = building.stats["size"] * GRID_SIZE
-        
-        rect = pygame.Rect(x + 2, y + 2, size - 4, size - 4)
-        pygame.draw.rect(self.screen, building.stats["color"], rect)
-        pygame.draw.rect(self.screen, outline_color, rect, 2)
-        
-        hp_percent = building.hp / building.max_hp
-        hp_bar_width = size - 8
-        hp_bar_height = 4
-        
-        pygame.draw.rect(self.screen, (255, 0, 0), 
-                        pygame.Rect(x + 4, y - 8, hp_bar_width, hp_bar_height))
-        pygame.draw.rect(self.screen, (0, 255, 0), 
-                        pygame.Rect(x + 4, y - 8, int(hp_bar_width * hp_percent), hp_bar_height))
-                        
-        level_text = self.small_font.render(str(building.level), True, (255, 255, 255))
-        level_rect = level_text.get_rect(center=(x + size // 2, y + size // 2))
-        self.screen.blit(level_text, level_rect)
-        
-    def draw_building_preview(self, position, size, color):
-        """Draw preview of building placement"""
-        x = GRID_OFFSET_X + position[0] * GRID_SIZE
-        y = GRID_OFFSET_Y + position[1] * GRID_SIZE
-        pixel_size = size * GRID_SIZE
-        
-        rect = pygame.Rect(x + 2, y + 2, pixel_size - 4, pixel_size - 4)
-        
-        s = pygame.Surface((pixel_size - 4, pixel_size - 4))
-        s.set_alpha(128)
-        s.fill(color)
-        self.screen.blit(s, (x + 2, y + 2))
-        pygame.draw.rect(self.screen, GRID_HIGHLIGHT, rect, 3)
-        
-    def draw_troop(self, troop, color):
-        """Draw a troop on the grid"""
-        x = GRID_OFFSET_X + int(troop.position[0] * GRID_SIZE)
-        y = GRID_OFFSET_Y + int(troop.position[1] * GRID_SIZE)
-        
-        pygame.draw.circle(self.screen, troop.stats["color"], (x, y), 8)
-        pygame.draw.circle(self.screen, color, (x, y), 8, 2)
-        
-        hp_percent = troop.hp / troop.stats["hp"]
-        hp_bar_width = 16
-        hp_bar_height = 3
-        
-        pygame.draw.rect(self.screen, (255, 0, 0), 
-                        pygame.Rect(x - 8, y - 15, hp_bar_width, hp_bar_height))
-        pygame.draw.rect(self.screen, (0, 255, 0), 
-                        pygame.Rect(x - 8, y - 15, int(hp_bar_width * hp_percent), hp_bar_height))
-        
-    def draw_ui_panel(self, base):
-        """Draw resource display panel"""
-        panel_rect = pygame.Rect(850, 400, 330, 350)
-        pygame.draw.rect(self.screen, UI_BG_COLOR, panel_rect)
-        pygame.draw.rect(self.screen, UI_TEXT_COLOR, panel_rect, 2)
-        
-        gold_text = self.font.render(f"Gold: {int(base.gold)}", True, GOLD_MINE_COLOR)
-        self.screen.blit(gold_text, (870, 420))
-        
-        elixir_text = self.font.render(f"Elixir: {int(base.elixir)}", True, ELIXIR_COLLECTOR_COLOR)
-        self.screen.blit(elixir_text, (870, 460))
-        
-        building_text = self.small_font.render(f"Buildings: {len(base.buildings)}", True, UI_TEXT_COLOR)
-        self.screen.blit(building_text, (870, 520))
-        
-        tip_lines = [
-            "Build gold mines and",
-            "elixir collectors to",
-            "generate resources.",
-            "",
-            "Build defenses to",
-            "protect your base!"
-        ]
-        
-        y_pos = 570
-        for line in tip_lines:
-            tip_text = self.small_font.render(line, True, (200, 200, 200))
-            self.screen.blit(tip_text, (870, y_pos))
-            y_pos += 25
-        
-    def handle_menu_click(self, pos):
-        """Handle menu button clicks"""
-        for button in self.menu_buttons:
-            if button.is_clicked(pos):
-                if button.action == "QUIT":
-                    import sys
-                    pygame.quit()
-                    sys.exit()
-                return button.action
-        return None
-        
-    def handle_build_click(self, pos):
-        """Handle build mode button clicks"""
-        for button in self.build_buttons:
-            if button.is_clicked(pos):
-                return button.action
-        return None
-        
-    def handle_attack_click(self, pos):
-        """Handle attack mode button clicks"""
-        for button in self.troop_buttons:
-            if button.is_clicked(pos):
-                return button.action
-        return None
-        
-    def screen_to_grid(self, screen_pos):
-        """Convert screen coordinates to grid coordinates"""
-        grid_x = (screen_pos[0] - GRID_OFFSET_X) // GRID_SIZE
-        grid_y = (screen_pos[1] - GRID_OFFSET_Y) // GRID_SIZE
-        return (max(0, min(GRID_WIDTH - 1, grid_x)), 
-                max(0, min(GRID_HEIGHT - 1, grid_y)))
-        
-    def get_ip_input(self):
-        """Get IP address input from user (simple version)"""
-        
-
-        return DEFAULT_HOST
+"""
+UI System for Mini Clans
+Handles all rendering and user interface
+"""
+
+import math
+import pygame
+from collections import OrderedDict
+from config import *
+
+# Past this many dirty regions it is cheaper to repaint their bounding box once
+MAX_DIRTY_RECTS = 48
+TEXT_CACHE_SIZE = 256
+
+class TextCache:
+    """Bounded LRU of rendered text surfaces keyed by font, string and colours"""
+    
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+    def render(self, font, text, color, background=None):
+        key = (id(font), text, color, background)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surf
+            
+        self.misses += 1
+        surf = font.render(text, True, color, background)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+        
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.surfaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class Button:
+    def __init__(self, x, y, width, height, text, action):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.text = text
+        self.action = action
+        self.hovered = False
+        self.surfaces = {}
+        
+    def render_state(self, font, hovered):
+        """Button face with its label for one hover state, rendered once per font"""
+        key = (id(font), hovered)
+        surf = self.surfaces.get(key)
+        if surf is None:
+            surf = pygame.Surface(self.rect.size)
+            local = surf.get_rect()
+            pygame.draw.rect(surf, BUTTON_HOVER if hovered else BUTTON_COLOR, local)
+            pygame.draw.rect(surf, UI_TEXT_COLOR, local, 2)
+            
+            text_surf = font.render(self.text, True, UI_TEXT_COLOR)
+            surf.blit(text_surf, text_surf.get_rect(center=local.center))
+            self.surfaces[key] = surf
+        return surf
+        
+    def draw(self, screen, font):
+        screen.blit(self.render_state(font, self.hovered), self.rect)
+        
+    def check_hover(self, pos):
+        self.hovered = self.rect.collidepoint(pos)
+        
+    def is_clicked(self, pos):
+        return self.rect.collidepoint(pos)
+
+class Camera:
+    """Maps grid tiles to screen pixels inside the map view, with pan and zoom.
+    
+    (x, y) is the tile drawn at the grid origin (GRID_OFFSET_X, GRID_OFFSET_Y)
+    and zoom is pixels per tile, so the default camera draws the map exactly
+    where the fixed grid used to be.
+    """
+    
+    def __init__(self):
+        self.view = pygame.Rect(MAP_VIEW_RECT)
+        self.origin = (GRID_OFFSET_X, GRID_OFFSET_Y)
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = GRID_SIZE
+        self.world = (GRID_WIDTH, GRID_HEIGHT)
+        
+    def key(self):
+        return (self.x, self.y, self.zoom, self.world)
+        
+    def set_world(self, width, height):
+        if (width, height) != self.world:
+            self.world = (width, height)
+            self.clamp()
+        
+    def to_screen(self, gx, gy):
+        return (self.origin[0] + int((gx - self.x) * self.zoom),
+                self.origin[1] + int((gy - self.y) * self.zoom))
+        
+    def to_grid(self, pos):
+        return ((pos[0] - self.origin[0]) / self.zoom + self.x,
+                (pos[1] - self.origin[1]) / self.zoom + self.y)
+        
+    def screen_to_tile(self, pos):
+        gx, gy = self.to_grid(pos)
+        return (max(0, min(self.world[0] - 1, math.floor(gx))),
+                max(0, min(self.world[1] - 1, math.floor(gy))))
+        
+    def visible_area(self):
+        """Tiles x0 <= x < x1, y0 <= y < y1 of the map that fall inside the view"""
+        gx0, gy0 = self.to_grid(self.view.topleft)
+        gx1, gy1 = self.to_grid(self.view.bottomright)
+        return (max(0, math.floor(gx0)), max(0, math.floor(gy0)),
+                min(self.world[0], math.ceil(gx1)), min(self.world[1], math.ceil(gy1)))
+        
+    def map_rect(self):
+        """Screen rect of the whole map, clipped to the view"""
+        x, y = self.to_screen(0, 0)
+        return pygame.Rect(x, y, self.world[0] * self.zoom, self.world[1] * self.zoom).clip(self.view)
+        
+    def clamp(self):
+        """Keep at least one tile of the map inside the view"""
+        z = self.zoom
+        ox, oy = self.origin
+        self.x = max(-(self.view.right - z - ox) / z, min(self.world[0] - (self.view.left + z - ox) / z, self.x))
+        self.y = max(-(self.view.bottom - z - oy) / z, min(self.world[1] - (self.view.top + z - oy) / z, self.y))
+        
+    def pan(self, dx, dy):
+        """Move the map by (dx, dy) screen pixels"""
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self.clamp()
+        
+    def zoom_at(self, steps, pos):
+        """Zoom in (steps > 0) or out around a screen point, keeping the tile under it fixed"""
+        gx, gy = self.to_grid(pos)
+        zoom = int(round(self.zoom * 1.25 ** steps))
+        if zoom == self.zoom:
+            zoom += 1 if steps > 0 else -1
+        self.zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        self.x = gx - (pos[0] - self.origin[0]) / self.zoom
+        self.y = gy - (pos[1] - self.origin[1]) / self.zoom
+        self.clamp()
+
+class DirtyRenderer:
+    """Redraws only the screen regions whose contents changed since the last frame.
+    
+    Each frame is described as a list of items (key, signature, rect, draw,
+    args) in paint order. An item is dirty when it is new, gone, or its
+    signature or rect changed. Dirty regions are restored from the cached
+    background and every item overlapping them is redrawn, clipped to the
+    region and its own rect, so unchanged pixels are never touched.
+    dirty_rects and draw_calls are running totals for the profiler, which
+    while enabled also times every draw as ui.<qualified draw name> and the whole
+    present as ui.present.
+    """
+    
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = None
+        self.background_key = None
+        self.last = {}
+        self.full_redraw = True
+        self.always_full = False
+        self.dirty_rects = 0
+        self.draw_calls = 0
+        self.profiler = None
+        
+    def invalidate(self):
+        self.background_key = None
+        self.full_redraw = True
+        
+    def set_background(self, key, build):
+        if key != self.background_key:
+            if self.profiler is not None and self.profiler.enabled:
+                self.background = self.profiler.measure("ui.background", build)
+            else:
+                self.background = build()
+            self.background_key = key
+            self.last = {}
+            self.full_redraw = True
+        
+    def present(self, items):
+        """Repaint what changed, returns the dirty rects for pygame.display.update"""
+        profiler = self.profiler
+        if profiler is not None and profiler.enabled:
+            return profiler.measure("ui.present", self.repaint, items, profiler)
+        return self.repaint(items, None)
+        
+    def repaint(self, items, profiler):
+        current = {item[0]: (item[1], item[2]) for item in items}
+        
+        if self.full_redraw or self.always_full:
+            dirty = [self.screen.get_rect()]
+            self.full_redraw = False
+        else:
+            dirty = []
+            for key, signature, rect, _, _ in items:
+                prev = self.last.get(key)
+                if prev is None:
+                    dirty.append(rect)
+                elif prev[0] != signature or prev[1] != rect:
+                    dirty.append(rect)
+                    dirty.append(prev[1])
+            for key, (_, rect) in self.last.items():
+                if key not in current:
+                    dirty.append(rect)
+        self.last = current
+        
+        if not dirty:
+            return []
+        if len(dirty) > MAX_DIRTY_RECTS:
+            dirty = [dirty[0].unionall(dirty[1:])]
+        
+        rects = [item[2] for item in items]
+        for region in dirty:
+            self.screen.set_clip(region)
+            self.screen.blit(self.background, region, region)
+            hits = region.collidelistall(rects)
+            for i in hits:
+                _, _, rect, draw, args = items[i]
+                self.screen.set_clip(region.clip(rect))
+                if profiler is not None:
+                    profiler.measure("ui." + draw.__qualname__, draw, *args)
+                else:
+                    draw(*args)
+            self.draw_calls += len(hits) + 1
+        self.screen.set_clip(None)
+        self.dirty_rects += len(dirty)
+        return dirty
+
+class UI:
+    def __init__(self, screen):
+        self.screen = screen
+        self.font = pygame.font.Font(None, 32)
+        self.small_font = pygame.font.Font(None, 24)
+        self.title_font = pygame.font.Font(None, 64)
+        self.mono_font = pygame.font.SysFont("monospace", 14)
+        
+        self.renderer = DirtyRenderer(screen)
+        self.text_cache = TextCache()
+        self.camera = Camera()
+        self.building_sprites = {}
+        self.legal_tiles = (None, None)
+        self.profiler = None
+        
+        
+        self.menu_buttons = [
+            Button(450, 300, 300, 60, "HOST GAME", "HOST"),
+            Button(450, 380, 300, 60, "JOIN GAME", "JOIN"),
+            Button(450, 460, 300, 60, "QUIT", "QUIT")
+        ]
+        
+        
+        self.build_buttons = [
+            Button(850, 50, 150, 40, "Gold Mine", "BUILD_GOLDMINE"),
+            Button(850, 100, 150, 40, "Elixir Coll.", "BUILD_ELIXIR"),
+            Button(850, 150, 150, 40, "Cannon", "BUILD_CANNON"),
+            Button(850, 200, 150, 40, "Storage", "BUILD_STORAGE"),
+            Button(850, 300, 150, 40, "ATTACK!", "ATTACK")
+        ]
+        
+        
+        self.troop_buttons = [
+            Button(850, 50, 150, 40, "Barbarian", "TROOP_BARBARIAN"),
+            Button(850, 100, 150, 40, "Archer", "TROOP_ARCHER")
+        ]
+        
+    def draw_menu(self):
+        """Draw main menu"""
+        self.renderer.invalidate()
+        title = self.text_cache.render(self.title_font, "MINI CLANS", UI_TEXT_COLOR)
+        title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 150))
+        self.screen.blit(title, title_rect)
+        
+        subtitle = self.text_cache.render(self.font, "2-Player Strategy Game", UI_TEXT_COLOR)
+        subtitle_rect = subtitle.get_rect(center=(SCREEN_WIDTH // 2, 220))
+        self.screen.blit(subtitle, subtitle_rect)
+        
+        mouse_pos = pygame.mouse.get_pos()
+        for button in self.menu_buttons:
+            button.check_hover(mouse_pos)
+            button.draw(self.screen, self.font)
+        
+    def draw_waiting(self):
+        """Draw waiting screen"""
+        self.renderer.invalidate()
+        text = self.text_cache.render(self.title_font, "Waiting for player...", UI_TEXT_COLOR)
+        text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
+        self.screen.blit(text, text_rect)
+        
+    def draw_build_mode(self, game_state):
+        """Draw build mode interface, returns the dirty rects to update"""
+        base = game_state.player_base
+        self.camera.set_world(base.width, base.height)
+        self.renderer.set_background(("BUILD", self.camera.key()), self.build_background)
+        items = []
+        
+        if game_state.placing_building:
+            size = BUILDINGS[game_state.placing_building]["size"]
+            items.append(("legal_tiles", (base.revision, size), self.camera.map_rect(),
+                          self.draw_legal_tiles, (base, size)))
+        
+        self.building_items(base, (0, 255, 0), items)
+        
+        if game_state.placing_building:
+            mouse_pos = pygame.mouse.get_pos()
+            grid_pos = self.screen_to_grid(mouse_pos)
+            size = BUILDINGS[game_state.placing_building]["size"]
+            color = BUILDINGS[game_state.placing_building]["color"]
+            rect = self.grid_rect(grid_pos, size).clip(self.camera.view)
+            items.append(("preview", (grid_pos, color), rect,
+                          self.draw_building_preview, (grid_pos, size, color)))
+        
+        self.panel_items(game_state.player_base, items)
+        self.button_items(self.build_buttons, items)
+        self.profiler_items(items)
+        return self.renderer.present(items)
+        
+    def draw_attack_mode(self, game_state):
+        """Draw attack mode interface, returns the dirty rects to update"""
+        base = game_state.opponent_base
+        self.camera.set_world(base.width, base.height)
+        self.renderer.set_background(("ATTACK", self.camera.key()), self.attack_background)
+        items = []
+        
+        self.building_items(base, (255, 0, 0), items)
+        
+        for troop in game_state.player_troops:
+            self.add_visible(items, self.troop_item(troop, (0, 255, 0)))
+        
+        
+        for troop in game_state.opponent_troops:
+            self.add_visible(items, self.troop_item(troop, (255, 0, 0)))
+        
+        self.panel_items(game_state.player_base, items)
+        self.button_items(self.troop_buttons, items)
+        self.profiler_items(items)
+        return self.renderer.present(items)
+        
+    def build_background(self):
+        """Everything in build mode that never changes: grid, panel, cost labels"""
+        surface = pygame.Surface(self.screen.get_size())
+        surface.fill(BACKGROUND_COLOR)
+        self.draw_grid(surface)
+        self.draw_panel_background(surface)
+        
+        y_offset = 50
+        for button in self.build_buttons[:4]:
+            building_type = button.action.split("_")[1]
+            cost = BUILDINGS[building_type]
+            cost_text = f"G:{cost['cost_gold']} E:{cost['cost_elixir']}"
+            text_surf = self.text_cache.render(self.small_font, cost_text, UI_TEXT_COLOR)
+            surface.blit(text_surf, (1010, y_offset + 10))
+            y_offset += 50
+        return surface
+        
+    def attack_background(self):
+        """Everything in attack mode that never changes: grid, panel, costs, instructions"""
+        surface = pygame.Surface(self.screen.get_size())
+        surface.fill(BACKGROUND_COLOR)
+        self.draw_grid(surface)
+        self.draw_panel_background(surface)
+        
+        y_offset = 50
+        for button in self.troop_buttons:
+            troop_type = button.action.split("_")[1]
+            cost = TROOPS[troop_type]["cost_elixir"]
+            cost_text = f"E:{cost}"
+            text_surf = self.text_cache.render(self.small_font, cost_text, UI_TEXT_COLOR)
+            surface.blit(text_surf, (1010, y_offset + 10))
+            y_offset += 50
+        
+        inst_text = self.text_cache.render(self.small_font, "Click to deploy troops", UI_TEXT_COLOR)
+        surface.blit(inst_text, (850, 200))
+        return surface
+        
+    def draw_grid(self, surface=None):
+        """Draw the grid lines of the part of the map inside the camera view"""
+        surface = surface or self.screen
+        camera = self.camera
+        x0, y0, x1, y1 = camera.visible_area()
+        left, top = camera.to_screen(x0, y0)
+        right, bottom = camera.to_screen(x1, y1)
+        surface.set_clip(camera.view)
+        for x in range(x0, x1 + 1):
+            sx = camera.to_screen(x, 0)[0]
+            pygame.draw.line(surface, GRID_COLOR, (sx, top), (sx, bottom), 1)
+        for y in range(y0, y1 + 1):
+            sy = camera.to_screen(0, y)[1]
+            pygame.draw.line(surface, GRID_COLOR, (left, sy), (right, sy), 1)
+        surface.set_clip(None)
+        
+    def grid_rect(self, position, size):
+        x, y = self.camera.to_screen(position[0], position[1])
+        return pygame.Rect(x, y, size * self.camera.zoom, size * self.camera.zoom)
+        
+    def add_visible(self, items, item):
+        """Append item with its rect clipped to the map view, or drop it if it is off screen"""
+        rect = item[2].clip(self.camera.view)
+        if rect.width and rect.height:
+            items.append((item[0], item[1], rect, item[3], item[4]))
+        
+    def building_items(self, base, outline_color, items):
+        """Items for the buildings inside the camera view, looked up by chunk rather than scanned"""
+        for building in base.buildings_in_area(*self.camera.visible_area()):
+            self.add_visible(items, self.building_item(building, outline_color))
+        
+    def building_sprite(self, building, outline_color):
+        """Body, outline and level label for a building type/level at the current zoom, rendered once"""
+        zoom = self.camera.zoom
+        key = (building.type, building.level, outline_color, zoom)
+        sprite = self.building_sprites.get(key)
+        if sprite is None:
+            size = building.stats["size"] * zoom
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            rect = pygame.Rect(2, 2, size - 4, size - 4)
+            pygame.draw.rect(sprite, building.stats["color"], rect)
+            pygame.draw.rect(sprite, outline_color, rect, 2)
+            if zoom * 2 >= GRID_SIZE:
+                level_text = self.text_cache.render(self.small_font, str(building.level), (255, 255, 255))
+                sprite.blit(level_text, level_text.get_rect(center=(size // 2, size // 2)))
+            self.building_sprites[key] = sprite
+        return sprite
+        
+    def building_bar(self, building):
+        """(x offset, y offset, width, height) of a building's hp bar at the current zoom"""
+        scale = self.camera.zoom / GRID_SIZE
+        pad = int(4 * scale)
+        return (pad, int(8 * scale), building.stats["size"] * self.camera.zoom - 2 * pad,
+                max(1, int(4 * scale)))
+        
+    def building_item(self, building, outline_color):
+        size = building.stats["size"] * self.camera.zoom
+        _, bar_y, bar_width, _ = self.building_bar(building)
+        hp_width = int(bar_width * building.hp / building.max_hp)
+        x, y = self.camera.to_screen(building.position[0], building.position[1])
+        rect = pygame.Rect(x, y - bar_y, size, size + bar_y)
+        signature = (building.type, building.level, outline_color, hp_width)
+        return (id(building), signature, rect, self.draw_building, (building, outline_color))
+        
+    def draw_building(self, building, outline_color):
+        """Draw a building on the grid"""
+        x, y = self.camera.to_screen(building.position[0], building.position[1])
+        
+        self.screen.blit(self.building_sprite(building, outline_color), (x, y))
+        
+        hp_percent = building.hp / building.max_hp
+        bar_x, bar_y, hp_bar_width, hp_bar_height = self.building_bar(building)
+        
+        pygame.draw.rect(self.screen, (255, 0, 0),
+                        pygame.Rect(x + bar_x, y - bar_y, hp_bar_width, hp_bar_height))
+        pygame.draw.rect(self.screen, (0, 255, 0),
+                        pygame.Rect(x + bar_x, y - bar_y, int(hp_bar_width * hp_percent), hp_bar_height))
+        
+    def draw_legal_tiles(self, base, size):
+        """Shade every visible tile where the building being placed could be anchored"""
+        camera = self.camera
+        key = (id(base), base.revision, size, camera.key())
+        if self.legal_tiles[0] != key:
+            view = camera.view
+            zoom = camera.zoom
+            overlay = pygame.Surface(view.size, pygame.SRCALPHA)
+            for x, y in base.valid_placements(size, camera.visible_area()):
+                sx, sy = camera.to_screen(x, y)
+                overlay.fill((255, 255, 0, 48), pygame.Rect(sx - view.x + 1, sy - view.y + 1,
+                                                            zoom - 1, zoom - 1))
+            self.legal_tiles = (key, overlay)
+        self.screen.blit(self.legal_tiles[1], camera.view)
+        
+    def draw_building_preview(self, position, size, color):
+        """Draw preview of building placement"""
+        x, y = self.camera.to_screen(position[0], position[1])
+        pixel_size = size * self.camera.zoom
+        
+        rect = pygame.Rect(x + 2, y + 2, pixel_size - 4, pixel_size - 4)
+        
+        s = pygame.Surface((pixel_size - 4, pixel_size - 4))
+        s.set_alpha(128)
+        s.fill(color)
+        self.screen.blit(s, (x + 2, y + 2))
+        pygame.draw.rect(self.screen, GRID_HIGHLIGHT, rect, 3)
+        
+    def troop_shape(self):
+        """(radius, hp bar y offset, hp bar height) of troops at the current zoom"""
+        scale = self.camera.zoom / GRID_SIZE
+        return (max(2, int(8 * scale)), int(15 * scale), max(1, int(3 * scale)))
+        
+    def troop_item(self, troop, color):
+        x, y = self.camera.to_screen(troop.position[0], troop.position[1])
+        radius, bar_y, _ = self.troop_shape()
+        hp_width = int(2 * radius * troop.hp / troop.stats["hp"])
+        rect = pygame.Rect(x - radius - 1, y - bar_y - 1, 2 * radius + 3, bar_y + radius + 3)
+        return (id(troop), (troop.type, color, hp_width), rect, self.draw_troop, (troop, color))
+        
+    def draw_troop(self, troop, color):
+        """Draw a troop on the grid"""
+        x, y = self.camera.to_screen(troop.position[0], troop.position[1])
+        radius, bar_y, hp_bar_height = self.troop_shape()
+        
+        pygame.draw.circle(self.screen, troop.stats["color"], (x, y), radius)
+        pygame.draw.circle(self.screen, color, (x, y), radius, 2)
+        
+        hp_percent = troop.hp / troop.stats["hp"]
+        hp_bar_width = 2 * radius
+        
+        pygame.draw.rect(self.screen, (255, 0, 0),
+                        pygame.Rect(x - radius, y - bar_y, hp_bar_width, hp_bar_height))
+        pygame.draw.rect(self.screen, (0, 255, 0),
+                        pygame.Rect(x - radius, y - bar_y, int(hp_bar_width * hp_percent), hp_bar_height))
+        
+    def draw_panel_background(self, surface):
+        """Draw the static part of the resource panel: frame and tips"""
+        panel_rect = pygame.Rect(850, 400, 330, 350)
+        pygame.draw.rect(surface, UI_BG_COLOR, panel_rect)
+        pygame.draw.rect(surface, UI_TEXT_COLOR, panel_rect, 2)
+        
+        tip_lines = [
+            "Build gold mines and",
+            "elixir collectors to",
+            "generate resources.",
+            "",
+            "Build defenses to",
+            "protect your base!"
+        ]
+        
+        y_pos = 570
+        for line in tip_lines:
+            tip_text = self.text_cache.render(self.small_font, line, (200, 200, 200))
+            surface.blit(tip_text, (870, y_pos))
+            y_pos += 25
+        
+    def text_item(self, key, font, text, color, pos):
+        """Text drawn from the LRU cache, so it is only re-rendered when the string changes"""
+        surf = self.text_cache.render(font, text, color)
+        rect = surf.get_rect(topleft=pos)
+        return (key, text, rect, self.screen.blit, (surf, pos))
+        
+    def panel_items(self, base, items):
+        """Resource readouts drawn over the cached panel"""
+        items.append(self.text_item("gold", self.font, f"Gold: {int(base.gold)}",
+                                    GOLD_MINE_COLOR, (870, 420)))
+        items.append(self.text_item("elixir", self.font, f"Elixir: {int(base.elixir)}",
+                                    ELIXIR_COLLECTOR_COLOR, (870, 460)))
+        items.append(self.text_item("buildings", self.small_font, f"Buildings: {len(base.buildings)}",
+                                    UI_TEXT_COLOR, (870, 520)))
+        
+    def profiler_items(self, items):
+        """The profiler overlay, drawn over the top left of the map while the profiler is on"""
+        if self.profiler is None or not self.profiler.enabled:
+            return
+        for i, line in enumerate(self.profiler.overlay_lines()):
+            surf = self.text_cache.render(self.mono_font, line, UI_TEXT_COLOR, UI_BG_COLOR)
+            pos = (MAP_VIEW_RECT[0] + 5, MAP_VIEW_RECT[1] + 5 + i * surf.get_height())
+            items.append((("profiler", i), line, surf.get_rect(topleft=pos), self.screen.blit, (surf, pos)))
+        
+    def button_items(self, buttons, items):
+        mouse_pos = pygame.mouse.get_pos()
+        for button in buttons:
+            button.check_hover(mouse_pos)
+            items.append((button.action, button.hovered, button.rect,
+                          button.draw, (self.screen, self.small_font)))
+        
+    def draw_ui_panel(self, base):
+        """Draw resource display panel"""
+        self.draw_panel_background(self.screen)
+        items = []
+        self.panel_items(base, items)
+        for _, _, _, draw, args in items:
+            draw(*args)
+        
+    def handle_menu_click(self, pos):
+        """Handle menu button clicks"""
+        for button in self.menu_buttons:
+            if button.is_clicked(pos):
+                if button.action == "QUIT":
+                    import sys
+                    pygame.quit()
+                    sys.exit()
+                return button.action
+        return None
+        
+    def handle_build_click(self, pos):
+        """Handle build mode button clicks"""
+        for button in self.build_buttons:
+            if button.is_clicked(pos):
+                return button.action
+        return None
+        
+    def handle_attack_click(self, pos):
+        """Handle attack mode button clicks"""
+        for button in self.troop_buttons:
+            if button.is_clicked(pos):
+                return button.action
+        return None
+        
+    def screen_to_grid(self, screen_pos):
+        """Convert screen coordinates to grid coordinates"""
+        return self.camera.screen_to_tile(screen_pos)
+        
+    def handle_camera_event(self, event):
+        """Zoom with the mouse wheel and pan by dragging with the right or middle button"""
+        if event.type == pygame.MOUSEWHEEL:
+            mouse_pos = pygame.mouse.get_pos()
+            if self.camera.view.collidepoint(mouse_pos):
+                self.camera.zoom_at(event.y, mouse_pos)
+                return True
+        elif event.type == pygame.MOUSEMOTION and (event.buttons[1] or event.buttons[2]):
+            self.camera.pan(*event.rel)
+            return True
+        return False
+        
+    def update_camera(self, dt):
+        """Pan with the arrow keys"""
+        keys = pygame.key.get_pressed()
+        dx = keys[pygame.K_LEFT] - keys[pygame.K_RIGHT]
+        dy = keys[pygame.K_UP] - keys[pygame.K_DOWN]
+        if dx or dy:
+            step = CAMERA_PAN_SPEED * dt
+            self.camera.pan(dx * step, dy * step)
+        
+    def get_ip_input(self):
+        """Get IP address input from user (simple version)"""
+        
+        
+        return DEFAULT_HOST
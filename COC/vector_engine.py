@@ -0,0 +1,430 @@
+"""
+Vectorized battle simulation for Mini Clans
+Structure-of-arrays troop and building state stepped with NumPy batch operations
+"""
+
+import numpy as np
+from config import TROOP_PATHING
+from pathing import FLOW_FIELD_CACHE_SIZE
+
+# Battles play out exactly as with the object engine for the same inputs:
+# troops act in list order with the same arithmetic, and a building falling
+# mid-tick is seen by the troops after it that same tick (see advance).
+
+
+class BuildingArrays:
+    """Positions and hp of one base's buildings, in buildings-list order.
+
+    Positions are only rebuilt when the base's revision changes. Hit points are
+    re-read every tick because Building objects stay the source of truth for
+    them (upgrades and repairs happen outside the simulation).
+    """
+
+    def __init__(self):
+        self.base = None
+        self.revision = -1
+        self.buildings = []
+        self.slots = {}
+        self.pos = np.zeros((0, 2))
+        self.hp = np.zeros(0)
+
+    def sync(self, base):
+        """Rebuild from base when its layout changed.
+
+        Returns an array mapping old indices to new ones (-1 when a building
+        left the base), or None when nothing changed.
+        """
+        if base is self.base and base.revision == self.revision:
+            self.hp = np.fromiter((b.hp for b in self.buildings), dtype=float, count=len(self.buildings))
+            return None
+
+        old = self.buildings
+        self.base = base
+        self.revision = base.revision
+        self.buildings = list(base.buildings)
+        self.pos = np.array([b.position for b in self.buildings], dtype=float).reshape(-1, 2)
+        self.hp = np.array([b.hp for b in self.buildings], dtype=float)
+
+        self.slots = {id(b): i for i, b in enumerate(self.buildings)}
+        return np.array([self.slots.get(id(b), -1) for b in old] + [-1], dtype=np.intp)
+
+    def write_back(self, indices):
+        for i in indices.tolist():
+            self.buildings[i].set_hp(float(self.hp[i]))
+
+
+class TroopArrays:
+    """One side's troops as parallel arrays, plus the Troop objects they mirror"""
+
+    def __init__(self):
+        self.troops = []
+        self.pending = []
+        self.pos = np.zeros((0, 2))
+        self.hp = np.zeros(0)
+        self.damage = np.zeros(0)
+        self.speed = np.zeros(0)
+        self.range = np.zeros(0)
+        self.target = np.zeros(0, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.troops) + len(self.pending)
+
+    def append(self, troop):
+        self.pending.append(troop)
+
+    def flush(self):
+        """Move troops deployed since the last tick into the arrays in one go"""
+        if not self.pending:
+            return
+        new = self.pending
+        self.pending = []
+        self.troops.extend(new)
+        self.pos = np.concatenate([self.pos, np.array([t.position for t in new], dtype=float)])
+        self.hp = np.concatenate([self.hp, [t.hp for t in new]])
+        self.damage = np.concatenate([self.damage, [t.stats["damage"] for t in new]])
+        self.speed = np.concatenate([self.speed, [t.stats["speed"] for t in new]])
+        self.range = np.concatenate([self.range, [t.stats["range"] for t in new]])
+        self.target = np.concatenate([self.target, np.full(len(new), -1, dtype=np.intp)])
+
+    def remove(self, troop):
+        """Drop one troop, whether or not it has reached the arrays yet"""
+        if any(t is troop for t in self.pending):
+            self.pending = [t for t in self.pending if t is not troop]
+        else:
+            self.keep(np.array([t is not troop for t in self.troops], dtype=bool))
+
+    def compact(self):
+        """Drop dead troops from every array with a single mask, returns the count removed"""
+        alive = self.hp > 0
+        if alive.all():
+            return 0
+        self.keep(alive)
+        return int((~alive).sum())
+
+    def keep(self, mask):
+        self.troops = [t for t, keep in zip(self.troops, mask.tolist()) if keep]
+        self.pos = self.pos[mask]
+        self.hp = self.hp[mask]
+        self.damage = self.damage[mask]
+        self.speed = self.speed[mask]
+        self.range = self.range[mask]
+        self.target = self.target[mask]
+
+    def write_back(self):
+        for troop, pos, hp in zip(self.troops, self.pos.tolist(), self.hp.tolist()):
+            troop.position = pos
+            troop.hp = hp
+
+
+class Hits:
+    """The hits of one run on each target, landing one after another in troop order.
+
+    Building.take_damage subtracts each hit in turn, so every target's hp is
+    a running subtraction over its attackers. Attackers are grouped by
+    target and the k-th hit of every group is subtracted in one array
+    operation; the few groups larger than BIG_GROUP use one accumulate
+    each instead.
+    """
+
+    BIG_GROUP = 32
+
+    def __init__(self, attackers, targets, hits, hp):
+        n = attackers.size
+        order = np.argsort(targets, kind='stable')
+        self.troops = attackers[order]
+        self.targets = targets[order]
+        hits = hits[order]
+        first = np.ones(n, dtype=bool)
+        first[1:] = self.targets[1:] != self.targets[:-1]
+        self.starts = np.flatnonzero(first)
+        self.sizes = np.diff(np.append(self.starts, n))
+        self.group_targets = self.targets[self.starts]
+
+        running = np.empty(n)
+        current = hp[self.group_targets]
+        big = self.sizes > self.BIG_GROUP
+        for g in np.flatnonzero(big).tolist():
+            s = self.starts[g]
+            running[s:s + self.sizes[g]] = np.subtract.accumulate(
+                np.concatenate(([current[g]], hits[s:s + self.sizes[g]])))[1:]
+        small = np.flatnonzero(~big)
+        for k in range(int(self.sizes[small].max()) if small.size else 0):
+            small = small[self.sizes[small] > k]
+            at = self.starts[small] + k
+            current[small] = current[small] - hits[at]
+            running[at] = current[small]
+        self.running = running
+
+    def falls(self):
+        """(building, troop) for each target that falls, with the troop whose hit fells it, in troop order"""
+        fallen = np.flatnonzero(self.running <= 0)
+        if fallen.size == 0:
+            return []
+        # Hp only goes down, so a target's first fallen entry is its first fall
+        first = fallen[np.append(True, self.targets[fallen[1:]] != self.targets[fallen[:-1]])]
+        order = np.argsort(self.troops[first])
+        return list(zip(self.targets[first][order].tolist(), self.troops[first][order].tolist()))
+
+    def land(self, end, hp):
+        """Write the hp left by the hits of troops before end into hp, returns the buildings hit"""
+        if self.troops.size == 0:
+            return self.group_targets
+        landed = np.add.reduceat((self.troops < end).astype(np.intp), self.starts)
+        hit = landed > 0
+        targets = self.group_targets[hit]
+        hp[targets] = self.running[self.starts[hit] + landed[hit] - 1]
+        return targets
+
+
+class FieldAtlas:
+    """Flow fields packed into one array, so every mover looks up its waypoint at once.
+
+    Fields never change once built, so each is copied in the first time a
+    run uses it and found again by identity. trim() starts over once far
+    more fields are packed than the base's cache can hold.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.slots = {}
+        self.fields = []
+        self.steps = np.zeros(0, dtype=np.int32)
+        self.used = 0
+        self.columns = [[], [], [], [], []]
+        self.arrays = None
+
+    def trim(self, capacity):
+        if len(self.fields) > 2 * capacity:
+            self.clear()
+
+    def slot(self, field):
+        slot = self.slots.get(id(field))
+        if slot is not None:
+            return slot
+        step = np.frombuffer(field.step, dtype=np.int32)
+        if self.used + step.size > self.steps.size:
+            grown = np.empty(max(2 * self.steps.size, self.used + step.size), dtype=np.int32)
+            grown[:self.used] = self.steps[:self.used]
+            self.steps = grown
+        self.steps[self.used:self.used + step.size] = step
+        slot = self.slots[id(field)] = len(self.fields)
+        # Holding the field keeps its id from being reused while it is packed
+        self.fields.append(field)
+        for column, value in zip(self.columns, (field.x0, field.y0, field.width, field.height, self.used)):
+            column.append(value)
+        self.used += step.size
+        self.arrays = None
+        return slot
+
+    def waypoints(self, slots, positions):
+        """FlowField.waypoints for each row's field, plus every row's field window as (x0, y0, x1, y1)"""
+        if self.arrays is None:
+            self.arrays = [np.array(column, dtype=np.intp) for column in self.columns]
+        x0, y0, width, height, offset = (column[slots] for column in self.arrays)
+        tiles = np.floor(positions).astype(np.intp)
+        tx = tiles[:, 0] - x0
+        ty = tiles[:, 1] - y0
+        inside = (tx >= 0) & (tx < width) & (ty >= 0) & (ty < height)
+        index = np.where(inside, ty * width + tx, 0)
+        step = self.steps[offset + index]
+        valid = inside & (step >= 0) & (step != index)
+        points = np.empty_like(positions)
+        points[:, 0] = x0 + step % width + 0.5
+        points[:, 1] = y0 + step // width + 0.5
+        return points, valid, (x0, y0, x0 + width, y0 + height)
+
+
+class BattleSide:
+    """A group of troops attacking one base"""
+
+    def __init__(self):
+        self.troops = TroopArrays()
+        self.buildings = BuildingArrays()
+        self.atlas = FieldAtlas()
+
+    def step(self, dt, base):
+        troops = self.troops
+        buildings = self.buildings
+
+        troops.flush()
+        remap = buildings.sync(base)
+        if remap is not None:
+            troops.target = remap[troops.target]
+
+        self.advance(dt, base)
+        self.defend(dt, base)
+        troops.compact()
+
+    def advance(self, dt, base):
+        """Re-target, move and attack with every troop, with the same results as the object engine.
+
+        The object engine updates troops one at a time, so once a building
+        falls the troops after it see it destroyed. Only the troops after it
+        that target it, or whose flow field covers it, can act differently,
+        so each run is done with array operations up to the first such troop
+        and the next run starts there. Most ticks take a single run however
+        many buildings fall.
+        """
+        count = len(self.troops.troops)
+        if count == 0 or len(self.buildings.buildings) == 0:
+            return
+        if TROOP_PATHING == "flow":
+            self.atlas.trim(max(FLOW_FIELD_CACHE_SIZE, len(base.buildings)))
+        start = 0
+        while start < count:
+            start = self.advance_run(dt, base, start)
+
+    def advance_run(self, dt, base, start):
+        """Advance troops from start up to the first one a fallen building affects, returns where the next run starts"""
+        troops = self.troops
+        buildings = self.buildings
+        count = len(troops.troops)
+        rows = np.arange(start, count)
+
+        # Re-target every troop whose target is missing or destroyed through
+        # the base's index, as Troop.update does. Troops past the end of this
+        # run keep a valid choice: losing a building only changes the
+        # nearest one if it was that building, and then they target a fallen
+        # building and go to the next run.
+        target = troops.target[start:]
+        target_hp = np.where(target >= 0, buildings.hp[target], 0.0)
+        needs = rows[target_hp <= 0]
+        if needs.size:
+            self.retarget(base, needs)
+
+        active = rows[troops.target[start:] >= 0]
+        if active.size == 0:
+            return count
+
+        target = troops.target[active]
+        delta = buildings.pos[target] - troops.pos[active]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        in_range = dist <= troops.range[active]
+
+        moving = ~in_range & (dist > 0)
+        movers = active[moving]
+        delta = delta[moving]
+        dist = dist[moving]
+        windows = None
+        if TROOP_PATHING == "flow" and movers.size:
+            delta, dist, windows = self.path_deltas(base, movers, delta, dist)
+
+        attackers = active[in_range]
+        hits = Hits(attackers, troops.target[attackers], troops.damage[attackers] * dt, buildings.hp)
+
+        # A fallen building changes what the troops after it do if they
+        # target it or their flow field's window covers it
+        end = count
+        for building, troop in hits.falls():
+            if troop >= end:
+                break
+            later = (target == building) & (active > troop)
+            if later.any():
+                end = min(end, int(active[later.argmax()]))
+            if windows is not None:
+                x, y = buildings.buildings[building].position
+                size = buildings.buildings[building].stats["size"]
+                x0, y0, x1, y1 = windows
+                covered = (movers > troop) & (x < x1) & (x + size > x0) & (y < y1) & (y + size > y0)
+                if covered.any():
+                    end = min(end, int(movers[covered.argmax()]))
+
+        # Move before writing any hits back, so flow fields still see the
+        # buildings as every troop in this run did
+        if movers.size:
+            keep = movers < end
+            if windows is not None:
+                keep &= dist > 0
+            movers, delta, dist = movers[keep], delta[keep], dist[keep]
+            troops.pos[movers] += delta / dist[:, None] * troops.speed[movers][:, None] * dt
+
+        buildings.write_back(hits.land(end, buildings.hp))
+        return end
+
+    def retarget(self, base, needs):
+        """Point each troop in needs at the nearest live building, or -1"""
+        slots = self.buildings.slots
+        targets = []
+        for building in map(base.index.nearest, self.troops.pos[needs].tolist()):
+            targets.append(-1 if building is None else slots[id(building)])
+        self.troops.target[needs] = targets
+
+    def path_deltas(self, base, movers, delta, dist):
+        """Swap the straight-line heading of each mover for its flow field waypoint.
+
+        Also returns the (x0, y0, x1, y1) window of every mover's field.
+        """
+        targets = self.troops.target[movers]
+        distinct, inverse = np.unique(targets, return_inverse=True)
+        atlas = self.atlas
+        fields = self.buildings.buildings
+        slots = np.array([atlas.slot(base.paths.field(fields[t])) for t in distinct.tolist()], dtype=np.intp)
+        points, valid, windows = atlas.waypoints(slots[inverse], self.troops.pos[movers])
+        delta[valid] = points[valid] - self.troops.pos[movers[valid]]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        return delta, dist, windows
+
+    def defend(self, dt, base):
+        """Let base's defenses shoot at these troops.
+
+        Defenses fire one after another so a troop killed by one cannon is not
+        targeted by the next, exactly as in GameState.update_defenses; each
+        shot's range test covers all troops in one array operation.
+        """
+        troops = self.troops
+        for defense in base.defenses:
+            if defense.hp <= 0:
+                continue
+            defense.cooldown -= dt
+            if defense.cooldown > 0:
+                continue
+
+            cx, cy = defense.center()
+            radius = defense.stats["range"]
+            dx = troops.pos[:, 0] - cx
+            dy = troops.pos[:, 1] - cy
+            d2 = dx * dx + dy * dy
+            valid = (d2 <= radius * radius) & (troops.hp > 0)
+            if not valid.any():
+                defense.cooldown = 0.0
+                continue
+
+            i = np.argmin(np.where(valid, d2, np.inf))
+            troops.hp[i] -= defense.stats["damage"]
+            defense.cooldown += defense.stats["attack_speed"]
+
+
+class VectorEngine:
+    """Steps both sides of a GameState with batched array operations.
+
+    Troop objects are kept in sync after every tick so the UI and network code
+    keep working, but the arrays are the source of truth while this engine is
+    selected.
+    """
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self.player = BattleSide()
+        self.opponent = BattleSide()
+        self.write_back = True
+
+    def add_troop(self, troop, is_player):
+        side = self.player if is_player else self.opponent
+        side.troops.append(troop)
+
+    def remove_troop(self, troop, is_player):
+        side = self.player if is_player else self.opponent
+        side.troops.remove(troop)
+
+    def step(self, dt):
+        gs = self.game_state
+        self.player.step(dt, gs.opponent_base)
+        self.opponent.step(dt, gs.player_base)
+
+        gs.player_troops = self.player.troops.troops + self.player.troops.pending
+        gs.opponent_troops = self.opponent.troops.troops + self.opponent.troops.pending
+        if self.write_back:
+            self.player.troops.write_back()
+            self.opponent.troops.write_back()